@@ -0,0 +1,93 @@
+"""
+Compares the time and the peak memory taken to paste the overlays on the
+picture as ZanzoCam did before zanzocam.webcam.compositing (photo and
+canvas in RGBA, converted back to RGB for the encoder) and with
+compose_picture, for some frame sizes, with the overlays over the
+picture and with a border below it.
+
+Usage:
+    python benchmarks/compositing.py
+
+(from the repository root, with zanzocam installed or in PYTHONPATH)
+
+Each measurement runs in its own process, so that the peak memory
+reported (Linux only) is the one of the decoding and compositing,
+above the memory taken by the JPEG picture.
+"""
+import logging
+import multiprocessing
+from io import BytesIO
+from time import perf_counter
+
+from PIL import Image
+
+import zanzocam.webcam.main  # Off the RPi, the camera module can't be imported first
+from zanzocam.webcam.compositing import compose_picture
+
+# The other benchmarks are in the same folder
+from raw_capture import synthetic_frame, reset_peak_rss, peak_rss
+
+
+SIZES = [(640, 480), (1920, 1080), (3280, 2464)]
+
+REPEATS = 3
+
+
+def overlays(width, height, border):
+    """ A caption at the top and a logo at the bottom (over a border, if given) """
+    caption = Image.new("RGBA", (width, height // 20), color=(255, 255, 255, 128))
+    logo = Image.new("RGBA", (height // 8, height // 8), color=(255, 0, 0, 255))
+    return [(caption, (0, 0)), (logo, (width - logo.width, height + border - logo.height))]
+
+
+def compose_before(picture, border):
+    photo = Image.open(picture).convert("RGBA")
+    image = Image.new("RGBA", (photo.width, photo.height + border), color=(0, 0, 0, 0))
+    image.paste(photo, (0, 0))
+    for overlay, position in overlays(photo.width, photo.height, border):
+        image.paste(overlay, position, mask=overlay)
+    return image.convert("RGB")
+
+
+def compose_after(picture, border):
+    photo = Image.open(picture)
+    photo.load()
+    # The encoders don't convert pictures that are RGB already
+    return compose_picture(photo, overlays(photo.width, photo.height, border), 0, border)
+
+
+def run(path, jpeg, border, results):
+    logging.disable(logging.CRITICAL)
+    compose = compose_before if path == "before" else compose_after
+    reset_peak_rss()
+    baseline = peak_rss()
+    times = []
+    for _ in range(REPEATS):
+        start = perf_counter()
+        compose(BytesIO(jpeg), border)
+        times.append(perf_counter() - start)
+    results.put((min(times), peak_rss() - baseline))
+
+
+def main():
+    print(f"Decode and compose, best of {REPEATS}")
+    print(f"{'frame':<10} | {'border':>6} | {'path':<6} | {'ms':>6} | {'peak MB':>7}")
+
+    # Spawned, not forked, so that they don't inherit the memory of this process
+    context = multiprocessing.get_context("spawn")
+    for width, height in SIZES:
+        jpeg = BytesIO()
+        Image.fromarray(synthetic_frame(width, height)).save(jpeg, format="JPEG", quality=90)
+        for border in (0, height // 10):
+            for path in ("before", "after"):
+                results = context.Queue()
+                process = context.Process(target=run, args=(path, jpeg.getvalue(), border, results))
+                process.start()
+                seconds, memory = results.get()
+                process.join()
+                print(f"{f'{width}x{height}':<10} | {border:>6} | {path:<6} | "
+                      f"{seconds*1000:>6.0f} | {memory:>7.1f}")
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,99 @@
+"""
+Compares the encoders of zanzocam.webcam.encoders (baseline, optimized and
+progressive JPEG, WebP and AVIF when this Pillow build supports them) on
+a corpus of frames, in output size, encode time and peak memory.
+
+Usage:
+    python benchmarks/encoders.py [picture ...]
+
+(from the repository root, with zanzocam installed or in PYTHONPATH)
+
+Without pictures, a synthetic 8MP frame is used: pass some real frames of
+the webcam for meaningful sizes. Each setting runs in its own process, so
+that the peak memory reported (Linux only) is the one of the encoder,
+above the memory taken by the decoded frames.
+"""
+import sys
+import logging
+import multiprocessing
+from io import BytesIO
+from time import perf_counter
+
+from PIL import Image
+
+import zanzocam.webcam.main  # Off the RPi, the camera module can't be imported first
+from zanzocam.webcam import encoders
+
+# The other benchmarks are in the same folder
+from raw_capture import synthetic_frame, reset_peak_rss, peak_rss
+
+
+#: Name, extension and encoder options of each setting
+SETTINGS = [
+    ("JPEG q90", "jpg", {"quality": 90}),
+    ("JPEG q80", "jpg", {"quality": 80}),
+    ("JPEG q80 4:2:0", "jpg", {"quality": 80, "subsampling": 2}),
+    ("JPEG q80 optimized", "jpg", {"quality": 80, "optimize": True}),
+    ("JPEG q80 progressive", "jpg", {"quality": 80, "progressive": True}),
+    ("WebP q80 method 0", "webp", {"quality": 80, "webp_method": 0}),
+    ("WebP q80 method 4", "webp", {"quality": 80, "webp_method": 4}),
+    ("WebP q80 method 6", "webp", {"quality": 80, "webp_method": 6}),
+    ("AVIF q60 speed 10", "avif", {"quality": 60, "avif_speed": 10}),
+    ("AVIF q60 speed 6", "avif", {"quality": 60, "avif_speed": 6}),
+]
+
+REPEATS = 3
+
+
+def load_corpus(paths):
+    if not paths:
+        return [Image.fromarray(synthetic_frame(3280, 2464))]
+    frames = []
+    for path in paths:
+        with Image.open(path) as frame:
+            frames.append(frame.convert("RGB"))
+    return frames
+
+
+def run_setting(paths, extension: str, options: dict, results):
+    logging.disable(logging.CRITICAL)
+    frames = load_corpus(paths)
+    reset_peak_rss()
+    baseline = peak_rss()
+
+    sizes, times = [], []
+    for frame in frames:
+        frame_times = []
+        for _ in range(REPEATS):
+            output = BytesIO()
+            start = perf_counter()
+            encoders.encode(frame, output, extension, options)
+            frame_times.append(perf_counter() - start)
+        sizes.append(len(output.getvalue()))
+        times.append(min(frame_times))
+
+    results.put((sum(sizes) / len(sizes), sum(times) / len(times), peak_rss() - baseline))
+
+
+def main():
+    paths = sys.argv[1:]
+    print(f"Corpus: {len(paths) if paths else 'a synthetic'} frame(s), best of {REPEATS}. "
+          f"Supported: {', '.join(encoders.supported_extensions())}")
+    print(f"{'setting':<22} | {'KB':>7} | {'encode ms':>9} | {'peak MB':>7}")
+
+    # Spawned, not forked, so that they don't inherit the memory of this process
+    context = multiprocessing.get_context("spawn")
+    for name, extension, options in SETTINGS:
+        if not encoders.is_supported(extension):
+            print(f"{name:<22} | not supported by this Pillow build")
+            continue
+        results = context.Queue()
+        process = context.Process(target=run_setting, args=(paths, extension, options, results))
+        process.start()
+        size, seconds, memory = results.get()
+        process.join()
+        print(f"{name:<22} | {size/1024:>7.0f} | {seconds*1000:>9.0f} | {memory:>7.1f}")
+
+
+if "__main__" == __name__:
+    main()
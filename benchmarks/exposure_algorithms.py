@@ -0,0 +1,92 @@
+"""
+Benchmarks the exposure algorithms of Camera._shoot_picture on a simulated
+camera (tests/simulation.py), so no Raspberry Pi is needed and
+every run is reproducible.
+
+Usage:
+    python benchmarks/exposure_algorithms.py [runs per scenario]
+
+(from the repository root, with the repository in PYTHONPATH: the simulated
+camera is in tests/)
+
+For each scenario and configuration it reports the average number of
+captures, the simulated seconds the camera was busy, the final luminance
+and how many runs ended within TARGET_LUMINOSITY_MARGIN of the target.
+"""
+import sys
+import logging
+from unittest import mock
+
+from zanzocam.constants import *
+import zanzocam.webcam.main  # Off the RPi, the camera module can't be imported first
+from zanzocam.webcam.camera import Camera
+from tests.simulation import AmbientLight, SimulatedScene, simulated_camera
+
+
+#: Name and SimulatedScene arguments of each scenario
+SCENARIOS = {
+    "day": {"ambient": 50},
+    "overcast dusk": {"ambient": 0.5},
+    "late dusk": {"ambient": 0.02},
+    "night": {"ambient": 0.001},
+    "dark night": {"ambient": 0.0001},
+    "night, 30% black frames": {"ambient": 0.001, "black_frame_rate": 0.3},
+    "night, noisy sensor": {"ambient": 0.001, "read_noise": 20},
+    "sunset during the run": {"ambient": AmbientLight([(0, 0.05), (30, 0.0005)])},
+}
+
+#: Name and 'image' settings of each configuration
+CONFIGURATIONS = {
+    "search": {"low_light_strategy": "search"},
+    "histogram": {"low_light_strategy": "histogram"},
+    "search + AWB": {"low_light_strategy": "search", "let_awb_settle_in_dark": True},
+    "hist. + stack 8": {"low_light_strategy": "histogram", "night_stacking_frames": 8},
+}
+
+RUNS = 5
+
+#: The metering Camera uses, before it's wrapped to record the luminances
+luminance_from_picture = Camera._luminance_from_picture
+
+
+def simulate(scenario: dict, settings: dict, seed: int):
+    scene = SimulatedScene(seed=seed, **scenario)
+    camera = Camera({'image': dict(settings, width=320, height=240,
+                                   use_camera_daemon=False, use_exposure_memory=False)})
+
+    luminances = []
+    def measure(picture):
+        luminances.append(luminance_from_picture(picture))
+        return luminances[-1]
+
+    with simulated_camera(scene):
+        with mock.patch.object(Camera, "_luminance_from_picture", staticmethod(measure)):
+            camera._shoot_picture()
+
+    final_luminance = luminance_from_picture(camera.temp_photo)
+    target = camera._compute_target_luminance(luminances[0]) if luminances else final_luminance
+    converged = abs(final_luminance - target) <= TARGET_LUMINOSITY_MARGIN
+    return len(scene.captures), scene.clock.now, final_luminance, converged
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+
+    print(f"{runs} runs per scenario. Each cell: captures, simulated seconds, "
+          f"final luminance, runs on target.")
+    print(f"{'scenario':<24} | " + " | ".join(f"{name:^22}" for name in CONFIGURATIONS))
+    for scenario_name, scenario in SCENARIOS.items():
+        cells = []
+        for settings in CONFIGURATIONS.values():
+            results = [simulate(scenario, settings, seed) for seed in range(runs)]
+            captures = sum(r[0] for r in results) / runs
+            seconds = sum(r[1] for r in results) / runs
+            luminance = sum(r[2] for r in results) / runs
+            converged = sum(r[3] for r in results)
+            cells.append(f"{captures:>4.1f} {seconds:>6.1f}s {luminance:>5.1f} {converged:>2}/{runs}")
+        print(f"{scenario_name:<24} | " + " | ".join(cells))
+
+
+if "__main__" == __name__:
+    main()
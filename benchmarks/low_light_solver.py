@@ -0,0 +1,137 @@
+"""
+Simulates the low light search on a range of scenes and compares the
+gamma-aware solver (Camera._low_light_solver) with the original
+linear equation, in number of pictures and seconds of exposure.
+
+Usage:
+    python benchmarks/low_light_solver.py
+
+(from the repository root, with zanzocam installed or in PYTHONPATH)
+
+The simulated sensor clips at full well, adds some noise and encodes the
+pixels with one of several tone curves: a plain 1/2.2 gamma, the Rec.709
+curve (the one the solver assumes) and a linear one (the one the original
+equation assumes), to see how both algorithms cope with a camera that
+doesn't match their model.
+"""
+import random
+import logging
+from unittest import mock
+
+from zanzocam.constants import *
+import zanzocam.webcam.main  # Off the RPi, the camera module can't be imported first
+from zanzocam.webcam.camera import Camera
+
+
+#: Ambient light of the simulated scenes: the fraction of full well
+#:  reached by one second of exposure at ISO 100
+SCENES = [0.5, 0.1, 0.03, 0.01, 0.003, 0.001, 0.0003, 0.0001, 0.00003]
+
+#: How many times each scene is simulated (with different noise)
+RUNS = 20
+
+
+def rec709(linear: float) -> float:
+    if linear < 0.018:
+        return 4.5 * linear
+    return 1.099 * linear ** 0.45 - 0.099
+
+
+CURVES = {
+    "gamma 2.2": lambda linear: linear ** (1 / 2.2),
+    "Rec.709": rec709,
+    "linear": lambda linear: linear,
+}
+
+
+class SimulatedScene:
+
+    def __init__(self, ambient: float, seed: int, curve):
+        self.ambient = ambient
+        self.curve = curve
+        self.random = random.Random(seed)
+        self.captures = []
+
+    def luminance(self, shutter_speed: int, iso: int) -> float:
+        signal = self.ambient * (shutter_speed / 10**6) * (iso / 100)
+        luminance = 255 * self.curve(min(signal, 1.0)) + self.random.gauss(0, 0.3)
+        return max(luminance, 0.01)
+
+    def capture(self, camera_object, camera):
+        self.captures.append((camera.shutter_speed or MIN_SHUTTER_SPEED, camera.iso or 100))
+        camera_object.temp_photo = self.captures[-1]
+
+    def metering(self, picture):
+        return self.luminance(*picture)
+
+
+def legacy_solver(samples, iso, target_luminance):
+    """
+    The original _low_light_equation: luminance proportional to shutter speed.
+    """
+    shutter_speed, _, luminance = samples[-1]
+    target_shutter_speed = (shutter_speed / max(luminance, 0.001)) * target_luminance
+    return int(min(target_shutter_speed, MAX_SHUTTER_SPEED))
+
+
+def simulate(ambient: float, seed: int, curve, solver=None):
+    scene = SimulatedScene(ambient, seed, curve)
+    # The automatic exposure: max shutter speed PiCamera would use on its own
+    automatic_exposure = (MIN_SHUTTER_SPEED, INITIAL_LOW_LIGHT_ISO)
+    initial_luminance = scene.luminance(*automatic_exposure)
+
+    camera = Camera({'image': {'use_exposure_memory': False, 'use_camera_daemon': False}})
+    patches = [
+        mock.patch.object(Camera, "_camera_warm_up", lambda *a, **k: None),
+        mock.patch.object(Camera, "_camera_capture", lambda self, c: scene.capture(self, c)),
+        mock.patch.object(Camera, "_luminance_from_picture", staticmethod(scene.metering)),
+    ]
+    if solver:
+        patches.append(mock.patch.object(Camera, "_low_light_solver", staticmethod(solver)))
+    for patch in patches:
+        patch.start()
+    try:
+        # The original algorithm did not use the automatic exposure
+        luminance, _, _, _ = camera._low_light_search(
+            initial_luminance, None if solver else automatic_exposure)
+    finally:
+        for patch in patches:
+            patch.stop()
+
+    target = camera._compute_target_luminance(initial_luminance)
+    converged = abs(luminance - target) <= TARGET_LUMINOSITY_MARGIN
+    exposure_seconds = sum(shutter_speed for shutter_speed, _ in scene.captures) / 10**6
+    return len(scene.captures), exposure_seconds, converged
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+
+    for curve_name, curve in CURVES.items():
+        print(f"Sensor tone curve: {curve_name}")
+        print(f"{'ambient':>9} | {'legacy pics':>11} {'secs':>7} {'ok':>5} | "
+              f"{'solver pics':>11} {'secs':>7} {'ok':>5}")
+        totals = {"legacy": [0, 0, 0], "solver": [0, 0, 0]}
+
+        for ambient in SCENES:
+            row = {}
+            for name, solver in [("legacy", legacy_solver), ("solver", None)]:
+                results = [simulate(ambient, seed, curve, solver) for seed in range(RUNS)]
+                pictures = sum(r[0] for r in results) / RUNS
+                seconds = sum(r[1] for r in results) / RUNS
+                converged = sum(r[2] for r in results)
+                row[name] = (pictures, seconds, converged)
+                totals[name] = [t + v for t, v in zip(totals[name], row[name])]
+
+            print(f"{ambient:>9} | {row['legacy'][0]:>11.2f} {row['legacy'][1]:>7.2f} "
+                  f"{row['legacy'][2]:>2}/{RUNS} | {row['solver'][0]:>11.2f} "
+                  f"{row['solver'][1]:>7.2f} {row['solver'][2]:>2}/{RUNS}")
+
+        print(f"{'total':>9} | {totals['legacy'][0]:>11.2f} {totals['legacy'][1]:>7.2f} "
+              f"{totals['legacy'][2]:>5} | {totals['solver'][0]:>11.2f} "
+              f"{totals['solver'][1]:>7.2f} {totals['solver'][2]:>5}")
+        print()
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,88 @@
+"""
+Compares the luminance metering of zanzocam.webcam.metering with the
+original full-decode implementation (PIL ImageStat on the full RGB frame),
+in accuracy and speed.
+
+Usage:
+    python benchmarks/metering.py [folder with JPEG frames]
+
+(from the repository root, with zanzocam installed or in PYTHONPATH)
+
+Without a folder, it uses tests/exif-source.jpg and a few synthetic
+8MP frames (day, dusk, night, black).
+"""
+import sys
+import math
+from io import BytesIO
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+from PIL import Image, ImageStat
+
+from zanzocam.webcam.metering import luminance_from_picture
+
+
+REPEATS = 3
+SCALES = [1, 2, 4, 8]
+
+
+def reference_luminance(picture: BytesIO) -> float:
+    """
+    The luminance as computed by Camera._luminance_from_path before the
+    metering module was introduced.
+    """
+    photo = Image.open(picture)
+    r, g, b = ImageStat.Stat(photo).mean
+    return math.sqrt(0.241*(r**2) + 0.691*(g**2) + 0.068*(b**2))
+
+
+def synthetic_frame(level: float, seed: int) -> bytes:
+    """
+    An 8MP JPEG with a gradient around the given level and some noise.
+    """
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0.5, 1.5, 3280, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 4, (2464, 3280, 3)).astype(np.float32)
+    frame = np.clip(level * gradient + noise, 0, 255).astype(np.uint8)
+    picture = BytesIO()
+    Image.fromarray(frame).save(picture, format="JPEG", quality=90)
+    return picture.getvalue()
+
+
+def sample_frames(folder: Path = None):
+    if folder:
+        for path in sorted(folder.glob("*.jp*g")):
+            yield path.name, path.read_bytes()
+        return
+    yield "exif-source.jpg", (Path(__file__).parent.parent / "tests" / "exif-source.jpg").read_bytes()
+    for name, level in [("day", 140), ("dusk", 45), ("night", 8), ("black", 0.5)]:
+        yield f"synthetic-{name}", synthetic_frame(level, seed=len(name))
+
+
+def timed(function, data: bytes):
+    best = None
+    for _ in range(REPEATS):
+        start = perf_counter()
+        value = function(BytesIO(data))
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return value, best * 1000
+
+
+def main():
+    folder = Path(sys.argv[1]) if len(sys.argv) > 1 else None
+
+    print(f"{'frame':<20} {'method':<14} {'luminance':>10} {'error':>8} {'ms':>9} {'speedup':>8}")
+    for name, data in sample_frames(folder):
+        reference, reference_ms = timed(reference_luminance, data)
+        print(f"{name:<20} {'full decode':<14} {reference:>10.3f} {0:>8.3f} {reference_ms:>9.1f} {1:>7.1f}x")
+
+        for scale in SCALES:
+            value, ms = timed(lambda picture: luminance_from_picture(picture, scale=scale), data)
+            print(f"{'':<20} {f'draft 1/{scale}':<14} {value:>10.3f} "
+                  f"{abs(value - reference):>8.3f} {ms:>9.1f} {reference_ms / ms:>7.1f}x")
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,105 @@
+"""
+Compares a single long night exposure with stacks of shorter frames
+(zanzocam.webcam.stacking), in time, peak memory and noise.
+
+Usage:
+    python benchmarks/night_stacking.py [width height]
+
+(from the repository root, with zanzocam installed or in PYTHONPATH)
+
+The frames are simulated (8MP by default): a dim gradient with photon shot
+noise and read noise, amplified by the ISO, clipped, encoded with the
+Rec.709 tone curve and saved as JPEG. The scene is dark enough to need
+8 times the exposure a single picture can get, and the exposures are the
+ones Camera would use: the total exposure is split by
+Camera._split_exposure among the frames, which keeps the ISO as low as
+possible, and what the frames can't get is made up with the gain. The
+single picture is a stack of one frame: the longest exposure the camera
+allows at ISO 800, brightened 8 times.
+
+The camera time is the capture time plus the wait for the AWB to settle,
+with the upper bound Camera uses (7 frames + 5 seconds); the processing
+time and the peak memory are measured on this machine.
+"""
+import sys
+import logging
+import tracemalloc
+from io import BytesIO
+from time import perf_counter
+
+import numpy as np
+from PIL import Image
+
+from zanzocam.constants import *
+import zanzocam.webcam.main  # Off the RPi, the camera module can't be imported first
+from zanzocam.webcam.camera import Camera
+from zanzocam.webcam.metering import gamma_encode
+from zanzocam.webcam.stacking import FrameStack, estimate_noise
+
+
+#: Electrons that saturate the sensor at ISO 100
+FULL_WELL = 10000
+
+#: Read noise of each frame, in electrons
+READ_NOISE = 3
+
+#: Electrons per second collected by the brightest part of the scene
+AMBIENT = 2.5
+
+#: The exposure (shutter speed * ISO) the scene needs
+EXPOSURE = 8 * MAX_SHUTTER_SPEED * 800
+
+FRAMES = [1, 4, 8, 16]
+
+
+def simulated_frame(size, shutter_speed: int, iso: int, seed: int) -> BytesIO:
+    rng = np.random.default_rng(seed)
+    width, height = size
+    scene = np.linspace(0.2, 1, width, dtype=np.float32)[None, :, None] * np.ones((height, 1, 3), np.float32)
+    electrons = rng.poisson(scene * AMBIENT * shutter_speed / 10**6).astype(np.float32)
+    electrons += rng.normal(0, READ_NOISE, electrons.shape).astype(np.float32)
+    light = electrons * (iso / 100) / FULL_WELL
+    frame = np.round(gamma_encode(light)).astype(np.uint8)
+    picture = BytesIO()
+    Image.fromarray(frame).save(picture, format="JPEG", quality=95)
+    picture.seek(0)
+    return picture
+
+
+def camera_time(frames: int, shutter_speed: int) -> float:
+    seconds = shutter_speed / 10**6
+    return frames * seconds + 7 * seconds + 5
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    size = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) > 2 else (3280, 2464)
+
+    print(f"Frame size: {size[0]}x{size[1]}")
+    print(f"{'frames':>6} | {'shutter':>7} {'ISO':>4} {'gain':>4} | {'camera s':>8} | "
+          f"{'process s':>9} | {'peak MB':>7} | {'noise':>6}")
+
+    for frames in FRAMES:
+        frame_shutter_speed, frame_iso = Camera._split_exposure(EXPOSURE / frames)
+        gain = EXPOSURE / (frames * frame_shutter_speed * frame_iso)
+        pictures = [simulated_frame(size, frame_shutter_speed, frame_iso, seed=seed + 1)
+                    for seed in range(frames)]
+
+        tracemalloc.start()
+        start = perf_counter()
+        stack = FrameStack()
+        for picture in pictures:
+            stack.add(picture)
+        image = stack.image(gain)
+        image.save(BytesIO(), format="JPEG", quality=95)
+        elapsed = perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"{frames:>6} | {frame_shutter_speed/10**6:>7.2f} {frame_iso:>4} {gain:>4.1f} | "
+              f"{camera_time(frames, frame_shutter_speed):>8.1f} | {elapsed:>9.2f} | "
+              f"{peak/2**20:>7.1f} | {estimate_noise(image):>6.2f}")
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,115 @@
+"""
+Measures how long it takes to render typical multi-line text overlays,
+with the font loaded and every line measured from scratch at each overlay
+(as ZanzoCam did before zanzocam.webcam.fonts) and with the cached fonts
+and glyph metrics, first cold (a new run) and then warm.
+
+Usage:
+    python benchmarks/overlay_text.py [photo_width]
+
+(from the repository root, with zanzocam installed or in PYTHONPATH)
+
+The labels rendered in the two ways are compared pixel by pixel.
+"""
+import sys
+import math
+import logging
+from time import perf_counter
+
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+import zanzocam.webcam.main  # Off the RPi, the camera module can't be imported first
+from zanzocam.constants import FONT_PATH
+from zanzocam.webcam import fonts
+from zanzocam.webcam.overlays import Overlay
+
+
+#: Overlays like the ones of a typical webcam, by position
+OVERLAYS = {
+    "top_left": {"type": "text", "font_size": 40, "text": "ZanzoCam - Rifugio Lago di Garda (1850 m)"},
+    "top_right": {"type": "text", "font_size": 40, "text": "%%DATE %%TIME"},
+    "bottom_left": {"type": "text", "font_size": 25, "text":
+        "Temperatura: 12.5°C - Umidità: 80% - Vento: 15 km/h da nord-ovest\n"
+        "Webcam gestita dalla sezione locale, le immagini sono aggiornate "
+        "ogni dieci minuti durante il giorno e ogni ora durante la notte."},
+    "bottom_right": {"type": "text", "font_size": 25, "text": "zanzocam.github.io"},
+}
+
+REPEATS = 20
+
+
+def wrap_before(font, text, max_width):
+    """ The text wrapping of the overlays before zanzocam.webcam.fonts """
+    lines = []
+    for line in text.split("\n"):
+        if font.getsize(line)[0] <= max_width:
+            lines.append(line)
+        else:
+            new_line = ""
+            for word in line.split(" "):
+                if font.getsize(new_line + word)[0] <= max_width:
+                    new_line = new_line + word + " "
+                else:
+                    lines.append(new_line)
+                    new_line = word + " "
+            if new_line != "":
+                lines.append(new_line)
+    return lines, [font.getsize(line)[0] for line in lines]
+
+
+def render_before(data, photo_width):
+    """ The text overlays as they were rendered before the font cache """
+    text = data["text"].replace("%%TIME", "12:30").replace("%%DATE", "18 October 2026")
+    font = ImageFont.truetype(FONT_PATH, data["font_size"])
+    lines, widths = wrap_before(font, text, photo_width)
+    text = '\n'.join(lines)
+    text_width = max(widths)
+    ascent, descent = font.getmetrics()
+    text_height = math.ceil(len(lines) * ascent * 1.03) + descent
+    label = Image.new("RGBA", (text_width + 20, text_height + 20), color=(255, 255, 255, 0))
+    ImageDraw.Draw(label).text((10, 10, 10), text, (0, 0, 0), font=font)
+    return label
+
+
+def render_after(data, photo_width):
+    # Formats without directives are rendered as they are
+    return Overlay("top_left", data, photo_width, 1000, "18 October 2026", "12:30").rendered_image
+
+
+def time_rendering(render, photo_width):
+    """ Best time to render all the overlays, in ms """
+    best = None
+    for _ in range(REPEATS):
+        start = perf_counter()
+        for data in OVERLAYS.values():
+            render(data, photo_width)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    photo_width = int(sys.argv[1]) if len(sys.argv) > 1 else 1920
+
+    for data in OVERLAYS.values():
+        if ImageChops.difference(render_before(data, photo_width),
+                                 render_after(data, photo_width)).getbbox():
+            print(f"The label '{data['text'][:30]}...' is different!")
+
+    print(f"{len(OVERLAYS)} text overlays on a {photo_width}px wide picture, best of {REPEATS}")
+    before = time_rendering(render_before, photo_width)
+    print(f"{'before':<24} | {before:>6.2f} ms")
+
+    fonts._fonts.clear()
+    start = perf_counter()
+    for data in OVERLAYS.values():
+        render_after(data, photo_width)
+    print(f"{'cached fonts, cold':<24} | {(perf_counter() - start) * 1000:>6.2f} ms")
+
+    after = time_rendering(render_after, photo_width)
+    print(f"{'cached fonts, warm':<24} | {after:>6.2f} ms ({before / after:.1f}x)")
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,80 @@
+"""
+Measures how long it takes to render six overlays (text and images,
+one per position) with one thread and with a thread pool, as set by
+the `overlay_threads` camera setting, up to the number of CPU cores.
+
+Usage:
+    python benchmarks/overlay_threads.py [photo_width]
+
+(from the repository root, with zanzocam installed or in PYTHONPATH)
+
+The overlays are rendered from scratch (without the overlay cache).
+The speedup depends on how much of the work Pillow does without
+holding the GIL, and on the number of cores: a Pi Zero has only one.
+Run it on the Pi before raising `overlay_threads` from its default of 1.
+"""
+import os
+import sys
+import logging
+import tempfile
+from time import perf_counter
+
+import numpy as np
+from PIL import Image
+
+import zanzocam.webcam.main  # Off the RPi, the camera module can't be imported first
+from zanzocam.webcam import overlays
+from zanzocam.webcam.camera import Camera
+
+
+#: One overlay per position, two of them large pictures
+OVERLAYS = {
+    "top_left": {"type": "text", "font_size": 40, "text": "ZanzoCam - Rifugio Lago di Garda (1850 m)"},
+    "top_center": {"type": "image", "path": "logo.png", "width": 400},
+    "top_right": {"type": "text", "font_size": 40, "text": "%%DATE %%TIME"},
+    "bottom_left": {"type": "text", "font_size": 25, "text":
+        "Temperatura: 12.5°C - Umidità: 80% - Vento: 15 km/h da nord-ovest\n"
+        "Webcam gestita dalla sezione locale, le immagini sono aggiornate "
+        "ogni dieci minuti durante il giorno e ogni ora durante la notte."},
+    "bottom_center": {"type": "image", "path": "banner.png", "height": 200},
+    "bottom_right": {"type": "text", "font_size": 25, "text": "zanzocam.github.io"},
+}
+
+REPEATS = 5
+
+
+def best_time(camera, photo_width):
+    best = None
+    for _ in range(REPEATS):
+        start = perf_counter()
+        rendered = camera._render_overlays(photo_width, photo_width * 3 // 4)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    assert len(rendered) == len(OVERLAYS)
+    return best * 1000
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    photo_width = int(sys.argv[1]) if len(sys.argv) > 1 else 3280
+
+    # Large noisy pictures, as photos used as logos often are
+    overlays.IMAGE_OVERLAYS_PATH = overlays.Path(tempfile.mkdtemp())
+    for name, size in (("logo.png", (1600, 1200)), ("banner.png", (3000, 800))):
+        noise = np.random.default_rng(0).integers(0, 255, (size[1], size[0], 4), dtype=np.uint8)
+        Image.fromarray(noise, "RGBA").save(overlays.IMAGE_OVERLAYS_PATH / name)
+
+    cores = os.cpu_count() or 1
+    print(f"{len(OVERLAYS)} overlays on a {photo_width}px wide picture, {cores} CPU cores, best of {REPEATS}")
+    print(f"{'threads':>7} | {'ms':>6} | speedup")
+
+    single = None
+    for threads in sorted({1, 2, 4, cores} & set(range(1, max(cores, 2) + 1))):
+        camera = Camera({'image': {'overlay_threads': threads}, 'overlays': OVERLAYS})
+        milliseconds = best_time(camera, photo_width)
+        single = single or milliseconds
+        print(f"{threads:>7} | {milliseconds:>6.0f} | {single / milliseconds:>6.1f}x")
+
+
+if "__main__" == __name__:
+    main()
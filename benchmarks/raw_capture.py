@@ -0,0 +1,134 @@
+"""
+Compares the processing of a JPEG capture (decoded, composed and encoded
+again) with the processing of an unencoded RGB capture (`raw_capture`,
+composed and encoded once), in CPU time, peak memory and output size.
+For reference, it also runs the fast path taken by JPEG captures when
+there are no overlays (only the EXIF data is rewritten).
+
+Usage:
+    python benchmarks/raw_capture.py [width height]
+
+(from the repository root, with zanzocam installed or in PYTHONPATH)
+
+The frame is synthetic (8MP by default): a gradient with some noise and
+some detail. The JPEG the camera would produce is encoded beforehand, as
+on the Pi the GPU does that. Each path runs in its own process, so that
+the peak RSS belongs to that path only (the RSS of the interpreter with
+zanzocam imported and the input loaded is reported as the baseline).
+Measuring the peak RSS needs Linux. The generation loss of
+each path is measured as the PSNR of the final image against the frame.
+"""
+import sys
+import math
+import shutil
+import logging
+import tempfile
+import resource
+import multiprocessing
+from io import BytesIO
+from time import process_time
+
+import numpy as np
+from PIL import Image
+
+import zanzocam.webcam.main  # Off the RPi, the camera module can't be imported first
+from zanzocam.webcam import overlay_cache
+from zanzocam.webcam.camera import Camera
+
+
+#: The overlays of a typical configuration
+OVERLAYS = {
+    'top_left': {'type': 'text', 'text': 'ZanzoCam - %%DATE %%TIME', 'font_size': 60},
+    'bottom_right': {'type': 'text', 'text': 'Benchmark', 'font_size': 40, 'over_the_picture': True},
+}
+
+REPEATS = 3
+
+
+def synthetic_frame(width: int, height: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    scene = 80 + 100 * x * y + 30 * np.sin(40 * x) * np.cos(30 * y)
+    frame = scene[:, :, None] * np.array([1.0, 0.9, 0.8], dtype=np.float32)
+    frame += rng.normal(0, 3, frame.shape).astype(np.float32)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def reset_peak_rss() -> None:
+    """ Resets the peak resident memory of this process to the current one (Linux only) """
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+
+
+def peak_rss() -> float:
+    """ Peak resident memory of this process, in MB """
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_path(path: str, size, source: bytes, cache: str, results):
+    logging.disable(logging.CRITICAL)
+    overlay_cache.OVERLAY_CACHE = overlay_cache.Path(cache)
+    reset_peak_rss()
+    baseline = peak_rss()
+    width, height = size
+
+    cpu = 0
+    for _ in range(REPEATS):
+        camera = Camera({'image': {'width': width, 'height': height, 'raw_capture': path == "raw"},
+                         'overlays': {} if path == "no overlays" else OVERLAYS})
+        start = process_time()
+        if path == "raw":
+            camera.temp_photo = Camera._image_from_rgb_frame(source, width, height)
+        else:
+            camera.temp_photo = BytesIO(source)
+        camera._process_picture()
+        cpu += process_time() - start
+        output = camera.processed_image.getvalue()
+        del camera
+
+    results.put((path, cpu / REPEATS, baseline, peak_rss(), len(output), output))
+
+
+def psnr(reference: np.ndarray, picture: bytes) -> float:
+    final = np.asarray(Image.open(BytesIO(picture)).convert("RGB"), dtype=np.float32)
+    # Compare the picture area only (the overlays add a border at the top)
+    final = final[final.shape[0] - reference.shape[0]:]
+    mse = np.mean((final - reference) ** 2)
+    return 10 * math.log10(255 ** 2 / mse) if mse else float("inf")
+
+
+def main():
+    size = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) > 2 else (3280, 2464)
+    frame = synthetic_frame(*size)
+    jpeg = BytesIO()
+    Image.fromarray(frame).save(jpeg, format="JPEG", quality=85)  # PiCamera's default quality
+    sources = {"jpeg": jpeg.getvalue(), "raw": frame.tobytes(), "no overlays": jpeg.getvalue()}
+
+    print(f"Frame size: {size[0]}x{size[1]}, {REPEATS} repeats, overlays: {len(OVERLAYS)}")
+    print(f"{'path':>11} | {'input MB':>8} | {'CPU s':>6} | {'baseline MB':>11} | "
+          f"{'peak RSS MB':>11} | {'output KB':>9} | {'PSNR dB':>7}")
+
+    # Spawned, not forked, so that they don't inherit the memory of this process
+    context = multiprocessing.get_context("spawn")
+    # The overlays are cached outside of the data of zanzocam
+    cache = tempfile.mkdtemp()
+    try:
+        for path, source in sources.items():
+            results = context.Queue()
+            process = context.Process(target=run_path, args=(path, size, source, cache, results))
+            process.start()
+            path, cpu, baseline, peak, output_size, output = results.get()
+            process.join()
+            print(f"{path:>11} | {len(source)/2**20:>8.1f} | {cpu:>6.2f} | {baseline:>11.1f} | "
+                  f"{peak:>11.1f} | {output_size/1024:>9.0f} | {psnr(frame.astype(np.float32), output):>7.2f}")
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares the time taken to wrap long multi-paragraph overlay texts by
+measuring every candidate line (as ZanzoCam did before FontMetrics.wrap)
+and by adding up the width of each word, and checks that the lines are
+the same.
+
+Usage:
+    python benchmarks/text_wrapping.py [font_size]
+
+(from the repository root, with zanzocam installed or in PYTHONPATH)
+"""
+import sys
+import random
+import logging
+from time import perf_counter
+
+import zanzocam.webcam.main  # Off the RPi, the camera module can't be imported first
+from zanzocam.webcam import fonts
+
+# The other benchmarks are in the same folder
+from overlay_text import wrap_before
+
+
+WORDS = ("webcam rifugio lago temperatura umidità vento nord-ovest aggiornata ogni "
+         "dieci minuti durante giorno notte sezione locale 1850 m 12.5°C 80% km/h").split()
+
+#: Number of paragraphs and words per paragraph of the texts
+TEXTS = [(1, 20), (3, 50), (5, 100), (10, 200)]
+
+#: Widths of the picture
+WIDTHS = [640, 1920]
+
+REPEATS = 5
+
+
+def long_text(paragraphs, words):
+    random.seed(paragraphs)
+    return "\n".join(" ".join(random.choice(WORDS) for _ in range(words))
+                     for _ in range(paragraphs))
+
+
+def best_time(function):
+    best = None
+    for _ in range(REPEATS):
+        start = perf_counter()
+        function()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    metrics = fonts.get_font(size)
+    print(f"Font size {size}, best of {REPEATS}")
+    print(f"{'text':<22} | {'width':>5} | {'before ms':>9} | {'after ms':>8} | speedup")
+
+    for paragraphs, words in TEXTS:
+        text = long_text(paragraphs, words)
+        for width in WIDTHS:
+            if metrics.wrap(text, width) != wrap_before(metrics.font, text, width):
+                print(f"The lines are different with {paragraphs}x{words} words at {width}px!")
+
+            before = best_time(lambda: wrap_before(metrics.font, text, width))
+            # Measure the words from scratch at every repetition, as in a new run
+            after = best_time(lambda: fonts.FontMetrics(metrics.path, size).wrap(text, width))
+            print(f"{f'{paragraphs} x {words} words':<22} | {width:>5} | {before:>9.1f} | "
+                  f"{after:>8.1f} | {before / after:>6.1f}x")
+
+
+if "__main__" == __name__:
+    main()
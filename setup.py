@@ -17,6 +17,7 @@ REQUIREMENTS: dict = {
         "Pillow",
         "requests",
         "piexif",  # Carry over and edit EXIF information
+        "numpy",  # Fast luminance metering
 
         "uwsgi",
         "Flask"
@@ -26,6 +27,7 @@ REQUIREMENTS: dict = {
         'Pillow',
         'requests',
         'piexif',
+        'numpy',
         
         'pytest',
         'pytest-coverage',
@@ -36,6 +38,7 @@ REQUIREMENTS: dict = {
         'Pillow',
         'requests',
         'piexif',
+        'numpy',
         
         'pytest',
         'pytest-coverage',
@@ -75,6 +78,8 @@ setup(
     entry_points={
         'console_scripts': [
             'z-webcam=zanzocam.webcam.main:main',
+            'z-camera-daemon=zanzocam.webcam.daemon:main',
+            'z-timelapse=zanzocam.webcam.timelapse:main',
             'z-ui=zanzocam.web_ui.endpoints:main',
         ],
     },
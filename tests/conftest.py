@@ -6,6 +6,7 @@ import time
 import pytest
 import logging
 
+from io import BytesIO
 from PIL import Image
 from textwrap import dedent
 from fractions import Fraction
@@ -15,7 +16,7 @@ from pathlib import Path, PosixPath
 from inspect import getmembers, isfunction, isclass, ismethod
 
 from zanzocam import constants
-from zanzocam.webcam import main, system, server, camera, overlays, configuration, utils
+from zanzocam.webcam import main, system, server, camera, daemon, metering, exposure_memory, scene_change, byte_budget, timelapse, timings, overlays, overlay_cache, fonts, templates, configuration, utils
 from zanzocam.webcam.utils import log
 
 
@@ -32,7 +33,17 @@ def point_to_tmpdir(monkeypatch, tmpdir):
         server.http_server,
         server.ftp_server,
         camera,
+        daemon,
+        metering,
+        exposure_memory,
+        scene_change,
+        byte_budget,
+        timelapse,
+        timings,
         overlays,
+        overlay_cache,
+        fonts,
+        templates,
         configuration
     ]
     os.mkdir(tmpdir / "data")
@@ -127,6 +138,14 @@ class MockSystem:
         log("[TEST] set locale - mocked")
         return True
 
+    @staticmethod
+    def get_bytes_written() -> int:
+        return 0
+
+    @staticmethod
+    def convert_bytes_into_string(bytes: int) -> str:
+        return f"{bytes} bytes"
+
 
 class MockServer:
     def __init__(self, *a, **k):
@@ -165,6 +184,8 @@ class MockServer:
 
 
 class MockCamera:
+    scene_change_threshold = 0
+
     def __init__(self, config, *a, **k):
         log("[TEST] init Camera - mocked")
         if isinstance(config, configuration.Configuration):
@@ -273,8 +294,11 @@ class MockPostRequest:
 
         if image and tmpdir:
             utils.log(f"[TEST] POSTing an image")
+            photo = image['photo']
+            if isinstance(photo, tuple):  # (filename, file object)
+                photo = photo[1]
             with open(tmpdir / "received_image.jpg", "wb") as received:
-                received.write(image['photo'].read())
+                received.write(photo.read())
 
         if response:
             self.data = response
@@ -348,8 +372,22 @@ class MockPiCamera:
     def __getattr__(self, *a, **k):
         return
 
-    def capture(self, path, *a, **k):
-        Image.new("RGB", (64, 48), color="#FF0000").save(path)
+    def close(self):
+        return
+
+    def capture(self, output, format=None, *a, **k):
+        if format == "rgb":
+            # Unencoded frames are padded to 32x16 blocks, like on the camera
+            width, height = (int(value) for value in (self.resolution or (64, 48)))
+            padded = ((width + 31) // 32 * 32, (height + 15) // 16 * 16)
+            output.write(Image.new("RGB", padded, color="#FF0000").tobytes())
+            return
+        Image.new("RGB", (64, 48), color="#FF0000").save(output, format=format)
+
+    def capture_continuous(self, output, format=None, *a, **k):
+        while True:
+            self.capture(output, format=format)
+            yield output
 
 
 @pytest.fixture(autouse=True)
@@ -435,6 +473,20 @@ def meminfo():
     """)
 
 
+@pytest.fixture
+def picture_in_memory():
+    """
+        Saves an image in a BytesIO, rewound, like the pictures
+        the camera keeps in memory (JPEG by default)
+    """
+    def save_picture(image: Image.Image, format: str = "JPEG") -> BytesIO:
+        picture = BytesIO()
+        image.save(picture, format=format)
+        picture.seek(0)
+        return picture
+    return save_picture
+
+
 @pytest.fixture
 def logs(monkeypatch):
     logs = []
@@ -0,0 +1,332 @@
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+import os
+import math
+import random
+from pathlib import Path
+from unittest import mock
+from fractions import Fraction
+from contextlib import contextmanager
+from collections import namedtuple
+
+import numpy as np
+from PIL import Image
+
+from zanzocam.webcam.metering import gamma_encode
+
+
+#: Max resolution of the simulated sensor (the one of the v2 camera module)
+SIMULATED_MAX_RESOLUTION = (3280, 2464)
+
+#: Seconds it takes to open the simulated camera
+SIMULATED_OPEN_TIME = 0.3
+
+#: Seconds it takes to encode and return a picture, besides the exposure
+SIMULATED_CAPTURE_OVERHEAD = 0.2
+
+#: How many frames a still capture lasts: one to flush the sensor, one to expose
+SIMULATED_CAPTURE_FRAMES = 2
+
+#: Time constant of the automatic exposure and AWB (seconds, at least one frame)
+SIMULATED_SETTLE_TIME = 0.4
+
+#: Linear light the automatic exposure aims for, on average
+SIMULATED_AUTO_EXPOSURE_TARGET = 0.18
+
+#: Max analog gain of the automatic exposure (ISO 800)
+SIMULATED_MAX_GAIN = 8
+
+#: AWB gains (red, blue) the automatic white balance settles on
+SIMULATED_AWB_GAINS = (1.6, 1.4)
+
+
+Resolution = namedtuple('PiResolution', 'width height')
+FramerateRange = namedtuple('PiFramerateRange', 'low high')
+
+
+class SimulatedClock:
+    """
+    Simulated time: sleeping advances it instantly.
+    Patch `sleep` and `monotonic` with its methods.
+    """
+    def __init__(self, start: float = 0):
+        self.now = start
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += max(seconds, 0)
+
+
+class AmbientLight:
+    """
+    A scripted ambient light curve: a list of (seconds, light) points,
+    interpolated geometrically, as light changes exponentially at dusk
+    and dawn. Constant before the first point and after the last.
+
+    The light is the fraction of the full well a white surface fills
+    in one second at ISO 100.
+    """
+    def __init__(self, points: List[Tuple[float, float]]):
+        if not points:
+            raise ValueError("The ambient light curve needs at least one point.")
+        self.points = sorted(points)
+
+    def __call__(self, seconds: float) -> float:
+        if seconds <= self.points[0][0]:
+            return self.points[0][1]
+        for (start, light), (end, next_light) in zip(self.points, self.points[1:]):
+            if seconds <= end:
+                fraction = (seconds - start) / (end - start)
+                return light * (next_light / light) ** fraction
+        return self.points[-1][1]
+
+
+class SimulatedScene:
+    """
+    A scene and a sensor: renders the frames the simulated camera takes.
+
+    The scene is a horizontal gradient of reflectances from 5% to 100%,
+    plus a few light sources (`light_sources` is the fraction of the frame
+    they cover) 30 times brighter than a white surface.
+    The sensor collects `ambient` (a number or an AmbientLight) times the
+    full well per second from a white surface, with photon shot noise and
+    `read_noise` electrons of read noise, amplifies the signal with the ISO,
+    clips it and encodes it with `tone_curve` (Rec.709 by default).
+    A fraction `black_frame_rate` of the captures returns a black frame,
+    like the camera sometimes does.
+
+    All the randomness comes from `seed`, so runs are reproducible.
+    The captures are recorded in `captures` as (seconds, shutter speed,
+    ISO, black frame) tuples.
+    """
+    def __init__(self, ambient: Union[float, Callable[[float], float]],
+                 clock: Optional[SimulatedClock] = None,
+                 read_noise: float = 3,
+                 full_well: float = 10000,
+                 light_sources: float = 0.01,
+                 black_frame_rate: float = 0,
+                 tone_curve: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+                 seed: int = 0):
+        self.ambient = ambient if callable(ambient) else (lambda seconds: ambient)
+        self.clock = clock or SimulatedClock()
+        self.read_noise = read_noise
+        self.full_well = full_well
+        self.light_sources = light_sources
+        self.black_frame_rate = black_frame_rate
+        self.tone_curve = tone_curve or gamma_encode
+        self.random = random.Random(seed)
+        self.noise = np.random.default_rng(seed)
+        self.captures = []
+        self._reflectances = {}
+
+
+    def reflectances(self, width: int, height: int) -> np.ndarray:
+        """
+        The reflectance of each pixel of the scene at the given size.
+        """
+        if (width, height) not in self._reflectances:
+            scene = np.repeat(np.linspace(0.05, 1, width, dtype=np.float32)[None, :], height, axis=0)
+            sources = int(round(self.light_sources * width * height))
+            if sources:
+                side = max(1, int(math.sqrt(sources / 4)))
+                for column in (width // 5, 2 * width // 5, 3 * width // 5, 4 * width // 5):
+                    scene[height // 3: height // 3 + side, column: column + side] = 30
+            self._reflectances[(width, height)] = scene
+        return self._reflectances[(width, height)]
+
+
+    def mean_reflectance(self) -> float:
+        return float(self.reflectances(64, 48).mean())
+
+
+    def render(self, width: int, height: int, exposure_speed: int, gain: float) -> Image.Image:
+        """
+        Renders a frame exposed for `exposure_speed` microseconds with the given
+        analog gain, at the current time of the clock.
+        """
+        black = self.random.random() < self.black_frame_rate
+        self.captures.append((self.clock.now, exposure_speed, int(round(gain * 100)), black))
+        if black:
+            return Image.new("RGB", (width, height))
+
+        expected = (self.reflectances(width, height) * self.ambient(self.clock.now)
+                    * self.full_well * exposure_speed / 10**6)
+        electrons = self.noise.poisson(expected).astype(np.float32)
+        electrons += self.noise.normal(0, self.read_noise, electrons.shape).astype(np.float32)
+        light = electrons * gain / self.full_well
+        levels = np.round(self.tone_curve(np.clip(light, 0, 1))).astype(np.uint8)
+        return Image.fromarray(levels, "L").convert("RGB")
+
+
+
+class SimulatedPiCamera:
+    """
+    Behaves like a PiCamera filming a SimulatedScene, as far as Camera is
+    concerned: the settings are the same, the exposure speed is limited by
+    the framerate range, the readings (gains, exposure speed, AWB gains)
+    converge to their final values over time like on the real camera,
+    and each capture takes as long as its exposure on the simulated clock.
+
+    The captured frames are exposed with the final values of the readings.
+    """
+    def __init__(self, scene: SimulatedScene, sensor_mode: Optional[int] = None,
+                 framerate_range: Optional[tuple] = None, **kwargs):
+        self._scene = scene
+        self.MAX_RESOLUTION = Resolution(*SIMULATED_MAX_RESOLUTION)
+        self.sensor_mode = sensor_mode
+        self.framerate_range = FramerateRange(*(framerate_range or (Fraction(30), Fraction(30))))
+        self.resolution = (640, 480)
+        self.vflip = False
+        self.hflip = False
+        self.rotation = 0
+        self.awb_mode = "auto"
+        self.exposure_mode = "auto"
+        self.shutter_speed = 0
+        self.iso = 0
+        self._changed = scene.clock.now
+        self._start = [1.0, 1.0, 1000.0, 1.0, 1.0]
+        scene.clock.sleep(SIMULATED_OPEN_TIME)
+
+
+    def __setattr__(self, name, value):
+        """
+        Changing the exposure settings restarts the convergence of the readings.
+        """
+        if name in ("shutter_speed", "iso", "exposure_mode", "awb_mode") and hasattr(self, "_start"):
+            self._start = self._current_readings()
+            self._changed = self._scene.clock.now
+        super().__setattr__(name, value)
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a, **k):
+        self.close()
+
+    def close(self):
+        return
+
+
+    def _frame_time(self) -> float:
+        """ The longest exposure allowed by the framerate range, in microseconds """
+        return 10**6 / float(self.framerate_range.low)
+
+
+    def _final_readings(self) -> List[float]:
+        """
+        The readings the camera converges to with the current settings:
+        analog gain, digital gain, exposure speed and AWB gains.
+        """
+        if self.shutter_speed:
+            exposure_speed = min(self.shutter_speed, self._frame_time())
+            needed = exposure_speed
+        else:
+            ambient = max(self._scene.ambient(self._scene.clock.now), 10**-12)
+            needed = (SIMULATED_AUTO_EXPOSURE_TARGET * 10**6 /
+                      (ambient * self._scene.mean_reflectance()))
+            exposure_speed = min(needed, self._frame_time())
+
+        if self.iso:
+            gain = self.iso / 100
+        else:
+            gain = min(max(needed / exposure_speed, 1), SIMULATED_MAX_GAIN)
+
+        awb_gains = list(SIMULATED_AWB_GAINS)
+        if self.awb_mode == "off":
+            awb_gains = [1.0, 1.0]
+        return [gain, 1.0, float(int(exposure_speed))] + awb_gains
+
+
+    def _current_readings(self) -> List[float]:
+        elapsed = self._scene.clock.now - self._changed
+        time_constant = max(SIMULATED_SETTLE_TIME, self._frame_time() / 10**6)
+        weight = math.exp(-elapsed / time_constant)
+        return [final + (start - final) * weight
+                    for start, final in zip(self._start, self._final_readings())]
+
+
+    @property
+    def analog_gain(self) -> Fraction:
+        return Fraction(self._current_readings()[0]).limit_denominator(1000)
+
+    @property
+    def digital_gain(self) -> Fraction:
+        return Fraction(self._current_readings()[1]).limit_denominator(1000)
+
+    @property
+    def exposure_speed(self) -> int:
+        return int(self._current_readings()[2])
+
+    @property
+    def awb_gains(self) -> Tuple[Fraction, Fraction]:
+        readings = self._current_readings()
+        return (Fraction(readings[3]).limit_denominator(1000),
+                Fraction(readings[4]).limit_denominator(1000))
+
+
+    def capture(self, output: Any, format: Optional[str] = None, **kwargs) -> None:
+        """
+        Renders a frame and writes it into output (a path or a file-like object).
+        """
+        gain, _, exposure_speed, _, _ = self._final_readings()
+        self._start = self._final_readings()
+        self._changed = self._scene.clock.now
+
+        width, height = (int(value) for value in self.resolution)
+        frame = self._scene.render(width, height, exposure_speed, gain)
+        self._scene.clock.sleep(SIMULATED_CAPTURE_FRAMES * exposure_speed / 10**6
+                                + SIMULATED_CAPTURE_OVERHEAD)
+
+        if format == "rgb":
+            # Unencoded frames are padded to 32x16 blocks, like on the camera
+            padded = Image.new("RGB", ((width + 31) // 32 * 32, (height + 15) // 16 * 16))
+            padded.paste(frame)
+            output.write(padded.tobytes())
+            return
+
+        if isinstance(output, (str, os.PathLike)):
+            format = format or Path(str(output)).suffix.lstrip(".")
+        format = (format or "jpeg").lower()
+        if format == "jpg":
+            format = "jpeg"
+        frame.save(output, format=format)
+
+
+    def capture_continuous(self, output: Any, format: Optional[str] = None, **kwargs):
+        """
+        Captures frames into output endlessly, yielding output after each one.
+        """
+        while True:
+            self.capture(output, format=format)
+            yield output
+
+
+
+@contextmanager
+def simulated_camera(scene: SimulatedScene):
+    """
+    Within this context, Camera takes its pictures from a SimulatedPiCamera
+    filming the given scene, and waits on the scene's simulated clock.
+    The camera daemon is never used.
+    """
+    # Imported here: off the RPi, the camera module can't be imported first
+    import zanzocam.webcam.main
+    from zanzocam.webcam import camera as camera_module
+
+    patches = [
+        mock.patch.object(camera_module, "PiCamera",
+                          lambda *args, **kwargs: SimulatedPiCamera(scene, *args, **kwargs)),
+        mock.patch.object(camera_module, "sleep", scene.clock.sleep),
+        mock.patch.object(camera_module, "monotonic", scene.clock.monotonic),
+        mock.patch.object(camera_module.DaemonCamera, "connect", lambda *args, **kwargs: None),
+    ]
+    for patch in patches:
+        patch.start()
+    try:
+        yield scene
+    finally:
+        for patch in patches:
+            patch.stop()
@@ -0,0 +1,129 @@
+import json
+import pytest
+from io import BytesIO
+from PIL import Image
+
+import zanzocam.constants as constants
+from zanzocam.webcam import encoders
+from zanzocam.webcam.byte_budget import QualityCurve, encode_within_budget
+from zanzocam.webcam.camera import Camera
+
+from conftest import in_logs
+
+
+def noisy_image(noise: float, size=(320, 240)) -> Image.Image:
+    return Image.merge("RGB", [Image.effect_noise(size, noise)] * 3)
+
+
+def size_at(image: Image.Image, quality: int) -> int:
+    picture = BytesIO()
+    encoders.encode(image, picture, "jpg", {"quality": quality})
+    return len(picture.getvalue())
+
+
+def assert_best_quality(image, quality, target):
+    assert size_at(image, quality) <= target
+    if quality < constants.BYTE_BUDGET_QUALITY_RANGE[1]:
+        assert size_at(image, quality + 1) > target
+
+
+def test_bisection_without_curve(tmpdir, logs):
+    image = noisy_image(40)
+    target = size_at(image, 70)
+
+    picture, quality, trials = encode_within_budget(image, "jpg", target, {}, QualityCurve(tmpdir / "curve.json"))
+
+    assert_best_quality(image, quality, target)
+    assert len(picture.getvalue()) == size_at(image, quality)
+    assert trials <= constants.BYTE_BUDGET_MAX_TRIALS
+    assert not logs
+
+
+def test_curve_saves_trials(tmpdir, logs):
+    path = tmpdir / "curve.json"
+    image = noisy_image(40)
+    target = size_at(image, 70)
+    _, first_quality, first_trials = encode_within_budget(image, "jpg", target, {}, QualityCurve(path))
+
+    # Same scene: the curve knows the answer already
+    _, quality, trials = encode_within_budget(image, "jpg", target, {}, QualityCurve(path))
+    assert quality == first_quality
+    assert trials == 1 < first_trials
+
+    # A noisier scene: the curve is rescaled
+    image = noisy_image(60)
+    _, quality, trials = encode_within_budget(image, "jpg", target, {}, QualityCurve(path))
+    assert_best_quality(image, quality, target)
+    assert trials <= 3
+
+    assert "JPEG 320x240" in json.load(open(path))
+
+
+def test_budget_too_small(tmpdir, logs):
+    image = noisy_image(40)
+    picture, quality, _ = encode_within_budget(image, "jpg", 100, {}, QualityCurve(tmpdir / "curve.json"))
+    assert quality == constants.BYTE_BUDGET_QUALITY_RANGE[0]
+    assert len(picture.getvalue()) > 100
+
+
+def test_budget_large_enough_for_max_quality(tmpdir, logs):
+    image = noisy_image(40)
+    _, quality, _ = encode_within_budget(image, "jpg", 10**8, {}, QualityCurve(tmpdir / "curve.json"))
+    assert quality == constants.BYTE_BUDGET_QUALITY_RANGE[1]
+
+
+def test_quality_curve_unreadable(tmpdir, logs):
+    with open(tmpdir / "curve.json", "w") as curve:
+        curve.write("not json")
+    assert QualityCurve(tmpdir / "curve.json").curves == {}
+    assert in_logs(logs, "Could not read the quality curve. It will be reset.")
+
+
+def test_quality_curve_predict():
+    curve = QualityCurve()
+    curve.curves = {"JPEG 10x10": {50: 1000, 70: 2000}}
+    assert curve.predict("JPEG 10x10", 60, {}) == 1500
+    assert curve.predict("JPEG 10x10", 80, {}) == 2500
+    # Rescaled to this run's measurements
+    assert curve.predict("JPEG 10x10", 60, {50: 2000}) == 3000
+    assert curve.predict("WEBP 10x10", 60, {}) is None
+
+
+@pytest.mark.parametrize("target_size", [40, "40"])
+def test_camera_with_byte_budget(tmpdir, logs, target_size):
+    camera = Camera({'image': {'target_size': target_size}})
+    picture = BytesIO()
+    noisy_image(40).save(picture, format="JPEG", quality=95)
+    camera.temp_photo = picture
+
+    camera._process_picture()
+
+    assert len(camera.processed_image.getvalue()) <= 40 * 1024
+    assert in_logs(logs, "Byte budget: quality ")
+    assert in_logs(logs, "(target: 40 KB, ")
+    assert not in_logs(logs, "does not fit")
+    assert in_logs(logs, "picture encoded again as JPEG")
+
+
+def test_camera_with_byte_budget_too_small(tmpdir, logs):
+    camera = Camera({'image': {'target_size': 1}})
+    camera.temp_photo = BytesIO()
+    noisy_image(40).save(camera.temp_photo, format="JPEG")
+
+    camera._process_picture()
+
+    assert in_logs(logs, f"Byte budget: quality {constants.BYTE_BUDGET_QUALITY_RANGE[0]}, ")
+    assert in_logs(logs, "WARNING! The picture does not fit in the byte budget")
+
+
+@pytest.mark.parametrize("target_size", [-40, "forty"])
+def test_camera_with_invalid_byte_budget(tmpdir, logs, target_size):
+    camera = Camera({'image': {'target_size': target_size}})
+    camera.temp_photo = BytesIO()
+    noisy_image(40).save(camera.temp_photo, format="JPEG")
+
+    camera._process_picture()
+
+    assert in_logs(logs, "WARNING! target_size must be a positive number of KB")
+    assert not in_logs(logs, "Byte budget")
+    assert camera.processed_image
@@ -1,4 +1,9 @@
 import os
+import pytest
+import threading
+import piexif
+from io import BytesIO
+from pathlib import Path
 from unittest import mock
 from fractions import Fraction
 from PIL import Image, ImageChops
@@ -18,6 +23,14 @@ except ImportError as e:
 from conftest import in_logs
 
 
+EXIF_SOURCE = Path(__file__).parent.parent / "exif-source.jpg"
+
+
+def open_picture(picture: BytesIO) -> Image.Image:
+    picture.seek(0)
+    return Image.open(picture)
+
+
 def test_create_camera_no_dict(monkeypatch, logs):
     camera = Camera("something!")
     assert len(logs) == 1
@@ -25,7 +38,6 @@ def test_create_camera_no_dict(monkeypatch, logs):
     for key, value in constants.CAMERA_DEFAULTS.items():
         assert getattr(camera, key) == value
     assert camera.overlays == {}
-    assert camera.temp_photo_path
     assert camera.processed_image_path
 
 
@@ -36,7 +48,6 @@ def test_create_camera_with_defaults_only(monkeypatch, logs):
     for key, value in constants.CAMERA_DEFAULTS.items():
         assert getattr(camera, key) == value
     assert camera.overlays == {}
-    assert camera.temp_photo_path
     assert camera.processed_image_path
 
 
@@ -46,7 +57,6 @@ def test_create_camera_no_overlays_block(monkeypatch, logs):
     for key, value in constants.CAMERA_DEFAULTS.items():
         assert getattr(camera, key) == value
     assert camera.overlays == {}
-    assert camera.temp_photo_path
     assert camera.processed_image_path
 
 
@@ -56,7 +66,6 @@ def test_create_camera_with_overlays_block(monkeypatch, logs):
     for key, value in constants.CAMERA_DEFAULTS.items():
         assert getattr(camera, key) == value
     assert camera.overlays == {'test': 'data'}
-    assert camera.temp_photo_path
     assert camera.processed_image_path
 
 
@@ -107,14 +116,47 @@ def test_prepare_camera_object_too_tall(logs):
 
 def test_camera_capture(tmpdir, logs):
     camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
-    assert not os.path.exists(tmpdir / "temp_photo.jpg")
+    assert not camera.temp_photo
     with camera._prepare_camera_object() as picam:
         camera._camera_capture(picam)
         assert len(logs) == 2
         assert "Taking picture" in logs[0]
         assert "Picture taken" in logs[1]
-        assert os.path.exists(tmpdir / "temp_photo.jpg")
+        assert camera.temp_photo
+
+
+def test_camera_capture_raw(tmpdir, logs):
+    camera = Camera({'image': {'raw_capture': True, 'width': 100, 'height': 50}})
+    with camera._prepare_camera_object() as picam:
+        camera._camera_capture(picam)
+    assert len(logs) == 2
+    assert isinstance(camera.temp_photo, Image.Image)
+    assert camera.temp_photo.size == (100, 50)
+    assert camera.temp_photo.getpixel((99, 49)) == (255, 0, 0)
+    assert "exif" in camera.temp_photo.info
+
+
+def test_image_from_rgb_frame(logs):
+    image = Image.new("RGB", (40, 20), (1, 2, 3))
+    assert Camera._image_from_rgb_frame(image.tobytes(), 40, 20).getpixel((39, 19)) == (1, 2, 3)
+
+    padded = Image.new("RGB", (64, 32), (4, 5, 6))
+    frame = Camera._image_from_rgb_frame(padded.tobytes(), 40, 20)
+    assert frame.size == (40, 20)
+    assert frame.getpixel((39, 19)) == (4, 5, 6)
+
+    with pytest.raises(ValueError):
+        Camera._image_from_rgb_frame(b"123", 40, 20)
+
+
+def test_take_picture_raw(logs):
+    camera = Camera({'image': {'raw_capture': True, 'width': 100, 'height': 50,
+                               'use_low_light_algorithm': False}})
+    camera.take_picture()
+    assert not in_logs(logs, "ERROR")
+    processed = open_picture(camera.processed_image)
+    assert processed.format == "JPEG"
+    assert processed.size == (100, 50)
 
 
 def test_take_picture(monkeypatch, logs):
@@ -133,20 +175,18 @@ def test_take_picture(monkeypatch, logs):
 
 def test_shoot_picture_no_low_light_check(tmpdir, logs):
     camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
-    assert not os.path.exists(tmpdir / "temp_photo.jpg")
+    assert not camera.temp_photo
     camera._shoot_picture()
     assert len(logs) == 4
     assert "Camera warm-up" in logs[0]
     assert "Taking picture" in logs[1]
     assert "Picture taken" in logs[2]
     assert "Luminance won't be checked" in logs[3]
-    assert os.path.exists(tmpdir / "temp_photo.jpg")
+    assert camera.temp_photo
 
 
 def test_shoot_picture_no_low_light_check(tmpdir, logs):
     camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     camera.use_low_light_algorithm = False
     camera._shoot_picture()
     assert len(logs) == 4
@@ -158,10 +198,9 @@ def test_shoot_picture_no_low_light_check(tmpdir, logs):
 
 def test_shoot_picture_daylight_luminance(monkeypatch, tmpdir, logs):
     camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
 
     monkeypatch.setattr(webcam.camera.Camera, 
-                        '_luminance_from_path', 
+                        '_luminance_from_picture', 
                         lambda *a: constants.MINIMUM_DAYLIGHT_LUMINANCE + 10)
 
     camera._shoot_picture()
@@ -174,57 +213,195 @@ def test_shoot_picture_daylight_luminance(monkeypatch, tmpdir, logs):
 
 def test_shoot_picture_low_light_luminance_no_settle(monkeypatch, tmpdir, logs):
     camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     camera.let_awb_settle_in_dark = False
 
     monkeypatch.setattr(webcam.camera.Camera, 
-                        '_luminance_from_path', 
+                        '_luminance_from_picture', 
                         lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE - 10)
     monkeypatch.setattr(webcam.camera.Camera,
                         '_low_light_search',
                         lambda *a, **k: (constants.MINIMUM_DAYLIGHT_LUMINANCE, 1, 1, 1))
 
     camera._shoot_picture()
-    assert len(logs) == 4
+    assert len(logs) == 5
     assert "Camera warm-up" in logs[0]
     assert "Taking picture" in logs[1]
     assert "Picture taken" in logs[2]
-    assert "AWB adjusted picture not required" in logs[3]
+    assert "Low light strategy 'search': 1 captures needed" in logs[3]
+    assert "AWB adjusted picture not required" in logs[4]
 
 
 def test_shoot_picture_low_light_luminance_with_settle(monkeypatch, tmpdir, logs):
     camera = Camera({'image': {'let_awb_settle_in_dark': True}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
 
     monkeypatch.setattr(webcam.camera.Camera, 
-                        '_luminance_from_path', 
+                        '_luminance_from_picture', 
                         lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE - 10)
     monkeypatch.setattr(webcam.camera.Camera,
                         '_low_light_search',
                         lambda *a, **k: (constants.MINIMUM_DAYLIGHT_LUMINANCE, 1, 1, 1))
 
     camera._shoot_picture()
-    assert len(logs) == 8
+    assert len(logs) == 9
     assert "Camera warm-up" in logs[0]
     assert "Taking picture" in logs[1]
     assert "Picture taken" in logs[2]
-    assert "Taking AWB stabilized picture with the final parameters" in logs[3]
-    assert "Adjusting white balance" in logs[4]
-    assert "Taking picture" in logs[5]
-    assert "Picture taken" in logs[6]
-    assert "Final luminance" in logs[7]
+    assert "Low light strategy 'search': 1 captures needed" in logs[3]
+    assert "Taking AWB stabilized picture with the final parameters" in logs[4]
+    assert "Adjusting white balance" in logs[5]
+    assert "Taking picture" in logs[6]
+    assert "Picture taken" in logs[7]
+    assert "Final luminance" in logs[8]
+
+
+class SettlingCamera:
+    """
+    Fake camera whose readings change for the first `changes` polls.
+    """
+    def __init__(self, changes):
+        self.changes = changes
+        self.polls = 0
+
+    @property
+    def analog_gain(self):
+        self.polls += 1
+        return Fraction(8, 1) if self.polls > self.changes else Fraction(self.polls, 1)
+
+    digital_gain = Fraction(1, 1)
+    exposure_speed = 33000
+    awb_gains = (Fraction(3, 2), Fraction(7, 5))
+
+
+def test_wait_for_camera_to_settle(monkeypatch, logs):
+    sleeps = []
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: sleeps.append(t))
+
+    settle_time = Camera._wait_for_camera_to_settle(SettlingCamera(changes=3), 5)
+    assert settle_time is not None
+    assert sleeps == [constants.CAMERA_SETTLE_POLL_INTERVAL] * (3 + constants.CAMERA_SETTLE_STABLE_POLLS)
+    assert len(logs) == 0
+
+
+def test_wait_for_camera_to_settle_timeout(monkeypatch, logs):
+    sleeps = []
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: sleeps.append(t))
+
+    assert Camera._wait_for_camera_to_settle(SettlingCamera(changes=1000), 5) is None
+    assert len(sleeps) == int(5 / constants.CAMERA_SETTLE_POLL_INTERVAL)
+
+
+def test_wait_for_camera_to_settle_long_frames(monkeypatch, logs):
+    sleeps = []
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: sleeps.append(t))
+
+    Camera._wait_for_camera_to_settle(SettlingCamera(changes=0), 70, frame_time=9.5)
+    assert sleeps == [9.5] * constants.CAMERA_SETTLE_STABLE_POLLS
+
+
+def test_wait_for_camera_to_settle_no_readings(monkeypatch, logs):
+    sleeps = []
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: sleeps.append(t))
+
+    assert Camera._wait_for_camera_to_settle(PiCamera(), 5) is None
+    assert sleeps == []
+    assert len(logs) == 0
+
+    Camera._camera_warm_up(PiCamera())
+    assert sleeps == []
+    assert "Camera warm-up: the camera reports no gains to poll, not waiting" in logs[0]
+
+
+def test_camera_warm_up_logs_settle_time(monkeypatch, logs):
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: None)
+
+    Camera._camera_warm_up(SettlingCamera(changes=2))
+    assert len(logs) == 1
+    assert "Camera warm-up: settled in" in logs[0]
+
+
+def test_shoot_picture_predicted_day(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {}, 'location': {'latitude': 46, 'longitude': 11}})
+
+    monkeypatch.setattr(webcam.camera, 'solar_elevation', lambda *a, **k: 45)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_luminance_from_picture',
+                        lambda *a, **k: pytest.fail("Luminance should not be checked"))
+
+    camera._shoot_picture()
+    assert len(logs) == 5
+    assert "Predicted exposure regime: day" in logs[0]
+    assert "Camera warm-up" in logs[1]
+    assert "Exposure regime predicted: day, measured: not checked" in logs[4]
+
+
+def test_shoot_picture_predicted_twilight(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {}, 'location': {'latitude': 46, 'longitude': 11}})
+
+    monkeypatch.setattr(webcam.camera, 'solar_elevation', lambda *a, **k: 0)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_luminance_from_picture',
+                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE + 10)
+
+    camera._shoot_picture()
+    assert len(logs) == 6
+    assert "Predicted exposure regime: twilight" in logs[0]
+    assert "Exposure regime predicted: twilight, measured: day" in logs[4]
+    assert "Daylight luminance detected" in logs[5]
+
+
+def test_shoot_picture_predicted_night(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {}, 'location': {'latitude': 46, 'longitude': 11}})
+
+    monkeypatch.setattr(webcam.camera, 'solar_elevation', lambda *a, **k: -30)
+    search = mock.Mock(return_value=(constants.MINIMUM_NIGHT_LUMINANCE, constants.MAX_SHUTTER_SPEED, 800, 1))
+    monkeypatch.setattr(webcam.camera.Camera, '_low_light_search', search)
+
+    camera._shoot_picture()
+    search.assert_called_once_with(0, None)
+    assert len(logs) == 5
+    assert "Predicted exposure regime: night" in logs[0]
+    assert "skipping the automatic exposure" in logs[1]
+    assert "Low light strategy 'search'" in logs[2]
+    assert "Exposure regime predicted: night, measured: night (estimated)" in logs[3]
+    assert "Time saved: about" in logs[3]
+    assert "AWB adjusted picture not required" in logs[4]
+
+
+def test_shoot_picture_predicted_night_estimate_in_linear_light(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {}, 'location': {'latitude': 46, 'longitude': 11}})
+
+    # 150 times the exposure of the automatic one: scaling the luminance
+    # would give 0.8 (night), scaling the linear light gives about 1.8
+    monkeypatch.setattr(webcam.camera, 'solar_elevation', lambda *a, **k: -30)
+    search = mock.Mock(return_value=(120, constants.MIN_SHUTTER_SPEED * 150, constants.INITIAL_LOW_LIGHT_ISO, 1))
+    monkeypatch.setattr(webcam.camera.Camera, '_low_light_search', search)
+
+    camera._shoot_picture()
+    assert "Exposure regime predicted: night, measured: twilight (estimated)" in logs[3]
+
+
+def test_shoot_picture_invalid_location(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {}, 'location': {'latitude': 'nowhere'}})
+
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_luminance_from_picture',
+                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE + 10)
+
+    camera._shoot_picture()
+    assert in_logs(logs, "Could not compute the position of the sun")
+    assert in_logs(logs, "Daylight luminance detected")
+    assert not in_logs(logs, "Exposure regime predicted")
 
 
 def test_low_light_search_twilight_three_attempts(monkeypatch, tmpdir, logs):
-    camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
+    camera = Camera({'image': {'use_exposure_memory': False}})
     
     monkeypatch.setattr(webcam.camera.Camera,
                         "_camera_capture",
                         lambda *a, **k: None)
 
     monkeypatch.setattr(webcam.camera.Camera, 
-                        '_luminance_from_path', 
+                        '_luminance_from_picture', 
                         mock.Mock(side_effect=[
                             constants.MINIMUM_DAYLIGHT_LUMINANCE + 10,
                             constants.MINIMUM_DAYLIGHT_LUMINANCE - 10,
@@ -245,15 +422,14 @@ def test_low_light_search_twilight_three_attempts(monkeypatch, tmpdir, logs):
 
 
 def test_low_light_search_initial_picture_very_dark(monkeypatch, tmpdir, logs):
-    camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
+    camera = Camera({'image': {'use_exposure_memory': False}})
     
     monkeypatch.setattr(webcam.camera.Camera,
                         "_camera_capture",
                         lambda *a, **k: None)
 
     monkeypatch.setattr(webcam.camera.Camera, 
-                        '_luminance_from_path', 
+                        '_luminance_from_picture', 
                         lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE)
 
     monkeypatch.setattr(webcam.camera.Camera,
@@ -270,15 +446,14 @@ def test_low_light_search_initial_picture_very_dark(monkeypatch, tmpdir, logs):
 
 
 def test_low_light_search_one_attempt_returns_a_black_frame(monkeypatch, tmpdir, logs):
-    camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
+    camera = Camera({'image': {'use_exposure_memory': False}})
     
     monkeypatch.setattr(webcam.camera.Camera,
                         "_camera_capture",
                         lambda *a, **k: None)
 
     monkeypatch.setattr(webcam.camera.Camera, 
-                        '_luminance_from_path', 
+                        '_luminance_from_picture', 
                         mock.Mock(side_effect=[
                             0.0,
                             constants.MINIMUM_DAYLIGHT_LUMINANCE,
@@ -298,15 +473,14 @@ def test_low_light_search_one_attempt_returns_a_black_frame(monkeypatch, tmpdir,
 
 
 def test_low_light_attempts_are_limited(monkeypatch, tmpdir, logs):
-    camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
+    camera = Camera({'image': {'use_exposure_memory': False}})
     
     monkeypatch.setattr(webcam.camera.Camera,
                         "_camera_capture",
                         lambda *a, **k: None)
 
     monkeypatch.setattr(webcam.camera.Camera, 
-                        '_luminance_from_path', 
+                        '_luminance_from_picture', 
                         lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE - 10)
 
     monkeypatch.setattr(webcam.camera.Camera,
@@ -323,21 +497,20 @@ def test_low_light_attempts_are_limited(monkeypatch, tmpdir, logs):
     
 
 def test_low_light_shutter_speed_and_ISO_are_limited(monkeypatch, tmpdir, logs):
-    camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
+    camera = Camera({'image': {'use_exposure_memory': False}})
     
     monkeypatch.setattr(webcam.camera.Camera,
                         "_camera_capture",
                         lambda *a, **k: None)
 
     monkeypatch.setattr(webcam.camera.Camera, 
-                        '_luminance_from_path', 
-                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE - 10)
+                        '_luminance_from_picture', 
+                        lambda *a, **k: constants.NO_LUMINANCE_THRESHOLD)
 
-    # This makes _low_light_equation return a crazy high number
+    # This makes _low_light_solver return a crazy high number
     monkeypatch.setattr(webcam.camera.Camera,
                         '_compute_target_luminance',
-                        lambda *a, **k: constants.MAX_SHUTTER_SPEED)
+                        lambda *a, **k: 255)
 
     camera._low_light_search(constants.MINIMUM_DAYLIGHT_LUMINANCE - 10)
     assert "Low light detected" in logs[0]
@@ -352,6 +525,223 @@ def test_low_light_shutter_speed_and_ISO_are_limited(monkeypatch, tmpdir, logs):
     assert "ISO is at 800 and shutter speed is at max" in logs[9]
     
 
+def test_low_light_search_remembers_and_reuses_exposure(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {}})
+
+    monkeypatch.setattr(webcam.camera.Camera,
+                        "_camera_capture",
+                        lambda *a, **k: None)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_compute_target_luminance',
+                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_luminance_from_picture',
+                        mock.Mock(side_effect=[
+                            constants.MINIMUM_DAYLIGHT_LUMINANCE - 10,
+                            constants.MINIMUM_DAYLIGHT_LUMINANCE,
+                        ]))
+
+    _, shutter_speed, iso, attempts = camera._low_light_search(constants.MINIMUM_DAYLIGHT_LUMINANCE - 20)
+    assert attempts == 2
+    assert in_logs(logs, "none matching the current time and luminance")
+    assert in_logs(logs, "Exposure memory updated")
+    assert os.path.exists(constants.EXPOSURE_MEMORY)
+
+    # The second search starts from the remembered values
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_luminance_from_picture',
+                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE)
+
+    _, new_shutter_speed, new_iso, attempts = camera._low_light_search(constants.MINIMUM_DAYLIGHT_LUMINANCE - 20)
+    assert attempts == 1
+    assert in_logs(logs, "1 entries, best match")
+    assert new_shutter_speed == shutter_speed
+    assert new_iso == iso
+
+
+def test_low_light_search_exposure_memory_disabled(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {'use_exposure_memory': False}})
+
+    monkeypatch.setattr(webcam.camera.Camera,
+                        "_camera_capture",
+                        lambda *a, **k: None)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_luminance_from_picture',
+                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_compute_target_luminance',
+                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE)
+
+    camera._low_light_search(constants.MINIMUM_DAYLIGHT_LUMINANCE - 10)
+    assert not in_logs(logs, "Exposure memory")
+    assert not os.path.exists(constants.EXPOSURE_MEMORY)
+
+
+def rec709(light):
+    if light < 0.018:
+        return 255 * 4.5 * light
+    return 255 * (1.099 * light ** 0.45 - 0.099)
+
+
+def test_low_light_solver_one_sample_is_gamma_aware(logs):
+    # 3x the light needs 3x the exposure, but it's not 3x the luminance
+    samples = [(10**5, 400, rec709(0.02))]
+    shutter_speed = Camera._low_light_solver(samples, 400, rec709(0.06))
+    assert abs(shutter_speed - 3*10**5) < 100
+    assert len(logs) == 0
+
+
+def test_low_light_solver_fits_the_slope(logs):
+    # This sensor doubles the light when the exposure is 4x
+    samples = [(10**5, 400, rec709(0.02)), (4*10**5, 400, rec709(0.04))]
+    assert abs(Camera._low_light_solver(samples, 400, rec709(0.06)) - 9*10**5) < 1000
+
+
+def test_low_light_solver_accounts_for_iso(logs):
+    samples = [(10**5, 400, rec709(0.02)), (2*10**5, 400, rec709(0.04))]
+    assert abs(Camera._low_light_solver(samples, 800, rec709(0.06)) - 1.5*10**5) < 100
+
+
+def test_low_light_solver_stays_within_bracket(logs):
+    # Noisy samples make the fitted slope point outside of the bracket
+    samples = [(10**5, 400, 20), (4*10**5, 400, 40), (2*10**5, 400, 45)]
+    shutter_speed = Camera._low_light_solver(samples, 400, 30)
+    assert 10**5 < shutter_speed < 2*10**5
+
+
+def test_low_light_solver_ignores_black_frames(logs):
+    samples = [(10**5, 400, 0.0), (10**5, 400, 10)]
+    assert Camera._low_light_solver(samples, 400, 30) == Camera._low_light_solver(samples[1:], 400, 30)
+
+
+def test_low_light_solver_caps_shutter_speed(logs):
+    assert Camera._low_light_solver([(10**6, 400, 1)], 400, 30) == constants.MAX_SHUTTER_SPEED
+    assert in_logs(logs, "Max shutter speed has been reached")
+
+
+def test_low_light_search_starts_from_automatic_exposure(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {'use_exposure_memory': False}})
+
+    monkeypatch.setattr(webcam.camera.Camera,
+                        "_camera_capture",
+                        lambda *a, **k: None)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_luminance_from_picture',
+                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_compute_target_luminance',
+                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE)
+
+    _, shutter_speed, _, attempts = camera._low_light_search(10, (30000, 400))
+    assert attempts == 1
+    assert in_logs(logs, "Starting from the automatic exposure")
+    assert shutter_speed > 30000
+
+
+def test_camera_exposure(logs):
+    assert Camera._camera_exposure(PiCamera()) is None
+    assert Camera._camera_exposure(SettlingCamera(changes=0)) == (33000, 800)
+
+
+class ScriptedScene:
+    """
+    Replaces Camera._camera_capture: the picture is a flat gray whose level
+    depends on the exposure, through the Rec.709 tone curve.
+    """
+    def __init__(self, picture_in_memory, light_per_exposure):
+        self.picture_in_memory = picture_in_memory
+        self.light_per_exposure = light_per_exposure
+        self.captures = 0
+
+    def __call__(self, camera_object, camera):
+        self.captures += 1
+        light = min(self.light_per_exposure * camera.shutter_speed * camera.iso, 1)
+        level = int(round(rec709(light)))
+        camera_object.temp_photo = self.picture_in_memory(Image.new("RGB", (64, 48), (level, level, level)))
+
+
+def test_low_light_correction_unknown_strategy(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {'low_light_strategy': 'guess'}})
+    monkeypatch.setattr(webcam.camera.Camera, '_low_light_search', lambda *a, **k: (40, 1, 1, 3))
+
+    assert camera._low_light_correction(10) == (40, 1, 1, 3)
+    assert len(logs) == 2
+    assert "Unknown low light strategy 'guess'" in logs[0]
+    assert "Low light strategy 'search': 3 captures needed" in logs[1]
+
+
+def test_histogram_exposure_single_correction(monkeypatch, tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {'low_light_strategy': 'histogram'}})
+    scene = ScriptedScene(picture_in_memory, light_per_exposure=10**-9)
+    monkeypatch.setattr(webcam.camera.Camera, "_camera_capture", lambda self, c: scene(self, c))
+
+    # The automatic picture
+    probe = mock.Mock(shutter_speed=30000, iso=400)
+    scene(camera, probe)
+    initial_luminance = camera._luminance_from_picture(camera.temp_photo)
+
+    luminance, shutter_speed, iso, captures = camera._low_light_correction(initial_luminance, (30000, 400))
+    assert captures == 1
+    assert abs(luminance - camera._compute_target_luminance(initial_luminance)) <= constants.TARGET_LUMINOSITY_MARGIN
+    assert in_logs(logs, "99th percentile")
+    assert in_logs(logs, "OK! Luminance achieved")
+    assert in_logs(logs, "Low light strategy 'histogram': 1 captures needed")
+
+
+def test_histogram_exposure_too_dark_to_estimate(monkeypatch, tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {'low_light_strategy': 'histogram'}})
+    scene = ScriptedScene(picture_in_memory, light_per_exposure=10**-11)
+    monkeypatch.setattr(webcam.camera.Camera, "_camera_capture", lambda self, c: scene(self, c))
+
+    probe = mock.Mock(shutter_speed=30000, iso=400)
+    scene(camera, probe)
+
+    _, _, _, captures = camera._histogram_exposure(0.5, (30000, 400))
+    assert in_logs(logs, "too dark to estimate the exposure")
+    assert captures == 2
+
+
+def test_histogram_exposure_retries_black_pictures(monkeypatch, tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {'low_light_strategy': 'histogram'}})
+    scene = ScriptedScene(picture_in_memory, light_per_exposure=10**-9)
+    exposures = []
+    def capture(self, c):
+        exposures.append((c.shutter_speed, c.iso))
+        scene(self, c)
+        # The first corrected picture comes out black
+        if len(exposures) == 2:
+            self.temp_photo = picture_in_memory(Image.new("RGB", (64, 48)))
+    monkeypatch.setattr(webcam.camera.Camera, "_camera_capture", capture)
+
+    scene(camera, mock.Mock(shutter_speed=30000, iso=400))
+    exposures.clear()
+    capture(camera, mock.Mock(shutter_speed=30000, iso=400))
+    initial_luminance = camera._luminance_from_picture(camera.temp_photo)
+
+    luminance, _, _, _ = camera._histogram_exposure(initial_luminance, (30000, 400))
+    assert in_logs(logs, "The camera shot a fully black picture. Trying again.")
+    assert exposures[1] == exposures[2]
+    assert abs(luminance - camera._compute_target_luminance(initial_luminance)) <= constants.TARGET_LUMINOSITY_MARGIN
+    assert camera._luminance_from_picture(camera.temp_photo) > 1
+
+
+def test_histogram_exposure_cannot_increase_further(monkeypatch, tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {'low_light_strategy': 'histogram'}})
+    scene = ScriptedScene(picture_in_memory, light_per_exposure=10**-13)
+    monkeypatch.setattr(webcam.camera.Camera, "_camera_capture", lambda self, c: scene(self, c))
+
+    _, shutter_speed, iso, _ = camera._histogram_exposure(0, None)
+    assert in_logs(logs, "Cannot increase further")
+    assert shutter_speed == constants.MAX_SHUTTER_SPEED
+    assert iso == 800
+
+
+def test_split_exposure(logs):
+    assert Camera._split_exposure(10**6 * constants.INITIAL_LOW_LIGHT_ISO) == (10**6, constants.INITIAL_LOW_LIGHT_ISO)
+    assert Camera._split_exposure(constants.MAX_SHUTTER_SPEED * 600) == (constants.MAX_SHUTTER_SPEED * 600 // 800, 800)
+    assert Camera._split_exposure(constants.MAX_SHUTTER_SPEED * 10**4) == (constants.MAX_SHUTTER_SPEED, 800)
+
+
 def test_compute_target_luminance_daylight(logs):
     camera = Camera({'image': {}})
     lum = constants.MINIMUM_DAYLIGHT_LUMINANCE + 10
@@ -381,89 +771,266 @@ def test_compute_target_luminance_night_lower_bound_check(logs):
     assert len(logs) == 0
 
 
-def test_luminance_from_path_white_pic(tmpdir, logs):
+def test_luminance_from_picture_white_pic(tmpdir, logs):
     camera = Camera({'image': {}})
     image = Image.new("RGB", (10, 10), color="#ffffff")
     image.save(str(tmpdir / 'pic.jpg'), format="JPEG")
-    assert camera._luminance_from_path(tmpdir / 'pic.jpg') > constants.MINIMUM_DAYLIGHT_LUMINANCE
+    assert camera._luminance_from_picture(tmpdir / 'pic.jpg') > constants.MINIMUM_DAYLIGHT_LUMINANCE
     assert len(logs) == 0
 
 
-def test_luminance_from_path_black_pic(tmpdir, logs):
+def test_luminance_from_picture_black_pic(tmpdir, logs):
     camera = Camera({'image': {}})
     image = Image.new("RGB", (10, 10), color="#000000")
     image.save(str(tmpdir / 'pic.jpg'), format="JPEG")
-    assert camera._luminance_from_path(tmpdir / 'pic.jpg') < constants.NO_LUMINANCE_THRESHOLD
+    assert camera._luminance_from_picture(tmpdir / 'pic.jpg') < constants.NO_LUMINANCE_THRESHOLD
     assert len(logs) == 0
 
 
 def test_process_picture_cant_open_picture(tmpdir, logs):
     camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     
     camera._process_picture()
 
     assert len(logs) == 1
     assert "Failed to open the image for editing" in logs[0]
-    assert not os.path.exists(camera.temp_photo_path)
+    assert not camera.processed_image
 
 
-def test_process_picture_no_overlays_all_defaults(mock_piexif, tmpdir, logs):
+def test_process_picture_no_overlays_all_defaults(mock_piexif, tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (100, 100), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     camera._process_picture()
 
-    assert len(logs) == 0
-    assert os.path.isfile(camera.temp_photo_path)    
-    assert os.path.isfile(camera.processed_image_path)
+    assert len(logs) == 1
+    assert "no overlays, the picture was not encoded again" in logs[0]
+    assert camera.temp_photo    
+    assert camera.processed_image
     assert str(camera.processed_image_path).endswith("jpg")
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert not ImageChops.difference(temp_img, proc_img).getbbox()
 
 
-def test_process_picture_no_overlays_save_in_png(tmpdir, logs):
+def test_process_picture_no_overlays_rewrites_exif_only(monkeypatch, tmpdir, logs):
+    # Undo mock_piexif: this test needs the real EXIF data
+    monkeypatch.setattr(webcam.camera.piexif, 'load', piexif._load.load)
+    monkeypatch.setattr(webcam.camera.piexif, 'dump', piexif._dump.dump)
+    monkeypatch.setattr(webcam.camera.piexif.ImageIFD, 'Make', 271)
+    monkeypatch.setattr(webcam.camera.piexif.ImageIFD, 'Software', 305)
+    monkeypatch.setattr(webcam.camera.piexif.ImageIFD, 'ProcessingSoftware', 11)
+
+    camera = Camera({'image': {}})
+    with open(EXIF_SOURCE, 'rb') as source:
+        original = source.read()
+    camera.temp_photo = BytesIO(original)
+
+    camera._process_picture()
+
+    assert len(logs) == 1
+    assert "no overlays, the picture was not encoded again" in logs[0]
+    processed = camera.processed_image.getvalue()
+    assert piexif.load(processed)["0th"][271].startswith(b"ZanzoCam")
+    for tag in (piexif.ExifIFD.ExposureTime, piexif.ExifIFD.ISOSpeedRatings):
+        assert piexif.load(processed)["Exif"][tag] == piexif.load(original)["Exif"][tag]
+    # The compressed data is untouched
+    scan_start = original.index(b"\xff\xda")
+    assert processed.endswith(original[scan_start:])
+
+
+def test_process_picture_with_overlays_logs_full_path(tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {}, 'overlays': {'top_left': {'type': 'text', 'text': 'test'}}})
+    camera.temp_photo = picture_in_memory(Image.new("RGB", (100, 100)))
+
+    camera._process_picture()
+    assert ("Picture processed: 1 overlays rendered (overlay cache: 0 hits, 1 misses), "
+            "picture encoded again as JPEG") in logs[-1]
+
+
+SIX_OVERLAYS = {
+    'top_left': {'type': 'text', 'text': 'Top left', 'over_the_picture': True},
+    'top_center': {'type': 'text', 'text': '%%TIME', 'font_size': 12, 'over_the_picture': True},
+    'top_right': {'type': 'text', 'text': 'Top right, a bit longer', 'font_size': 10},
+    'bottom_left': {'type': 'image', 'path': 'missing.png'},
+    'bottom_center': {'type': 'text', 'text': 'Bottom', 'background_color': (255, 0, 0, 128), 'over_the_picture': True},
+    'bottom_right': {'type': 'text', 'text': 'Overlapping', 'background_color': (0, 0, 255, 255), 'over_the_picture': True},
+}
+
+
+def test_process_picture_overlays_in_threads(monkeypatch, tmpdir, logs, picture_in_memory):
+    threads = set()
+    original_render = Camera._render_overlay
+    def render(self, *args):
+        threads.add(threading.current_thread().name)
+        return original_render(self, *args)
+    monkeypatch.setattr(Camera, "_render_overlay", render)
+
+    pictures = []
+    for overlay_threads in (1, 4):
+        camera = Camera({'image': {'overlay_threads': overlay_threads}, 'overlays': SIX_OVERLAYS})
+        camera.temp_photo = picture_in_memory(Image.new("RGB", (200, 200), color="#FFFFFF"))
+        camera._process_picture()
+        pictures.append(open_picture(camera.processed_image))
+
+    assert len(threads) > 1
+    assert in_logs(logs, "missing.png' can't be found")
+    assert "5 overlays rendered" in logs[-1]
+    assert not ImageChops.difference(*pictures).getbbox()
+
+
+def test_process_picture_overlay_errors_in_threads(monkeypatch, tmpdir, logs, picture_in_memory):
+    original_overlay = webcam.camera.Overlay
+    def overlay(position, *args, **kwargs):
+        if position == "top_right":
+            raise ValueError("test")
+        return original_overlay(position, *args, **kwargs)
+    monkeypatch.setattr(webcam.camera, "Overlay", overlay)
+
+    camera = Camera({'image': {'overlay_threads': 3}, 'overlays': SIX_OVERLAYS})
+    camera.temp_photo = picture_in_memory(Image.new("RGB", (200, 200), color="#FFFFFF"))
+    camera._process_picture()
+
+    assert in_logs(logs, "Something happened processing the overlay top_right")
+    assert "4 overlays rendered" in logs[-1]
+
+
+def test_overlay_threads(logs):
+    assert Camera({'image': {'overlay_threads': 3}})._overlay_threads() == 3
+    assert Camera({'image': {}})._overlay_threads() == 1
+    assert Camera({'image': {'overlay_threads': 0}})._overlay_threads() == (os.cpu_count() or 1)
+    assert Camera({'image': {'overlay_threads': 'many'}})._overlay_threads() == 1
+    assert in_logs(logs, "overlay_threads must be a number")
+
+
+def test_process_picture_leaves_the_raw_photo_intact(tmpdir, logs):
+    camera = Camera({'image': {}, 'overlays': {'top_left': {'type': 'text', 'text': 'test', 'over_the_picture': True}}})
+    camera.temp_photo = Image.new("RGB", (100, 100), color="#FFFFFF")
+    camera._process_picture()
+    assert camera.temp_photo.getcolors() == [(100 * 100, (255, 255, 255))]
+    assert ImageChops.difference(open_picture(camera.processed_image), camera.temp_photo).getbbox()
+
+
+def test_process_picture_takes_overlays_from_the_cache(tmpdir, logs, picture_in_memory):
+    overlays = {'top_left': {'type': 'text', 'text': 'test'}, 'top_right': {'type': 'text', 'text': '%%TIME'}}
+    for _ in range(2):
+        camera = Camera({'image': {}, 'overlays': overlays})
+        camera.temp_photo = picture_in_memory(Image.new("RGB", (100, 100)))
+        camera._process_picture()
+    assert "2 overlays rendered (overlay cache: 2 hits, 0 misses)" in logs[-1]
+
+
+def test_process_picture_no_overlays_progressive(tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {'jpeg_progressive': True}})
+    camera.temp_photo = picture_in_memory(Image.new("RGB", (100, 100)))
+
+    camera._process_picture()
+
+    # The picture must be encoded again to become progressive
+    assert "Picture processed: 0 overlays rendered, picture encoded again as JPEG" in logs[-1]
+    assert open_picture(camera.processed_image).info.get("progressive")
+
+
+def test_process_picture_unsupported_format_falls_back_to_jpeg(monkeypatch, tmpdir, logs, picture_in_memory):
+    monkeypatch.setattr(webcam.camera.encoders, "is_supported", lambda extension: extension == "jpg")
+    camera = Camera({'image': {'extension': 'avif'}})
+    camera.temp_photo = picture_in_memory(Image.new("RGB", (100, 100)))
+
+    camera._process_picture()
+
+    assert in_logs(logs, "can't write 'avif' pictures. The picture will be saved as JPEG instead")
+    assert camera.extension == "jpg"
+    assert str(camera.processed_image_path).endswith(".jpg")
+    assert open_picture(camera.processed_image).format == "JPEG"
+
+
+def test_process_picture_renditions_with_overlays(tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {'renditions': [
+                        {'name': 'thumb', 'width': 40},
+                        {'name': 'medium', 'width': 150, 'quality': 50, 'format': 'png'},
+                        {'name': 'huge', 'width': 1000},
+                    ]}, 
+                     'overlays': {'top_left': {'type': 'text', 'text': 'test'}}})
+    camera.temp_photo = picture_in_memory(Image.new("RGB", (200, 100), color="#FF0000"))
+
+    camera._process_picture()
+
+    final = open_picture(camera.processed_image)
+    assert "Renditions created: huge 200x" in logs[-1]
+    assert [(name, extension) for name, extension, _ in camera.processed_renditions] == \
+        [('huge', 'jpg'), ('medium', 'png'), ('thumb', 'jpg')]
+    sizes = [open_picture(picture).size for _, _, picture in camera.processed_renditions]
+    assert sizes[0] == final.size  # never larger than the picture
+    assert sizes[1] == (150, round(150 * final.height / final.width))
+    assert sizes[2] == (40, round(40 * final.height / final.width))
+    assert open_picture(camera.processed_renditions[1][2]).format == "PNG"
+
+
+def test_process_picture_renditions_without_overlays(tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {'renditions': [{'name': 'thumb', 'width': 50, 'height': 20}]}})
+    original = picture_in_memory(Image.new("RGB", (400, 200), color="#00FF00")).getvalue()
+    camera.temp_photo = BytesIO(original)
+
+    camera._process_picture()
+
+    assert len(logs) == 2
+    assert "no overlays, the picture was not encoded again" in logs[0]
+    assert "Renditions created: thumb 50x20" in logs[1]
+    assert camera.processed_image.getvalue() == original
+    name, extension, picture = camera.processed_renditions[0]
+    thumbnail = open_picture(picture)
+    assert thumbnail.size == (50, 20)
+    assert abs(thumbnail.getpixel((25, 10))[1] - 255) < 5
+
+
+def test_process_picture_invalid_rendition_is_skipped(tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {'renditions': [{'name': 'bad', 'width': None}, {'name': 'good'}]}})
+    camera.temp_photo = picture_in_memory(Image.new("RGB", (1000, 500)))
+
+    camera._process_picture()
+
+    assert in_logs(logs, "The rendition {'name': 'bad', 'width': None")
+    assert [name for name, _, _ in camera.processed_renditions] == ['good']
+    assert open_picture(camera.processed_renditions[0][2]).size == (640, 320)
+
+
+def test_process_picture_no_overlays_save_in_png(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {'extension': 'png'}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     camera._process_picture()
 
-    assert len(logs) == 0
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
+    assert len(logs) == 1
+    assert camera.temp_photo    
+    assert camera.processed_image
     assert str(camera.processed_image_path).endswith("png")
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert not ImageChops.difference(temp_img, proc_img.convert("RGB")).getbbox()
 
 
-def test_process_picture_no_overlays_save_in_gif(tmpdir, logs):
+def test_process_picture_no_overlays_save_in_gif(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {'extension': 'gif'}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     camera._process_picture()
 
-    assert len(logs) == 0
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
+    assert len(logs) == 1
+    assert camera.temp_photo    
+    assert camera.processed_image
     assert str(camera.processed_image_path).endswith("gif")
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert not ImageChops.difference(temp_img, proc_img.convert("RGB")).getbbox()
 
 
-def test_process_picture_no_overlays_exif_fails(monkeypatch, tmpdir, logs):
+def test_process_picture_no_overlays_exif_fails(monkeypatch, tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (100, 100), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     monkeypatch.setattr(
         webcam.camera.piexif,
@@ -473,21 +1040,20 @@ def test_process_picture_no_overlays_exif_fails(monkeypatch, tmpdir, logs):
 
     camera._process_picture()
 
-    assert len(logs) == 1
+    assert len(logs) == 2
     assert "Failed to copy EXIF information" in logs[0]
-    assert os.path.isfile(camera.temp_photo_path)    
-    assert os.path.isfile(camera.processed_image_path)
+    assert camera.temp_photo    
+    assert camera.processed_image
     assert str(camera.processed_image_path).endswith("jpg")
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert not ImageChops.difference(temp_img, proc_img).getbbox()
 
 
-def test_process_picture_overlay_fails(monkeypatch, tmpdir, logs):
+def test_process_picture_overlay_fails(monkeypatch, tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {'test': {}}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     monkeypatch.setattr(webcam.camera.Overlay,
                         "__init__",
@@ -495,73 +1061,70 @@ def test_process_picture_overlay_fails(monkeypatch, tmpdir, logs):
 
     camera._process_picture()
 
-    assert len(logs) == 1
+    assert len(logs) == 2
     assert "This overlay will be skipped" in logs[0]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert not ImageChops.difference(temp_img, proc_img).getbbox()
 
 
-def test_process_overlay_of_wrong_position(monkeypatch, tmpdir, logs):
+def test_process_overlay_of_wrong_position(monkeypatch, tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {'test': {}}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "The position of this overlay (test) is malformed" in logs[1]
     assert "This overlay will be skipped" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert not ImageChops.difference(temp_img, proc_img).getbbox()
 
 
-def test_process_overlay_with_no_type(monkeypatch, tmpdir, logs):
+def test_process_overlay_with_no_type(monkeypatch, tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {'top_right': {}}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "Overlay type not specified for position" in logs[1]
     assert "This overlay will be skipped" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert not ImageChops.difference(temp_img, proc_img).getbbox()
 
 
-def test_process_overlay_with_wrong_type(monkeypatch, tmpdir, logs):
+def test_process_overlay_with_wrong_type(monkeypatch, tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {'top_right': {'type': 'test'}}})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "Overlay type 'test' not recognized" in logs[1]
     assert "This overlay will be skipped" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert not ImageChops.difference(temp_img, proc_img).getbbox()
 
 
-def test_process_picture_overlay_into_picture(tmpdir, logs):
+def test_process_picture_overlay_into_picture(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_right': {
             'type': 'image',
@@ -574,28 +1137,27 @@ def test_process_picture_overlay_into_picture(tmpdir, logs):
             'over_the_picture': True,
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (1000, 1000), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (5, 5), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "Creating overlay" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height == proc_img.height
 
 
-def test_process_text_overlay_into_picture(tmpdir, logs):
+def test_process_text_overlay_into_picture(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_right': {
             'type': 'text',
@@ -604,24 +1166,23 @@ def test_process_text_overlay_into_picture(tmpdir, logs):
             'padding': 0
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (100, 100), color="#FFFFFF")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     camera._process_picture()
 
-    assert len(logs) == 1
+    assert len(logs) == 2
     assert "Creating overlay" in logs[0]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height == proc_img.height
 
 
-def test_process_text_overlay_out_of_picture(tmpdir, logs):
+def test_process_text_overlay_out_of_picture(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_right': {
             'type': 'text',
@@ -630,24 +1191,35 @@ def test_process_text_overlay_out_of_picture(tmpdir, logs):
             'padding': 0
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (100, 100), color="#FFFFFF")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     camera._process_picture()
 
-    assert len(logs) == 1
+    assert len(logs) == 2
     assert "Creating overlay" in logs[0]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height < proc_img.height # TODO Test better...
 
 
-def test_process_long_text_overlay_out_of_picture(tmpdir, logs):
+def test_process_text_overlay_keeps_font_metrics_with_the_daemon(monkeypatch, tmpdir, logs, picture_in_memory):
+    monkeypatch.setattr(webcam.fonts, "_fonts", {})
+    camera = Camera({'image': {}, 'overlays': {'top_right': {'type': 'text', 'text': 'Hi'}}})
+    camera.temp_photo = picture_in_memory(Image.new("RGB", (100, 100), color="#FFFFFF"))
+    camera._process_picture()
+    assert not os.path.exists(constants.FONT_METRICS)
+
+    open(constants.CAMERA_DAEMON_SOCKET, "w").close()
+    camera._process_picture()
+    assert os.path.exists(constants.FONT_METRICS)
+
+
+def test_process_long_text_overlay_out_of_picture(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_right': {
             'type': 'text',
@@ -655,48 +1227,46 @@ def test_process_long_text_overlay_out_of_picture(tmpdir, logs):
             'over_the_picture': False,
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (1000, 1000), color="#FFFFFF")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     camera._process_picture()
 
-    assert len(logs) == 1
+    assert len(logs) == 2
     assert "Creating overlay" in logs[0]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height < proc_img.height # TODO Test better...
 
 
-def test_process_picture_overlay_missing_file(tmpdir, logs):
+def test_process_picture_overlay_missing_file(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_right': {
             'type': 'image',
             'path': tmpdir / 'overlay.png',
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (1000, 1000), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "can't be found or is impossible to open. " \
            "This overlay will be skipped" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert not ImageChops.difference(temp_img, proc_img).getbbox()
 
 
-def test_process_picture_overlay_out_of_picture_both_above(tmpdir, logs):
+def test_process_picture_overlay_out_of_picture_both_above(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_right': {
             'type': 'image',
@@ -711,9 +1281,8 @@ def test_process_picture_overlay_out_of_picture_both_above(tmpdir, logs):
             'padding': 0
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (5, 5), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay1.png'))
@@ -722,13 +1291,13 @@ def test_process_picture_overlay_out_of_picture_both_above(tmpdir, logs):
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "Creating overlay" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert proc_img.width == 10
     assert temp_img.width == proc_img.width
@@ -736,7 +1305,7 @@ def test_process_picture_overlay_out_of_picture_both_above(tmpdir, logs):
     assert proc_img.height == 15
 
 
-def test_process_picture_overlay_out_of_picture_above_and_below(tmpdir, logs):
+def test_process_picture_overlay_out_of_picture_above_and_below(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_left': {
             'type': 'image',
@@ -751,9 +1320,8 @@ def test_process_picture_overlay_out_of_picture_above_and_below(tmpdir, logs):
             'padding': 0
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (5, 5), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay1.png'))
@@ -762,13 +1330,13 @@ def test_process_picture_overlay_out_of_picture_above_and_below(tmpdir, logs):
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "Creating overlay" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert proc_img.width == 10
     assert temp_img.width == proc_img.width
@@ -776,7 +1344,7 @@ def test_process_picture_overlay_out_of_picture_above_and_below(tmpdir, logs):
     assert proc_img.height == 18
 
 
-def test_process_picture_overlay_negative_margin_on_picture(tmpdir, logs):
+def test_process_picture_overlay_negative_margin_on_picture(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_left': {
             'type': 'image',
@@ -785,29 +1353,28 @@ def test_process_picture_overlay_negative_margin_on_picture(tmpdir, logs):
             'padding': -2
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (25, 5), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "This overlay exceeds the margin of the image itself " \
            "on the right" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height == proc_img.height
 
 
-def test_process_picture_overlay_negative_margin_out_of_picture(tmpdir, logs):
+def test_process_picture_overlay_negative_margin_out_of_picture(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_right': {
             'type': 'image',
@@ -816,29 +1383,28 @@ def test_process_picture_overlay_negative_margin_out_of_picture(tmpdir, logs):
             'padding': -2
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (25, 5), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "This overlay exceeds the margin of the image itself " \
            "on the left" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height + 3 - 2 == proc_img.height
 
 
-def test_process_picture_overlay_negative_position_on_picture(monkeypatch, tmpdir, logs):
+def test_process_picture_overlay_negative_position_on_picture(monkeypatch, tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_left': {
             'type': 'image',
@@ -847,27 +1413,26 @@ def test_process_picture_overlay_negative_position_on_picture(monkeypatch, tmpdi
             'padding': -2
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (5, 5), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 1
+    assert len(logs) == 2
     assert "Creating overlay" in logs[0]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height == proc_img.height
 
 
-def test_process_picture_overlay_negative_position_out_of_picture(monkeypatch, tmpdir, logs):
+def test_process_picture_overlay_negative_position_out_of_picture(monkeypatch, tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_left': {
             'type': 'image',
@@ -876,27 +1441,26 @@ def test_process_picture_overlay_negative_position_out_of_picture(monkeypatch, t
             'padding': -2
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (5, 5), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 1
+    assert len(logs) == 2
     assert "Creating overlay" in logs[0]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height + 3 - 2 == proc_img.height
 
 
-def test_process_picture_overlay_too_wide_on_picture(tmpdir, logs):
+def test_process_picture_overlay_too_wide_on_picture(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_left': {
             'type': 'image',
@@ -905,29 +1469,28 @@ def test_process_picture_overlay_too_wide_on_picture(tmpdir, logs):
             'padding': 0
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (25, 5), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "This overlay exceeds the margin of the image itself " \
            "on the right" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height == proc_img.height
 
 
-def test_process_picture_overlay_too_wide_out_of_picture(tmpdir, logs):
+def test_process_picture_overlay_too_wide_out_of_picture(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_left': {
             'type': 'image',
@@ -936,29 +1499,28 @@ def test_process_picture_overlay_too_wide_out_of_picture(tmpdir, logs):
             'padding': 0
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (25, 5), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "This overlay exceeds the margin of the image itself " \
            "on the right" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height + overlay_image.height == proc_img.height
 
 
-def test_process_picture_overlay_too_tall_on_picture(tmpdir, logs):
+def test_process_picture_overlay_too_tall_on_picture(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_left': {
             'type': 'image',
@@ -967,29 +1529,28 @@ def test_process_picture_overlay_too_tall_on_picture(tmpdir, logs):
             'padding': 0
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (5, 25), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 2
+    assert len(logs) == 3
     assert "Creating overlay" in logs[0]
     assert "This overlay exceeds the margin of the image itself " \
            "at the bottom" in logs[1]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height == proc_img.height
 
 
-def test_process_picture_overlay_very_tall_out_of_picture(tmpdir, logs):
+def test_process_picture_overlay_very_tall_out_of_picture(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_left': {
             'type': 'image',
@@ -998,27 +1559,26 @@ def test_process_picture_overlay_very_tall_out_of_picture(tmpdir, logs):
             'padding': 0
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (5, 25), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 1
+    assert len(logs) == 2
     assert "Creating overlay" in logs[0]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height + overlay_image.height == proc_img.height 
 
 
-def test_process_picture_overlay_specify_only_width(tmpdir, logs):
+def test_process_picture_overlay_specify_only_width(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_left': {
             'type': 'image',
@@ -1028,27 +1588,26 @@ def test_process_picture_overlay_specify_only_width(tmpdir, logs):
             'padding': 0,
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (20, 30), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 1
+    assert len(logs) == 2
     assert "Creating overlay" in logs[0]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height + (overlay_image.height/10) == proc_img.height 
 
 
-def test_process_picture_overlay_specify_only_height(tmpdir, logs):
+def test_process_picture_overlay_specify_only_height(tmpdir, logs, picture_in_memory):
     camera = Camera({'image': {}, 'overlays': {
         'top_left': {
             'type': 'image',
@@ -1058,21 +1617,20 @@ def test_process_picture_overlay_specify_only_height(tmpdir, logs):
             'padding': 0,
         }
     }})
-    camera.temp_photo_path = tmpdir / "temp_photo.jpg"
     image = Image.new("RGB", (10, 10), color="#000000")
-    image.save(str(camera.temp_photo_path))
+    camera.temp_photo = picture_in_memory(image)
 
     overlay_image = Image.new("RGBA", (30, 20), color="#FFFFFF99")
     overlay_image.save(str(tmpdir / 'overlay.png'))
 
     camera._process_picture()
 
-    assert len(logs) == 1
+    assert len(logs) == 2
     assert "Creating overlay" in logs[0]
-    assert os.path.exists(camera.temp_photo_path)    
-    assert os.path.exists(camera.processed_image_path)
-    temp_img = Image.open(str(camera.temp_photo_path))
-    proc_img = Image.open(str(camera.processed_image_path))
+    assert camera.temp_photo    
+    assert camera.processed_image
+    temp_img = open_picture(camera.temp_photo)
+    proc_img = open_picture(camera.processed_image)
     assert ImageChops.difference(temp_img, proc_img).getbbox()
     assert temp_img.width == proc_img.width
     assert temp_img.height + (overlay_image.height/10) == proc_img.height 
@@ -1081,24 +1639,30 @@ def test_process_picture_overlay_specify_only_height(tmpdir, logs):
 def test_cleanup_image_files_both(tmpdir, logs):
     camera = Camera({'image': {}})
     camera.take_picture()
+    # Left over by an older version
+    with open(camera.processed_image_path, "wb") as final_image:
+        final_image.write(camera.processed_image.getvalue())
     logs = []
 
-    assert os.path.isfile(camera.temp_photo_path)
+    assert camera.temp_photo
+    assert camera.processed_image
     assert os.path.isfile(camera.processed_image_path)
     camera.cleanup_image_files()
-    assert not os.path.exists(camera.temp_photo_path)
+    assert not camera.temp_photo
+    assert not camera.processed_image
     assert not os.path.exists(camera.processed_image_path)
     assert len(logs) == 0
     
 
-def test_cleanup_image_files_only_temp(tmpdir, logs):
+def test_cleanup_image_files_only_in_memory(tmpdir, logs):
     camera = Camera({'image': {}})
     camera.take_picture()
-    os.remove(camera.processed_image_path)
     logs = []
 
+    assert not os.path.exists(camera.processed_image_path)
     camera.cleanup_image_files()
-    assert not os.path.exists(camera.temp_photo_path)
+    assert not camera.temp_photo
+    assert not camera.processed_image
     assert not os.path.exists(camera.processed_image_path)
     assert len(logs) == 0
 
@@ -1107,7 +1671,109 @@ def test_cleanup_image_files_no_files(tmpdir, logs):
     camera = Camera({'image': {}})
 
     camera.cleanup_image_files()
-    assert not os.path.exists(camera.temp_photo_path)
+    assert not camera.temp_photo
     assert not os.path.exists(camera.processed_image_path)
     assert len(logs) == 1
     assert in_logs(logs, "Cleaning up image files")
+
+
+def test_shoot_picture_night_stacking(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {'night_stacking_frames': 4}})
+    camera.let_awb_settle_in_dark = False
+
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: None)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_luminance_from_picture',
+                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE - 10)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_low_light_search',
+                        lambda *a, **k: (30, 4 * 10**6, 100, 1))
+    captures = []
+    monkeypatch.setattr(PiCamera, 'capture', 
+        lambda self, output, format=None, **k: captures.append(self.shutter_speed) or 
+                        Image.new("RGB", (64, 48), (10, 10, 10)).save(output, format=format))
+
+    camera._shoot_picture()
+    assert len(captures) == 5
+    assert all(shutter_speed < 4 * 10**6 for shutter_speed in captures[1:])
+    assert in_logs(logs, "Stacking 4 frames")
+    assert in_logs(logs, "Night stacking: 4 frames in")
+    assert in_logs(logs, "Final luminance")
+    assert not in_logs(logs, "AWB adjusted picture not required")
+    stacked = open_picture(camera.temp_photo)
+    assert stacked.size == (64, 48)
+
+
+def test_night_stacking_uses_capture_continuous(monkeypatch, tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {'night_stacking_frames': 3}})
+    camera.temp_photo = picture_in_memory(Image.new("RGB", (64, 48), (40, 40, 40)))
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: None)
+
+    frames = []
+    class ContinuousCamera(PiCamera):
+        def capture_continuous(self, output, format=None):
+            while True:
+                frames.append(self.shutter_speed)
+                Image.new("RGB", (64, 48), (20, 20, 20)).save(output, format=format)
+                yield output
+    monkeypatch.setattr(webcam.camera, "PiCamera", ContinuousCamera)
+
+    camera._stack_night_frames(40, 3 * 10**6, 100, 40)
+    assert len(frames) == 3
+    assert frames == [frames[0]] * 3 and frames[0] < 3 * 10**6
+    # Three frames are much brighter than one
+    assert camera._luminance_from_picture(camera.temp_photo) > 40
+    assert in_logs(logs, "Noise:")
+    assert not in_logs(logs, "single exposure: unknown")
+
+
+def test_night_stacking_leaves_out_black_frames(monkeypatch, tmpdir, logs, picture_in_memory):
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: None)
+
+    def stack_frames(levels):
+        class ContinuousCamera(PiCamera):
+            def capture_continuous(self, output, format=None):
+                for level in levels:
+                    Image.new("RGB", (64, 48), (level, level, level)).save(output, format=format)
+                    yield output
+        monkeypatch.setattr(webcam.camera, "PiCamera", ContinuousCamera)
+        camera = Camera({'image': {'night_stacking_frames': len(levels)}})
+        camera.temp_photo = picture_in_memory(Image.new("RGB", (64, 48), (40, 40, 40)))
+        camera._stack_night_frames(40, 4 * 10**6, 100, 40)
+        return camera._luminance_from_picture(camera.temp_photo)
+
+    # The stack is brightened for the frames in it, as if the black ones were not taken
+    assert abs(stack_frames([20, 0, 20, 0]) - stack_frames([20, 20, 20, 20])) < 1
+    assert in_logs(logs, "Night stacking: 2 black frames left out of the stack.")
+    assert in_logs(logs, "Night stacking: 2 frames in")
+
+
+def test_night_stacking_not_needed_for_short_exposures(monkeypatch, tmpdir, logs):
+    camera = Camera({'image': {'night_stacking_frames': 4}})
+    camera.let_awb_settle_in_dark = False
+
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_luminance_from_picture',
+                        lambda *a, **k: constants.MINIMUM_DAYLIGHT_LUMINANCE - 10)
+    monkeypatch.setattr(webcam.camera.Camera,
+                        '_low_light_search',
+                        lambda *a, **k: (30, constants.NIGHT_STACKING_MIN_SHUTTER_SPEED - 1, 100, 1))
+
+    camera._shoot_picture()
+    assert not in_logs(logs, "Stacking")
+    assert in_logs(logs, "AWB adjusted picture not required")
+
+
+def test_night_stacking_failure_keeps_single_exposure(monkeypatch, tmpdir, logs, picture_in_memory):
+    camera = Camera({'image': {'night_stacking_frames': 4}})
+    single_exposure = picture_in_memory(Image.new("RGB", (64, 48), (40, 40, 40)))
+    camera.temp_photo = single_exposure
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: None)
+
+    def broken_capture(*a, **k):
+        raise ValueError("Broken camera")
+    monkeypatch.setattr(PiCamera, 'capture', broken_capture)
+
+    camera._stack_night_frames(40, 4 * 10**6, 100, 40)
+    assert camera.temp_photo is single_exposure
+    assert in_logs(logs, "Night stacking failed. Keeping the single exposure.")
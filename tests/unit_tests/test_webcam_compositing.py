@@ -0,0 +1,59 @@
+from PIL import Image, ImageChops
+
+from zanzocam.webcam.compositing import compose_picture, is_transparent
+
+
+def photo():
+    return Image.effect_noise((120, 80), 60).convert("RGB")
+
+
+def overlays():
+    return [(Image.new("RGBA", (50, 20), color=(255, 0, 0, 128)), (-10, 0)),
+            (Image.new("RGBA", (30, 30), color=(0, 0, 255, 255)), (100, 90))]
+
+
+def compose_as_before(photo, overlays, border_top, border_bottom, background_color):
+    """ How the pictures were composed before compose_picture """
+    canvas = Image.new("RGBA", (photo.width, photo.height + border_top + border_bottom), color=background_color)
+    canvas.paste(photo.convert("RGBA"), (0, border_top))
+    for overlay, position in overlays:
+        canvas.paste(overlay, position, mask=overlay)
+    return canvas
+
+
+def test_compose_without_borders_in_place():
+    original = photo()
+    picture = original.copy()
+    composed = compose_picture(picture, overlays()[:1])
+    assert composed is picture
+    assert composed.mode == "RGB"
+    expected = compose_as_before(original, overlays()[:1], 0, 0, (0, 0, 0, 0)).convert("RGB")
+    assert not ImageChops.difference(composed, expected).getbbox()
+
+
+def test_compose_with_borders():
+    original = photo()
+    composed = compose_picture(original, overlays(), 0, 40, [255, 255, 255, 0])
+    assert composed.mode == "RGB"
+    assert composed.size == (120, 120)
+    assert composed.getpixel((5, 115)) == (255, 255, 255)
+    expected = compose_as_before(original, overlays(), 0, 40, (255, 255, 255, 0)).convert("RGB")
+    assert not ImageChops.difference(composed, expected).getbbox()
+
+
+def test_compose_with_transparent_borders():
+    composed = compose_picture(photo(), overlays(), 10, 0, (0, 0, 0, 0), keep_transparency=True)
+    assert composed.mode == "RGBA"
+    assert composed.getpixel((60, 5))[3] == 0
+    assert composed.getpixel((60, 50))[3] == 255
+
+    composed = compose_picture(photo(), overlays(), 10, 0, (0, 0, 0, 255), keep_transparency=True)
+    assert composed.mode == "RGB"
+
+
+def test_is_transparent():
+    assert is_transparent((0, 0, 0, 0))
+    assert is_transparent("#FFFFFF80")
+    assert not is_transparent((0, 0, 0))
+    assert not is_transparent([0, 0, 0, 255])
+    assert not is_transparent("white")
@@ -0,0 +1,186 @@
+import os
+import pytest
+import threading
+from io import BytesIO
+from fractions import Fraction
+from PIL import Image
+
+import zanzocam.webcam as webcam
+import zanzocam.constants as constants
+from zanzocam.webcam.camera import Camera
+from zanzocam.webcam.daemon import CameraDaemon, DaemonCamera
+
+# Try to import PiCamera - unless you're running on a RPi,
+# this won't work and a mock is loaded instead
+try:
+    from picamera import PiCamera
+except ImportError as e:
+    from tests.conftest import MockPiCamera as PiCamera
+    webcam.camera.PiCamera = PiCamera
+
+from tests.conftest import in_logs
+
+
+@pytest.fixture
+def running_daemon(tmpdir):
+    daemon = CameraDaemon(socket_path=tmpdir / "data" / ".camera-daemon.sock")
+    daemon.open()
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    yield daemon
+    daemon.close()
+    thread.join(timeout=5)
+
+
+def test_connect_no_daemon(tmpdir, logs):
+    assert DaemonCamera.connect() is None
+    assert len(logs) == 0
+
+
+def test_connect_dead_socket(tmpdir, logs):
+    with open(constants.CAMERA_DAEMON_SOCKET, "w") as s:
+        s.write("not a socket")
+    assert DaemonCamera.connect() is None
+    assert in_logs(logs, "the daemon can't be reached")
+
+
+def test_daemon_info(running_daemon, logs):
+    with DaemonCamera.connect() as camera:
+        assert camera.is_warm
+        assert camera.MAX_RESOLUTION.width == 10000
+        assert camera.MAX_RESOLUTION.height == 10000
+
+
+def test_daemon_capture_to_path(running_daemon, tmpdir, logs):
+    with DaemonCamera.connect() as camera:
+        camera.resolution = (64, 48)
+        camera.capture(str(tmpdir / "picture.jpg"))
+    picture = Image.open(str(tmpdir / "picture.jpg"))
+    assert picture.format == "JPEG"
+    assert picture.size == (64, 48)
+
+
+def test_daemon_capture_to_stream(running_daemon, logs):
+    stream = BytesIO()
+    with DaemonCamera.connect() as camera:
+        camera.capture(stream, format="png")
+    stream.seek(0)
+    assert Image.open(stream).format == "PNG"
+
+
+def test_daemon_settings_are_forwarded(running_daemon, logs):
+    with DaemonCamera.connect(expanded_framerate_range=True) as camera:
+        camera.iso = 400
+        camera.shutter_speed = 2 * 10**6
+        camera.exposure_mode = "off"
+        camera.capture(BytesIO(), format="jpeg")
+        assert running_daemon.camera.iso == 400
+        assert running_daemon.camera.shutter_speed == 2 * 10**6
+        assert running_daemon.camera.exposure_mode == "off"
+        assert running_daemon.camera.framerate_range[0] <= 0.1
+
+
+def test_daemon_forwards_the_readings(running_daemon, logs):
+    running_daemon.camera.exposure_speed = 250000
+    running_daemon.camera.analog_gain = Fraction(1573, 1000)
+    running_daemon.camera.digital_gain = 1.25
+    running_daemon.camera.awb_gains = (Fraction(3, 2), Fraction(7, 5))
+    with DaemonCamera.connect() as camera:
+        camera.capture(BytesIO(), format="jpeg")
+        assert camera.exposure_speed == 250000
+        assert camera.analog_gain == Fraction(1573, 1000)
+        assert camera.digital_gain == Fraction(5, 4)
+        assert camera.awb_gains == (Fraction(3, 2), Fraction(7, 5))
+        # Measured, not the requested ones
+        assert Camera._camera_exposure(camera) == (250000, 197)
+
+
+def test_daemon_applies_the_settings_when_assigned(running_daemon, monkeypatch, logs):
+    with DaemonCamera.connect() as camera:
+        camera.iso = 400
+        # Applied before any capture, so the gains can settle on them
+        assert running_daemon.camera.iso == 400
+        assert running_daemon.camera.exposure_mode == "auto"
+        camera.exposure_mode = "off"
+        assert running_daemon.camera.exposure_mode == "off"
+        assert camera.iso == 400
+
+        monkeypatch.setattr(running_daemon.camera, "capture",
+                            lambda *a, **k: pytest.fail("Should not capture"))
+        camera.shutter_speed = 10**6
+        assert running_daemon.camera.shutter_speed == 10**6
+
+
+def test_daemon_settings_fail(running_daemon, monkeypatch, logs):
+    def fail(settings):
+        raise ValueError("Invalid ISO")
+    monkeypatch.setattr(running_daemon, "_apply_settings", fail)
+    with DaemonCamera.connect() as camera:
+        with pytest.raises(RuntimeError, match="failed to apply the settings: Invalid ISO"):
+            camera.iso = 12345
+        assert camera.iso is None
+
+
+def test_shoot_picture_through_daemon(running_daemon, monkeypatch, tmpdir, logs):
+    monkeypatch.setattr(webcam.camera, "sleep", lambda *a: pytest.fail("Should not sleep"))
+    camera = Camera({'image': {'use_low_light_algorithm': False}})
+    camera._shoot_picture()
+    assert in_logs(logs, "Using the camera daemon")
+    assert in_logs(logs, "no warm-up needed")
+    assert camera.temp_photo
+
+
+def test_daemon_camera_is_warm_until_the_exposure_changes(running_daemon, logs):
+    with DaemonCamera.connect(expanded_framerate_range=True) as camera:
+        camera.resolution = (64, 48)
+        camera.iso = 0
+        camera.exposure_mode = "auto"
+        assert camera.is_warm
+        camera.iso = 400
+        assert not camera.is_warm
+
+
+def test_warm_up_after_iso_change_through_daemon(running_daemon, monkeypatch, tmpdir, logs):
+    sleeps = []
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: sleeps.append(t))
+    running_daemon.camera.exposure_speed = 33000
+    running_daemon.camera.analog_gain = Fraction(4, 1)
+    running_daemon.camera.digital_gain = Fraction(1, 1)
+    running_daemon.camera.awb_gains = (Fraction(3, 2), Fraction(7, 5))
+
+    with Camera({'image': {}})._prepare_camera_object(expanded_framerate_range=True) as camera:
+        Camera._camera_warm_up(camera)
+        assert not sleeps
+        camera.iso = 400
+        Camera._camera_warm_up(camera)
+
+    # The readings are polled through the daemon
+    assert in_logs(logs, "no warm-up needed")
+    assert in_logs(logs, "Camera warm-up: settled in")
+    assert len(sleeps) == constants.CAMERA_SETTLE_STABLE_POLLS
+
+
+def test_night_stacking_through_daemon(running_daemon, monkeypatch, tmpdir, logs):
+    monkeypatch.setattr(webcam.camera, "sleep", lambda t: None)
+    monkeypatch.setattr(running_daemon.camera, "capture_continuous",
+                        lambda *a, **k: pytest.fail("The daemon captures one picture at a time"),
+                        raising=False)
+    captures = []
+    capture = running_daemon.camera.capture
+    monkeypatch.setattr(running_daemon.camera, "capture",
+                        lambda *a, **k: captures.append(a) or capture(*a, **k))
+
+    camera = Camera({'image': {'night_stacking_frames': 3}})
+    camera.temp_photo = BytesIO()
+    Image.new("RGB", (64, 48), (40, 40, 40)).save(camera.temp_photo, format="JPEG")
+    camera._stack_night_frames(40, 3 * 10**6, 100, 40)
+
+    assert len(captures) == 3
+    assert in_logs(logs, "Night stacking: 3 frames in")
+
+
+def test_shoot_picture_daemon_disabled(running_daemon, tmpdir, logs):
+    camera = Camera({'image': {'use_camera_daemon': False, 'use_low_light_algorithm': False}})
+    camera._shoot_picture()
+    assert not in_logs(logs, "Using the camera daemon")
+    assert in_logs(logs, "Camera warm-up")
@@ -0,0 +1,92 @@
+import pytest
+from io import BytesIO
+from PIL import Image, ImageChops
+
+from zanzocam.webcam import encoders
+
+
+def test_image_format():
+    assert encoders.image_format("jpg") == "JPEG"
+    assert encoders.image_format("JPEG") == "JPEG"
+    assert encoders.image_format("webp") == "WEBP"
+    assert encoders.image_format("png") == "PNG"
+    assert encoders.image_format("gif") == "GIF"
+
+
+def test_supported_extensions():
+    assert encoders.is_supported("jpg")
+    assert encoders.is_supported("png")
+    assert not encoders.is_supported("nonsense")
+    assert "jpg" in encoders.supported_extensions()
+
+
+def test_encode_jpeg_options():
+    image = Image.effect_noise((256, 256), 60).convert("RGB")
+
+    baseline = BytesIO()
+    assert encoders.encode(image, baseline, "jpg", {"quality": 80}) == "JPEG"
+    optimized = BytesIO()
+    encoders.encode(image, optimized, "jpg", {"quality": 80, "optimize": True})
+    progressive = BytesIO()
+    encoders.encode(image, progressive, "jpg", {"quality": 80, "progressive": True})
+
+    assert len(optimized.getvalue()) < len(baseline.getvalue())
+    progressive.seek(0)
+    assert Image.open(progressive).info.get("progressive")
+    # Optimized Huffman tables are lossless
+    optimized.seek(0)
+    baseline.seek(0)
+    assert not ImageChops.difference(Image.open(baseline), Image.open(optimized)).getbbox()
+
+
+def test_encode_jpeg_drops_alpha():
+    picture = BytesIO()
+    encoders.encode(Image.new("RGBA", (10, 10)), picture, "jpeg")
+    picture.seek(0)
+    assert Image.open(picture).mode == "RGB"
+
+
+def test_encode_jpeg_does_not_copy_rgb_images(monkeypatch):
+    image = Image.new("RGB", (16, 16))
+    monkeypatch.setattr(Image.Image, "convert", lambda *a, **k: 1/0)
+    encoders.encode(image, BytesIO(), "jpg")
+
+
+def test_keeps_transparency():
+    assert encoders.keeps_transparency("png")
+    assert encoders.keeps_transparency("WEBP")
+    assert not encoders.keeps_transparency("jpg")
+
+
+def test_encode_webp():
+    if not encoders.is_supported("webp"):
+        pytest.skip("This Pillow build has no WebP support")
+    picture = BytesIO()
+    assert encoders.encode(Image.new("RGB", (10, 10)), picture, "webp", {"webp_method": 0}) == "WEBP"
+    picture.seek(0)
+    assert Image.open(picture).format == "WEBP"
+
+
+def test_encode_other_formats():
+    picture = BytesIO()
+    assert encoders.encode(Image.new("RGBA", (10, 10)), picture, "png") == "PNG"
+    picture.seek(0)
+    assert Image.open(picture).mode == "RGBA"
+
+
+def test_encode_unsupported_format():
+    with pytest.raises(ValueError):
+        encoders.encode(Image.new("RGB", (10, 10)), BytesIO(), "nonsense")
+
+
+def test_register_encoder(monkeypatch):
+    monkeypatch.setattr(encoders, "ENCODERS", dict(encoders.ENCODERS))
+    calls = []
+    def encoder(image, output, options):
+        calls.append(options["quality"])
+        image.save(output, format="PNG")
+
+    encoders.register_encoder("pic", "png", encoder)
+    picture = BytesIO()
+    assert encoders.encode(Image.new("RGB", (10, 10)), picture, "pic", {"quality": 42}) == "PNG"
+    assert calls == [42]
@@ -0,0 +1,131 @@
+import json
+from datetime import datetime, timedelta
+
+import zanzocam.constants as constants
+from zanzocam.webcam.exposure_memory import ExposureMemory
+
+from tests.conftest import in_logs
+
+
+def entry(time: datetime, initial_luminance: float = 10, shutter_speed: int = 10**6,
+          iso: int = 400, luminance: float = 40):
+    return {
+        "time": time.strftime(constants.EXPOSURE_MEMORY_TIME_FORMAT),
+        "initial_luminance": initial_luminance,
+        "shutter_speed": shutter_speed,
+        "iso": iso,
+        "luminance": luminance,
+    }
+
+
+def write_memory(entries):
+    with open(constants.EXPOSURE_MEMORY, "w") as memory_file:
+        json.dump(entries, memory_file)
+
+
+def test_memory_missing_file(tmpdir, logs):
+    memory = ExposureMemory()
+    assert memory.entries == []
+    assert len(logs) == 0
+
+
+def test_memory_corrupted_file(tmpdir, logs):
+    with open(constants.EXPOSURE_MEMORY, "w") as memory_file:
+        memory_file.write("not json")
+    memory = ExposureMemory()
+    assert memory.entries == []
+    assert in_logs(logs, "Could not read the exposure memory")
+
+
+def test_memory_not_a_list(tmpdir, logs):
+    write_memory({"time": "2021-01-01 10:00:00"})
+    memory = ExposureMemory()
+    assert memory.entries == []
+    assert in_logs(logs, "Could not read the exposure memory")
+
+
+def test_memory_skips_malformed_entries(tmpdir, logs):
+    now = datetime.now()
+    fresh = entry(now - timedelta(days=1))
+    bad_time = {**fresh, "time": "yesterday"}
+    truncated = {"time": fresh["time"], "initial_luminance": 10}
+    write_memory([bad_time, fresh, truncated, "not an entry"])
+
+    memory = ExposureMemory()
+    assert memory.entries == [fresh]
+    assert len([log for log in logs if "Malformed entry in the exposure memory" in log]) == 3
+
+
+def test_memory_drops_stale_entries(tmpdir, logs):
+    now = datetime.now()
+    fresh = entry(now - timedelta(days=1))
+    stale = entry(now - timedelta(days=constants.EXPOSURE_MEMORY_MAX_AGE + 1))
+    write_memory([stale, fresh])
+    assert ExposureMemory().entries == [fresh]
+
+
+def test_memory_remember_and_reload(tmpdir, logs):
+    now = datetime.now()
+    memory = ExposureMemory()
+    memory.remember(10, 2*10**6, 400, 40, now=now)
+    assert in_logs(logs, "Exposure memory updated")
+
+    reloaded = ExposureMemory()
+    assert len(reloaded.entries) == 1
+    assert reloaded.entries[0]["shutter_speed"] == 2*10**6
+    assert reloaded.find(10, now=now) == reloaded.entries[0]
+
+
+def test_memory_max_entries(tmpdir, monkeypatch, logs):
+    monkeypatch.setattr(constants, "EXPOSURE_MEMORY_MAX_ENTRIES", 3)
+    monkeypatch.setattr("zanzocam.webcam.exposure_memory.EXPOSURE_MEMORY_MAX_ENTRIES", 3)
+    memory = ExposureMemory()
+    for shutter_speed in range(1, 6):
+        memory.remember(10, shutter_speed, 400, 40)
+    assert [e["shutter_speed"] for e in ExposureMemory().entries] == [3, 4, 5]
+
+
+def test_find_filters_by_time_of_day(tmpdir, logs):
+    now = datetime(2021, 1, 10, 23, 50)
+    far = entry(datetime(2021, 1, 9, 20, 0))
+    across_midnight = entry(datetime(2021, 1, 9, 0, 20))
+    memory = ExposureMemory()
+    memory.entries = [far, across_midnight]
+    assert memory.find(10, now=now) == across_midnight
+
+
+def test_find_filters_by_luminance(tmpdir, logs):
+    now = datetime(2021, 1, 10, 22, 0)
+    memory = ExposureMemory()
+    memory.entries = [entry(now - timedelta(days=1), initial_luminance=50)]
+    assert memory.find(10, now=now) is None
+    assert memory.find(40, now=now)
+
+
+def test_find_prefers_closest_match(tmpdir, logs):
+    now = datetime(2021, 1, 10, 22, 0)
+    close = entry(now - timedelta(days=1), initial_luminance=10)
+    less_close = entry(now - timedelta(days=1, minutes=30), initial_luminance=15)
+    memory = ExposureMemory()
+    memory.entries = [less_close, close]
+    assert memory.find(10, now=now) == close
+
+
+def test_seed_no_match(tmpdir, logs):
+    assert ExposureMemory().seed(10, 40) is None
+    assert len(logs) == 1
+    assert "0 entries, none matching" in logs[0]
+
+
+def test_seed_scales_shutter_speed(tmpdir, logs):
+    now = datetime(2021, 1, 10, 22, 0)
+    memory = ExposureMemory()
+    memory.entries = [entry(now - timedelta(days=1), initial_luminance=10,
+                            shutter_speed=2*10**6, iso=800, luminance=40)]
+
+    # Half the ambient light and the same target: twice the exposure
+    assert memory.seed(5, 40, now=now) == (4*10**6, 800)
+    assert in_logs(logs, "best match")
+
+    # Never beyond the hardware limits
+    assert memory.seed(5, 400, now=now) == (constants.MAX_SHUTTER_SPEED, 800)
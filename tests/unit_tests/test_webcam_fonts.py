@@ -0,0 +1,133 @@
+import json
+import random
+import string
+import pytest
+
+import zanzocam.constants as constants
+from zanzocam.webcam import fonts
+from zanzocam.webcam.fonts import get_font, load_metrics, save_metrics
+
+from conftest import in_logs
+
+
+def forget_fonts(monkeypatch):
+    """ Like a new run of ZanzoCam """
+    monkeypatch.setattr(fonts, "_fonts", {})
+    monkeypatch.setattr(fonts, "_stored_advances", None)
+
+
+@pytest.fixture(autouse=True)
+def empty_font_cache(monkeypatch):
+    forget_fonts(monkeypatch)
+
+
+def test_fonts_are_loaded_once(logs):
+    font = get_font(20)
+    assert get_font(20) is font
+    assert get_font(21) is not font
+    assert font.font.size == 20
+    assert not logs
+
+
+def test_width_is_exact():
+    metrics = get_font(30)
+    for text in ["", "a", "AVAWAY", "jaw", "Hello world ", "18 ottobre 2026 - 12:30"]:
+        assert metrics.width(text) == metrics.font.getsize(text)[0]
+    assert "AVAWAY" in metrics.widths
+
+
+@pytest.mark.parametrize("size", [8, 15, 30, 60])
+def test_fits_agrees_with_the_exact_width(size):
+    random.seed(size)
+    metrics = get_font(size)
+    glyphs = string.ascii_letters + string.digits + " .,:;-°%/()'àèéòù"
+    for _ in range(300):
+        text = "".join(random.choice(glyphs) for _ in range(random.randint(1, 60)))
+        width = metrics.font.getsize(text)[0]
+        for limit in (width - 1, width, width + size // 2, width + 2 * size):
+            assert metrics.fits(text, limit) == (width <= limit)
+
+
+def test_metrics_are_kept_between_runs(monkeypatch, logs):
+    metrics = get_font(25)
+    metrics.estimate_width("Hello")
+    assert metrics.new_glyphs
+    save_metrics()
+    assert not metrics.new_glyphs
+    stored = load_metrics()
+    assert set(stored[f"{constants.FONT_PATH}:25"]["advances"]) == set("Helo")
+
+    forget_fonts(monkeypatch)
+    metrics = get_font(25)
+    assert set(metrics.advances) == set("Helo")
+    assert metrics.advance("H") == metrics.font.getlength("H")
+    assert not metrics.new_glyphs
+    assert not logs
+
+
+def test_nothing_saved_without_new_glyphs():
+    get_font(25)
+    save_metrics()
+    assert not constants.FONT_METRICS.exists()
+
+
+def test_metrics_of_a_changed_font_are_discarded(monkeypatch):
+    with open(constants.FONT_METRICS, "w") as metrics_file:
+        json.dump({f"{constants.FONT_PATH}:25": {"signature": "0-0", "advances": {"H": 1000}}},
+                  metrics_file)
+    assert get_font(25).advance("H") < 1000
+
+
+def test_unreadable_metrics_are_reset(logs):
+    with open(constants.FONT_METRICS, "w") as metrics_file:
+        metrics_file.write("{not json")
+    metrics = get_font(25)
+    assert not metrics.advances
+    assert in_logs(logs, "Could not read the font metrics. They will be reset.")
+
+
+def wrap_by_measuring_every_line(font, text, max_width):
+    """ How the text was wrapped before FontMetrics.wrap """
+    lines = []
+    for line in text.split("\n"):
+        if font.getsize(line)[0] <= max_width:
+            lines.append(line)
+        else:
+            new_line = ""
+            for word in line.split(" "):
+                if font.getsize(new_line + word)[0] <= max_width:
+                    new_line = new_line + word + " "
+                else:
+                    lines.append(new_line)
+                    new_line = word + " "
+            if new_line != "":
+                lines.append(new_line)
+    return lines
+
+
+@pytest.mark.parametrize("size", [10, 25, 40])
+def test_wrap_as_before(size):
+    random.seed(size)
+    metrics = get_font(size)
+    for _ in range(100):
+        words = ["".join(random.choice(string.ascii_letters + ".,àé") for _ in range(random.randint(0, 8)))
+                    for _ in range(random.randint(1, 50))]
+        text = " ".join(words).replace("a ", "a\n")
+        max_width = max(metrics.width(word) for word in words) + random.randint(0, 400)
+
+        lines, widths = metrics.wrap(text, max_width)
+        assert lines == wrap_by_measuring_every_line(metrics.font, text, max_width)
+        assert widths == [metrics.font.getsize(line)[0] for line in lines]
+
+
+def test_wrap_breaks_long_words():
+    metrics = get_font(30)
+    lines, widths = metrics.wrap("a Supercalifragilisticexpialidocious word", 200)
+    assert len(lines) > 3
+    assert lines[0] == "a "
+    assert "".join(lines[1:]) == "Supercalifragilisticexpialidocious word "
+    assert all(width <= 200 for width in widths)
+
+    # A glyph wider than the line still gets its own line
+    lines, widths = metrics.wrap("WWW", 5)
+    assert lines == ["W", "W", "W "]
@@ -1,3 +1,4 @@
+import json
 from unittest import mock
 from freezegun import freeze_time
 
@@ -215,3 +216,34 @@ def test_main_fail_cleanup_image_files(mock_modules_apart_config, monkeypatch, l
     assert not in_logs(logs, "old_test_config")
     assert in_logs(logs, "new_test_config")
     assert in_logs(logs, "Execution completed with errors")
+
+
+@freeze_time("2021-01-01 10:00:00")
+def test_main_saves_run_record(mock_modules, monkeypatch, logs):
+    with open(str(constants.CONFIGURATION_FILE), 'w') as c:
+        c.write('{"something": "present"}')
+
+    main()
+    assert in_logs(logs, "Run record: {")
+    with open(constants.RUN_RECORD, 'r') as r:
+        record = json.load(r)
+    assert record["successful"] is True
+    phases = [phase["phase"] for phase in record["phases"]]
+    assert phases[:3] == ["status check", "locale setup", "config load"]
+    assert "upload" in phases
+    assert (constants.CAMERA_LOGS / "run 01-01-2021 10:00:00.json").exists()
+
+
+@freeze_time("2021-01-01 10:00:00")
+def test_main_skips_upload_of_unchanged_scene(mock_modules, monkeypatch, logs):
+    with open(str(constants.CONFIGURATION_FILE), 'w') as c:
+        c.write('{"something": "present"}')
+    with open(str(constants.SEND_LOGS_FLAG), 'w') as f:
+        f.write('NO')
+    monkeypatch.setattr(webcam.main.SceneChange, 'should_upload', lambda *a, **k: False)
+
+    main()
+    assert not in_logs(logs, "[TEST] uploading picture - mocked")
+    assert in_logs(logs, "[TEST] uploading logs - mocked")
+    assert constants.SCENE_CHANGE_HEARTBEAT.exists()
+    assert in_logs(logs, "Execution completed successfully")
@@ -0,0 +1,88 @@
+import math
+from pathlib import Path
+import numpy as np
+from PIL import Image, ImageStat
+
+from zanzocam.webcam.metering import (luminance_from_picture, luminance_from_histograms, 
+        linear_light, histogram_percentile, clipped_fraction, predict_luminance, exposure_gain)
+
+
+EXIF_SOURCE = Path(__file__).parent.parent / "exif-source.jpg"
+
+
+def test_luminance_white_picture(picture_in_memory):
+    picture = picture_in_memory(Image.new("RGB", (640, 480), (255, 255, 255)))
+    assert luminance_from_picture(picture) > 254
+
+
+def test_luminance_black_picture(picture_in_memory):
+    picture = picture_in_memory(Image.new("RGB", (640, 480), (0, 0, 0)))
+    assert luminance_from_picture(picture) < 1
+
+
+def test_luminance_matches_full_decode():
+    photo = Image.open(EXIF_SOURCE)
+    r, g, b = ImageStat.Stat(photo).mean
+    expected = math.sqrt(0.241*(r**2) + 0.691*(g**2) + 0.068*(b**2))
+
+    assert abs(luminance_from_picture(EXIF_SOURCE, scale=1) - expected) < 0.001
+    assert abs(luminance_from_picture(EXIF_SOURCE) - expected) < 0.5
+
+
+def test_luminance_from_path_string():
+    assert luminance_from_picture(str(EXIF_SOURCE)) == luminance_from_picture(EXIF_SOURCE)
+
+
+def test_luminance_rewinds_buffer(picture_in_memory):
+    picture = picture_in_memory(Image.new("RGB", (640, 480), (100, 100, 100)))
+    luminance_from_picture(picture)
+    assert picture.tell() == 0
+    assert Image.open(picture).size == (640, 480)
+
+
+def test_luminance_not_jpeg(picture_in_memory):
+    picture = picture_in_memory(Image.new("RGBA", (64, 48), (100, 100, 100, 255)), format="PNG")
+    assert abs(luminance_from_picture(picture) - 100) < 0.5
+
+
+def test_linear_light():
+    assert linear_light(0) == 0
+    assert abs(linear_light(255) - 1) < 0.0001
+    assert abs(linear_light(255 * 4.5 * 0.01) - 0.01) < 0.0001
+    assert abs(linear_light(255 * (1.099 * 0.5 ** 0.45 - 0.099)) - 0.5) < 0.0001
+
+
+def uniform_histograms(level: int, pixels: int = 1000):
+    histograms = np.zeros((3, 256))
+    histograms[:, level] = pixels
+    return histograms
+
+
+def test_luminance_from_histograms():
+    assert abs(luminance_from_histograms(uniform_histograms(100)) - 100) < 0.001
+
+
+def test_histogram_percentile_and_clipping():
+    histograms = uniform_histograms(10, pixels=98)
+    histograms[:, 255] = 2
+    assert histogram_percentile(histograms, 50) == 10
+    assert histogram_percentile(histograms, 99) == 255
+    assert abs(clipped_fraction(histograms) - 0.02) < 0.0001
+
+
+def test_predict_luminance():
+    histograms = uniform_histograms(50)
+    assert abs(predict_luminance(histograms, 1) - 50) < 1
+    assert predict_luminance(histograms, 2) > 50
+    # Saturated pixels stay saturated
+    assert abs(predict_luminance(uniform_histograms(255), 0.5) - 255) < 0.001
+
+
+def test_exposure_gain():
+    gain = exposure_gain(uniform_histograms(20), 40)
+    assert abs(gain - linear_light(40) / linear_light(20)) < 0.1
+    assert abs(predict_luminance(uniform_histograms(20), gain) - 40) < 1
+
+
+def test_luminance_from_pil_image():
+    assert abs(luminance_from_picture(Image.new("RGB", (64, 48), (100, 100, 100))) - 100) < 0.001
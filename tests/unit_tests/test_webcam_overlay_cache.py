@@ -0,0 +1,157 @@
+import os
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from freezegun import freeze_time
+from PIL import Image, ImageChops
+
+import zanzocam.constants as constants
+from zanzocam.webcam.overlay_cache import OverlayCache
+from zanzocam.webcam.overlays import Overlay
+from zanzocam.webcam.fonts import FontMetrics
+
+from conftest import in_logs
+
+
+def overlay_image(color, size=(40, 20)):
+    return Image.new("RGBA", size, color=color)
+
+
+def test_store_and_load(logs):
+    cache = OverlayCache()
+    key = OverlayCache.key({"type": "text"}, 100)
+    assert cache.load(key) is None
+
+    cache.store(key, overlay_image((255, 0, 0, 128)))
+    loaded = cache.load(key)
+    assert loaded.size == (40, 20)
+    assert not ImageChops.difference(loaded, overlay_image((255, 0, 0, 128))).getbbox()
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not logs
+
+
+def test_same_overlay_stored_by_several_threads(logs):
+    cache = OverlayCache()
+    layout = {"lines": ["Rifugio"]}
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: cache.store("abc", overlay_image("red"), layout), range(32)))
+
+    assert not logs
+    assert sorted(os.listdir(constants.OVERLAY_CACHE)) == ["abc-40x20.rgba", "abc.json"]
+    assert not ImageChops.difference(cache.load("abc"), overlay_image("red")).getbbox()
+    assert cache.load_layout("abc") == layout
+
+
+def test_keys_depend_on_everything():
+    assert OverlayCache.key({"text": "a"}, 100) == OverlayCache.key({"text": "a"}, 100)
+    assert OverlayCache.key({"text": "a"}, 100) != OverlayCache.key({"text": "b"}, 100)
+    assert OverlayCache.key({"text": "a"}, 100) != OverlayCache.key({"text": "a"}, 101)
+
+
+def test_corrupted_overlay_is_a_miss(logs):
+    cache = OverlayCache()
+    cache.store("abc", overlay_image("red"))
+    with open(constants.OVERLAY_CACHE / "abc-40x20.rgba", "wb") as cached_file:
+        cached_file.write(b"short")
+
+    assert cache.load("abc") is None
+    assert cache.misses == 1
+    assert not os.path.exists(constants.OVERLAY_CACHE / "abc-40x20.rgba")
+    assert in_logs(logs, "Could not load the overlay from the cache")
+
+
+def test_evict_least_recently_used():
+    cache = OverlayCache(max_size=2 * 40 * 20 * 4)
+    for age, key in enumerate(["used", "old", "new"]):
+        cache.store(key, overlay_image("red"))
+        # Stored 30, 20 and 10 minutes ago
+        mtime = time.time() - (3 - age) * 600
+        os.utime(constants.OVERLAY_CACHE / f"{key}-40x20.rgba", (mtime, mtime))
+    cache.load("used")
+
+    cache.evict()
+    assert sorted(os.listdir(constants.OVERLAY_CACHE)) == ["new-40x20.rgba", "used-40x20.rgba"]
+
+
+def test_static_text_overlay_is_cached(logs):
+    cache = OverlayCache()
+    data = {"type": "text", "text": "Hello", "font_size": 20}
+    first = Overlay("top_left", data, 200, 100, None, None, cache=cache)
+    second = Overlay("top_left", data, 200, 100, None, None, cache=cache)
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not ImageChops.difference(first.rendered_image, second.rendered_image).getbbox()
+
+    # A different picture width is a different overlay
+    Overlay("top_left", data, 300, 100, None, None, cache=cache)
+    assert cache.misses == 2
+
+
+def dynamic_overlay(text, width=400, cache=None, font_size=20):
+    data = {"type": "text", "text": text, "font_size": font_size, "background_color": (0, 0, 255, 100)}
+    return Overlay("top_left", data, width, 100, "%d %B %Y", "%H:%M", cache=cache)
+
+
+@pytest.mark.parametrize("text", [
+    "%%TIME",
+    "Webcam of the Lago di Garda, one of the most beautiful lakes in the world, by the Rifugio %%DATE %%TIME",
+    "Just a caption\r\nLast picture: %%TIME\nAnother caption, with descenders: gjpqy",
+    "%%TIME - Àccents on tòp\nÉÈÊ",
+])
+def test_text_overlay_with_time_is_updated(text):
+    cache = OverlayCache()
+    with freeze_time("2021-01-01 12:30:00"):
+        dynamic_overlay(text, cache=cache)
+    assert cache.misses == 1
+    with freeze_time("2021-01-01 12:31:00"):
+        updated = dynamic_overlay(text, cache=cache)
+        drawn_again = dynamic_overlay(text)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert "12:31" in updated.text
+    assert not ImageChops.difference(updated.rendered_image, drawn_again.rendered_image).getbbox()
+
+
+def test_text_overlay_is_drawn_again_if_the_layout_changes():
+    cache = OverlayCache()
+    text = "Today is %%DATE"
+    with freeze_time("2021-05-01 12:30:00"):
+        first = dynamic_overlay(text, cache=cache)
+    with freeze_time("2021-09-01 12:30:00"):
+        # 'September' is longer than 'May'
+        updated = dynamic_overlay(text, cache=cache)
+        drawn_again = dynamic_overlay(text)
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert updated.rendered_image.width > first.rendered_image.width
+    assert not ImageChops.difference(updated.rendered_image, drawn_again.rendered_image).getbbox()
+
+
+def test_paragraphs_that_did_not_change_are_not_wrapped_again(monkeypatch):
+    cache = OverlayCache()
+    text = "A long static caption that needs to be wrapped on a narrow picture\n%%TIME"
+    with freeze_time("2021-01-01 12:30:00"):
+        dynamic_overlay(text, width=200, cache=cache)
+
+    wrapped = []
+    original_wrap = FontMetrics.wrap
+    monkeypatch.setattr(FontMetrics, "wrap", lambda self, text, width: wrapped.append(text) or original_wrap(self, text, width))
+    with freeze_time("2021-01-01 12:31:00"):
+        dynamic_overlay(text, width=200, cache=cache)
+    assert wrapped == ["12:31"]
+
+
+def test_image_overlay_is_cached_until_it_changes():
+    cache = OverlayCache()
+    source = constants.IMAGE_OVERLAYS_PATH / "logo.png"
+    Image.new("RGBA", (30, 30), color="red").save(source)
+    data = {"type": "image", "path": "logo.png", "width": 15}
+
+    Overlay("bottom_right", data, 200, 100, None, None, cache=cache)
+    overlay = Overlay("bottom_right", data, 200, 100, None, None, cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert overlay.rendered_image.getpixel((15, 15)) == (255, 0, 0, 255)
+
+    Image.new("RGBA", (30, 30), color="blue").save(source)
+    os.utime(source, (time.time() + 10, time.time() + 10))
+    overlay = Overlay("bottom_right", data, 200, 100, None, None, cache=cache)
+    assert cache.misses == 2
+    assert overlay.rendered_image.getpixel((15, 15)) == (0, 0, 255, 255)
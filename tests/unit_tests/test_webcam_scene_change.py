@@ -0,0 +1,119 @@
+import random
+from io import BytesIO
+from PIL import Image, ImageDraw
+
+import zanzocam.constants as constants
+from zanzocam.webcam.scene_change import SceneChange, picture_fingerprint, fingerprint_difference
+
+from tests.conftest import in_logs
+
+
+def scene(seed: int, object_position: int = 10) -> BytesIO:
+    """ A dark, noisy scene with a bright object """
+    generator = random.Random(seed)
+    image = Image.new("L", (320, 240))
+    image.putdata([generator.randint(20, 40) for _ in range(320 * 240)])
+    ImageDraw.Draw(image).rectangle((object_position, 100, object_position + 60, 160), fill=200)
+    picture = BytesIO()
+    image.convert("RGB").save(picture, format="JPEG")
+    picture.seek(0)
+    return picture
+
+
+def test_fingerprint_ignores_noise():
+    first = picture_fingerprint(scene(seed=1))
+    assert len(first) == 32 * 24
+    assert fingerprint_difference(first, picture_fingerprint(scene(seed=2))) < 1
+    assert fingerprint_difference(first, picture_fingerprint(scene(seed=1, object_position=200))) > 5
+
+
+def test_fingerprint_of_pil_image_and_rewind():
+    picture = scene(seed=1)
+    picture_fingerprint(picture)
+    assert picture.tell() == 0
+    # Decoded in full instead of in draft mode: nearly the same
+    assert fingerprint_difference(picture_fingerprint(Image.open(picture)), picture_fingerprint(picture)) < 1
+
+
+def test_fingerprint_difference_of_different_sizes():
+    assert fingerprint_difference([1, 2], [1, 2, 3]) == 255
+
+
+def test_threshold_zero_disables_the_check(logs):
+    scene_change = SceneChange()
+    assert scene_change.should_upload(scene(1), 0, 10)
+    scene_change.uploaded()
+    assert not constants.SCENE_CHANGE_STATE.exists()
+    assert len(logs) == 0
+
+
+def test_first_picture_is_uploaded(logs):
+    scene_change = SceneChange()
+    assert scene_change.should_upload(scene(1), 5, 10)
+    assert in_logs(logs, "no previous picture to compare with")
+    scene_change.uploaded()
+    assert constants.SCENE_CHANGE_STATE.exists()
+
+
+def test_unchanged_scene_is_skipped_until_max_skipped(logs):
+    scene_change = SceneChange()
+    scene_change.should_upload(scene(1), 5, 2)
+    scene_change.uploaded()
+
+    for seed in range(2, 4):
+        scene_change = SceneChange()
+        assert not scene_change.should_upload(scene(seed), 5, 2)
+        scene_change.skipped_upload()
+
+    scene_change = SceneChange()
+    assert scene_change.skipped == 2
+    assert scene_change.should_upload(scene(4), 5, 2)
+    assert in_logs(logs, "Uploading anyway")
+    scene_change.uploaded()
+    assert SceneChange().skipped == 0
+
+
+def test_changed_scene_is_uploaded(logs):
+    scene_change = SceneChange()
+    scene_change.should_upload(scene(1), 5, 2)
+    scene_change.uploaded()
+
+    assert SceneChange().should_upload(scene(2, object_position=200), 5, 2)
+    assert in_logs(logs, "the scene changed")
+
+
+def test_settings_given_as_strings(logs):
+    scene_change = SceneChange()
+    scene_change.should_upload(scene(1), "5", "1")
+    scene_change.uploaded()
+
+    scene_change = SceneChange()
+    assert not scene_change.should_upload(scene(2), "5", "1")
+    scene_change.skipped_upload()
+    assert SceneChange().should_upload(scene(3), "5", "1")
+    assert in_logs(logs, "Uploading anyway")
+
+
+def test_invalid_settings_upload_the_picture(logs):
+    assert SceneChange().should_upload(scene(1), "a lot", 2)
+    assert in_logs(logs, "WARNING! scene_change_threshold and scene_change_max_skipped must be numbers")
+
+
+def test_corrupt_state_file(logs):
+    with open(constants.SCENE_CHANGE_STATE, "w") as state:
+        state.write("not json")
+    assert SceneChange().should_upload(scene(1), 5, 2)
+    assert in_logs(logs, "Could not read the scene change state")
+
+
+def test_unreadable_picture_is_uploaded(logs):
+    assert SceneChange().should_upload(BytesIO(b"not a picture"), 5, 2)
+    assert in_logs(logs, "Could not compare the picture with the last uploaded one")
+
+
+def test_write_heartbeat(tmpdir, logs):
+    scene_change = SceneChange()
+    scene_change.skipped = 3
+    path = scene_change.write_heartbeat(tmpdir / "heartbeat.log")
+    with open(path) as heartbeat:
+        assert "Scene unchanged, picture not uploaded (3 skipped" in heartbeat.read()
@@ -1,5 +1,6 @@
 import os
 import pytest
+from io import BytesIO
 from tests.conftest import in_logs
 
 import zanzocam.webcam as webcam
@@ -238,6 +239,48 @@ def test_upload_picture_no_cleanup(monkeypatch, tmpdir, logs):
     assert os.path.exists(tmpdir / ".temp.jpg")
 
 
+def test_upload_picture_in_memory(monkeypatch, tmpdir, logs):
+    sent = []
+
+    def upload_picture(self, image, image_name, image_extension):
+        sent.append(image.read())
+
+    monkeypatch.setattr(
+        webcam.server.server.HttpServer, 
+        'upload_picture',
+        upload_picture
+    )
+
+    server = Server({'protocol': 'http'})
+    server.upload_picture(BytesIO(b"picture"), 'test-pic', 'jpg')
+
+    assert not in_logs(logs, "ERROR")
+    assert in_logs(logs, "Picture 'test-pic.jpg' uploaded successfully")
+    assert not in_logs(logs, "Pictures deleted successfully")
+    assert sent == [b"picture"]
+
+
+def test_upload_picture_with_renditions(monkeypatch, tmpdir, logs):
+    sent = []
+
+    def upload_picture(self, image, image_name, image_extension, renditions=None):
+        sent.append((image.read(), [(name, picture.read()) for name, _, picture in renditions]))
+
+    monkeypatch.setattr(
+        webcam.server.server.HttpServer, 
+        'upload_picture',
+        upload_picture
+    )
+
+    server = Server({'protocol': 'http'})
+    server.upload_picture(BytesIO(b"picture"), 'test-pic', 'jpg', 
+                          renditions=[('thumb', 'jpg', BytesIO(b"thumb"))])
+
+    assert not in_logs(logs, "ERROR")
+    assert in_logs(logs, "Uploading 1 renditions with the picture: thumb")
+    assert sent == [(b"picture", [('thumb', b"thumb")])]
+
+
 def test_upload_picture_does_not_catch_exceptions(monkeypatch, tmpdir, logs):
     with open(tmpdir / ".temp.jpg", 'w') as c:
         pass
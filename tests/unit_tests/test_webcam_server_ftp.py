@@ -1,12 +1,14 @@
 import os
 import time
 import pytest
+from io import BytesIO
 from freezegun import freeze_time
 from PIL import Image, ImageChops
 
 
 import zanzocam.webcam as webcam
 import zanzocam.constants as constants
+from zanzocam.webcam import telemetry, timings
 from zanzocam.webcam.errors import ServerError
 from zanzocam.webcam.server.ftp_server import FtpServer
 
@@ -394,6 +396,74 @@ def test_upload_picture_max_3_photo_serverside_server_empty(monkeypatch, tmpdir,
     assert not ImageChops.difference(sent, received).getbbox()
 
 
+def test_upload_picture_in_memory(monkeypatch, tmpdir, logs):
+
+    def storbinary(self, command, file_handle):
+        name = command[14:]
+        with open(tmpdir/("r_"+name), 'wb') as r:
+            r.write(file_handle.read())
+        return "226 OK"
+
+    monkeypatch.setattr(webcam.server.ftp_server.FTP, 'storbinary', storbinary)
+    image = Image.new("RGB", (10, 10), color="#FFFFFF")
+    picture = BytesIO()
+    image.save(picture, format="JPEG")
+
+    server = FtpServer({'hostname': 'me.it', 
+                        'username': 'me',
+                        'max_photos': 1})
+    assert server.upload_picture(picture, 'test', 'JPEG') is None
+
+    assert len(logs) == 0
+    assert not os.path.exists(tmpdir/'test.JPEG')
+    received = Image.open(str(tmpdir/'r_test.JPEG'))
+    assert not ImageChops.difference(image, received).getbbox()
+
+
+def test_upload_picture_with_renditions(monkeypatch, tmpdir, logs):
+    stored = []
+    def storbinary(self, command, file_handle):
+        stored.append((command, file_handle.read()))
+        return "226 OK"
+
+    def rename(self, old, new):
+        webcam.utils.log(f"[TEST] {old} -> {new}")
+        return "226 OK"
+
+    monkeypatch.setattr(webcam.server.ftp_server.FTP, 'storbinary', storbinary)
+    monkeypatch.setattr(webcam.server.ftp_server.FTP, 'rename', rename)
+
+    server = FtpServer({'hostname': 'me.it', 
+                        'username': 'me',
+                        'max_photos': 2})
+    server.upload_picture(BytesIO(b"full"), 'test', 'jpg',
+                          renditions=[('thumb', 'webp', BytesIO(b"thumb"))])
+
+    assert stored == [("STOR pictures/test__0.jpg", b"full"), 
+                      ("STOR pictures/test_thumb__0.webp", b"thumb")]
+    # The renditions are numbered like the picture
+    assert "[TEST] pictures/test_thumb__0.webp -> pictures/test_thumb__1.webp" in logs[-1]
+
+
+def test_upload_picture_records_the_transfer_time(monkeypatch, tmpdir, logs):
+    clock = [100.0]
+    def storbinary(self, command, file_handle):
+        clock[0] += 0.5
+        return "226 OK"
+
+    monkeypatch.setattr(webcam.server.ftp_server.FTP, 'storbinary', storbinary)
+    monkeypatch.setattr(webcam.server.ftp_server, 'monotonic', lambda: clock[0])
+    telemetry.start_run()
+    timings.start_run()
+    server = FtpServer({'hostname': 'me.it', 'username': 'me', 'max_photos': 1})
+    server.upload_picture(BytesIO(b"full"), 'test', 'jpg',
+                          renditions=[('thumb', 'webp', BytesIO(b"thumb"))])
+
+    # The picture and its renditions
+    assert telemetry.get("upload time") == 1.0
+    assert timings.run_record()["totals"]["transfer"] == {"count": 1, "seconds": 1.0}
+
+
 def test_upload_picture_missing_picture(monkeypatch, tmpdir, logs):
 
     def storbinary(self, command, file_handle):
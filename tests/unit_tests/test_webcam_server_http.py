@@ -1,10 +1,12 @@
 import os
 import pytest
+from io import BytesIO
 from freezegun import freeze_time
 from PIL import Image, ImageChops
 
 import zanzocam.webcam as webcam
 import zanzocam.constants as constants
+from zanzocam.webcam import telemetry, timings
 from zanzocam.webcam.errors import ServerError
 from zanzocam.webcam.server.http_server import HttpServer
 
@@ -369,6 +371,66 @@ def test_upload_picture_max_3_serverside_succeed(monkeypatch, tmpdir, logs):
     assert not ImageChops.difference(sent, received).getbbox()
 
 
+@freeze_time("2021-01-01 12:00:00")
+def test_upload_picture_in_memory(monkeypatch, tmpdir, logs):
+    image = Image.new("RGB", (100, 100), color="#FFFFFF")
+    picture = BytesIO()
+    image.save(picture, format="JPEG")
+
+    sent_files = {}
+    def post(url, files, *a, **k):
+        sent_files.update(files)
+        return MockPostRequest(image=files, tmpdir=tmpdir)
+
+    monkeypatch.setattr(webcam.server.http_server.requests, 'post', post)
+    server = HttpServer({'url': 'test'})
+    assert server.upload_picture(picture, 'IMAGE', "JPEG") is None
+
+    assert len(logs) == 1
+    assert "[TEST] POSTing an image" in logs[0]
+    assert sent_files['photo'][0] == 'IMAGE_2021-01-01_12:00:00.JPEG'
+    assert not os.path.exists(tmpdir/'IMAGE_2021-01-01_12:00:00.JPEG')
+    received = Image.open(str(tmpdir/'received_image.jpg'))
+    assert not ImageChops.difference(image, received).getbbox()
+
+
+@freeze_time("2021-01-01 12:00:00")
+def test_upload_picture_with_renditions(monkeypatch, tmpdir, logs):
+    requests_sent = []
+    def post(url, files, *a, **k):
+        requests_sent.append({field: (name, data.read()) for field, (name, data) in files.items()})
+        return MockPostRequest()
+
+    monkeypatch.setattr(webcam.server.http_server.requests, 'post', post)
+    server = HttpServer({'url': 'test'})
+    server.upload_picture(BytesIO(b"full"), 'IMAGE', "jpg", 
+                          renditions=[('medium', 'jpg', BytesIO(b"medium")), 
+                                      ('thumb', 'webp', BytesIO(b"thumb"))])
+
+    # All in one request
+    assert requests_sent == [{
+        'photo': ('IMAGE_2021-01-01_12:00:00.jpg', b"full"),
+        'photo_medium': ('IMAGE_medium_2021-01-01_12:00:00.jpg', b"medium"),
+        'photo_thumb': ('IMAGE_thumb_2021-01-01_12:00:00.webp', b"thumb"),
+    }]
+
+
+def test_upload_picture_records_the_transfer_time(monkeypatch, tmpdir, logs):
+    clock = [100.0]
+    def post(url, files, *a, **k):
+        clock[0] += 1.5
+        return MockPostRequest()
+
+    monkeypatch.setattr(webcam.server.http_server.requests, 'post', post)
+    monkeypatch.setattr(webcam.server.http_server, 'monotonic', lambda: clock[0])
+    telemetry.start_run()
+    timings.start_run()
+    HttpServer({'url': 'test'}).upload_picture(BytesIO(b"full"), 'IMAGE', "jpg")
+
+    assert telemetry.get("upload time") == 1.5
+    assert timings.run_record()["totals"]["transfer"] == {"count": 1, "seconds": 1.5}
+
+
 @freeze_time("2021-01-01 12:00:00")
 def test_upload_picture_initial_rename_fails(monkeypatch, tmpdir, logs):
     image = Image.new("RGB", (100, 100), color="#FFFFFF")
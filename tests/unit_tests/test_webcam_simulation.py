@@ -0,0 +1,88 @@
+from io import BytesIO
+from fractions import Fraction
+
+import zanzocam.webcam.main  # Off the RPi, the camera module can't be imported first
+from zanzocam.webcam.camera import Camera
+from zanzocam.webcam.metering import luminance_from_picture
+from tests.simulation import (SimulatedClock, AmbientLight, SimulatedScene,
+        SimulatedPiCamera, simulated_camera)
+
+
+def capture_luminance(camera: SimulatedPiCamera) -> float:
+    picture = BytesIO()
+    camera.capture(picture, format="jpeg")
+    picture.seek(0)
+    return luminance_from_picture(picture)
+
+
+def test_ambient_light_is_interpolated_geometrically():
+    light = AmbientLight([(10, 1), (0, 100)])
+    assert light(-5) == 100
+    assert abs(light(5) - 10) < 0.0001
+    assert light(20) == 1
+
+
+def test_brightness_follows_shutter_speed_and_iso():
+    camera = SimulatedPiCamera(SimulatedScene(0.01), framerate_range=(Fraction(1, 10), Fraction(15)))
+    camera.resolution = (64, 48)
+    camera.iso = 100
+    camera.shutter_speed = 10**6
+    dark = capture_luminance(camera)
+    camera.shutter_speed = 4 * 10**6
+    brighter = capture_luminance(camera)
+    camera.iso = 400
+    brightest = capture_luminance(camera)
+    assert dark < brighter < brightest
+
+
+def test_shutter_speed_is_limited_by_the_framerate():
+    camera = SimulatedPiCamera(SimulatedScene(0.01))
+    camera.shutter_speed = 10**6
+    assert camera.exposure_speed <= 10**6 / 30 + 1
+
+
+def test_captures_take_simulated_time():
+    scene = SimulatedScene(0.01)
+    camera = SimulatedPiCamera(scene, framerate_range=(Fraction(1, 10), Fraction(15)))
+    camera.resolution = (64, 48)
+    camera.shutter_speed = 2 * 10**6
+    start = scene.clock.now
+    capture_luminance(camera)
+    assert scene.clock.now - start >= 2
+    assert scene.captures[-1][1] == 2 * 10**6
+
+
+def test_black_frames():
+    scene = SimulatedScene(50, black_frame_rate=1)
+    camera = SimulatedPiCamera(scene)
+    camera.resolution = (64, 48)
+    assert capture_luminance(camera) < 1
+    assert scene.captures[-1][3]
+
+
+def test_readings_settle_over_time(logs):
+    clock = SimulatedClock()
+    camera = SimulatedPiCamera(SimulatedScene(0.5, clock=clock))
+    clock.sleep(0.01)
+    first = Camera._camera_readings(camera)
+    clock.sleep(10)
+    assert Camera._camera_readings(camera) != first
+
+    camera.iso = 400
+    with simulated_camera(SimulatedScene(0.5, clock=clock)):
+        settle_time = Camera._wait_for_camera_to_settle(camera, 10)
+    assert settle_time is not None and settle_time < 10
+
+
+def test_simulated_runs_are_reproducible(logs):
+    results = []
+    for _ in range(2):
+        scene = SimulatedScene(0.001, seed=3)
+        camera = Camera({'image': {'width': 64, 'height': 48,
+                                   'use_camera_daemon': False, 'use_exposure_memory': False}})
+        with simulated_camera(scene):
+            camera._shoot_picture()
+        results.append((scene.captures, scene.clock.now, camera.temp_photo.getvalue()))
+
+    assert results[0] == results[1]
+    assert len(results[0][0]) > 1
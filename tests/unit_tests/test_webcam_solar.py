@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+
+import zanzocam.constants as constants
+from zanzocam.webcam.solar import solar_elevation, predict_exposure_regime
+
+
+def test_solar_elevation_summer_solstice_greenwich():
+    when = datetime(2021, 6, 21, 12, 2, tzinfo=timezone.utc)
+    assert abs(solar_elevation(51.4769, 0, when) - 61.96) < 0.1
+
+
+def test_solar_elevation_winter_noon():
+    # At solar noon on the winter solstice: 90 - latitude - 23.44
+    when = datetime(2021, 12, 21, 11, 16, tzinfo=timezone.utc)
+    assert abs(solar_elevation(46.07, 11.12, when) - (90 - 46.07 - 23.44)) < 0.2
+
+
+def test_solar_elevation_midnight():
+    when = datetime(2021, 12, 21, 23, 16, tzinfo=timezone.utc)
+    assert solar_elevation(46.07, 11.12, when) < constants.NIGHT_SUN_ELEVATION
+
+
+def test_solar_elevation_southern_hemisphere():
+    # Sydney, solar noon on the summer (southern) solstice: 90 - 33.87 + 23.44
+    when = datetime(2021, 12, 21, 1, 53, tzinfo=timezone.utc)
+    assert abs(solar_elevation(-33.87, 151.21, when) - (90 - 33.87 + 23.44)) < 0.2
+
+
+def test_predict_exposure_regime():
+    assert predict_exposure_regime(constants.DAYLIGHT_SUN_ELEVATION + 1) == "day"
+    assert predict_exposure_regime(constants.DAYLIGHT_SUN_ELEVATION) == "day"
+    assert predict_exposure_regime(0) == "twilight"
+    assert predict_exposure_regime(constants.NIGHT_SUN_ELEVATION) == "night"
+    assert predict_exposure_regime(-90) == "night"
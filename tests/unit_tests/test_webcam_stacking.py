@@ -0,0 +1,93 @@
+import random
+import pytest
+from io import BytesIO
+from PIL import Image
+
+import zanzocam.constants as constants
+from zanzocam.webcam.metering import luminance_from_picture
+from zanzocam.webcam.stacking import FrameStack, estimate_noise
+
+
+@pytest.fixture
+def noisy_picture(picture_in_memory):
+    def noisy_picture(level: int, noise: float, seed: int, size=(128, 96)) -> BytesIO:
+        generator = random.Random(seed)
+        image = Image.new("L", size)
+        image.putdata([min(max(int(round(generator.gauss(level, noise))), 0), 255)
+                       for _ in range(size[0] * size[1])])
+        return picture_in_memory(image.convert("RGB"), format="PNG")
+    return noisy_picture
+
+
+def test_stack_of_one_frame_is_the_frame(picture_in_memory):
+    stack = FrameStack()
+    stack.add(picture_in_memory(Image.new("RGB", (64, 48), (10, 100, 200)), format="PNG"))
+    assert stack.frames == 1
+    assert all(abs(a - b) <= 1 for a, b in zip(stack.image().getpixel((5, 5)), (10, 100, 200)))
+
+
+def test_stack_sums_in_linear_light(picture_in_memory):
+    stack = FrameStack()
+    for _ in range(4):
+        stack.add(picture_in_memory(Image.new("RGB", (64, 48), (50, 50, 50)), format="PNG"))
+    # Four frames, each a quarter of the exposure
+    assert abs(luminance_from_picture(picture_in_memory(stack.image(0.25), format="PNG"), scale=1) - 50) < 1
+    # The sum is brighter than any of the frames
+    assert luminance_from_picture(picture_in_memory(stack.image(), format="PNG"), scale=1) > 90
+
+
+def test_stack_rewinds_the_frame(picture_in_memory):
+    stack = FrameStack()
+    picture = picture_in_memory(Image.new("RGB", (64, 48)), format="PNG")
+    stack.add(picture)
+    assert picture.tell() == 0
+
+
+def test_stack_size_mismatch(picture_in_memory):
+    stack = FrameStack()
+    stack.add(picture_in_memory(Image.new("RGB", (64, 48), (50, 50, 50)), format="PNG"))
+    with pytest.raises(ValueError):
+        stack.add(picture_in_memory(Image.new("RGB", (48, 64), (50, 50, 50)), format="PNG"))
+
+
+def test_stack_skips_black_frames(picture_in_memory):
+    stack = FrameStack()
+    assert stack.add(picture_in_memory(Image.new("RGB", (64, 48), (50, 50, 50)), format="PNG"))
+    assert not stack.add(picture_in_memory(Image.new("RGB", (64, 48)), format="PNG"))
+    # Very dark is not black
+    assert stack.add(picture_in_memory(Image.new("RGB", (64, 48), (1, 1, 1)), format="PNG"))
+    assert (stack.frames, stack.skipped) == (2, 1)
+
+
+def test_stack_max_frames_do_not_overflow(picture_in_memory):
+    stack = FrameStack()
+    for _ in range(constants.NIGHT_STACKING_MAX_FRAMES):
+        stack.add(picture_in_memory(Image.new("RGB", (64, 48), (255, 255, 255)), format="PNG"))
+    assert stack.image(1 / constants.NIGHT_STACKING_MAX_FRAMES).getpixel((0, 0)) == (255, 255, 255)
+    with pytest.raises(ValueError):
+        stack.add(picture_in_memory(Image.new("RGB", (64, 48)), format="PNG"))
+
+
+def test_empty_stack():
+    with pytest.raises(ValueError):
+        FrameStack().image()
+
+
+def test_estimate_noise(noisy_picture):
+    flat = Image.new("RGB", (128, 96), (100, 100, 100))
+    assert estimate_noise(flat) == 0
+
+    single = estimate_noise(Image.open(noisy_picture(100, 8, seed=0)))
+    stack = FrameStack()
+    for seed in range(8):
+        stack.add(noisy_picture(100, 8, seed=seed))
+    stacked = estimate_noise(stack.image(1 / 8))
+    assert 6 < single < 10
+    assert stacked < single / 2
+
+
+def test_estimate_noise_below_one_level(noisy_picture):
+    # Noise that 8 bit rounding would hide
+    half = estimate_noise(Image.open(noisy_picture(100, 0.5, seed=0)))
+    one = estimate_noise(Image.open(noisy_picture(100, 1, seed=0)))
+    assert 0 < half < one < 1.5
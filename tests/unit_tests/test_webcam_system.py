@@ -1,10 +1,13 @@
 import os
 import sys
 import math
+import shutil
 import pytest
 import requests
 import builtins
 from unittest import mock
+from pathlib import Path
+from textwrap import dedent
 from freezegun import freeze_time
 from datetime import datetime, timedelta
 
@@ -372,6 +375,27 @@ def test_get_free_space_on_disk_exception(monkeypatch, logs):
     assert in_logs(logs, "Could not get the amount of free space on the filesystem")
 
 
+def test_get_cpu_temperature_success(monkeypatch, tmpdir, logs):
+    """
+        Get the CPU temperature, normal conditions
+    """
+    with open(tmpdir / "temp", "w") as temperature:
+        temperature.write("48312\n")
+    monkeypatch.setattr(system, "CPU_TEMPERATURE_PATH", tmpdir / "temp")
+    assert system.get_cpu_temperature() == 48.312
+    assert len(logs) == 0
+
+
+def test_get_cpu_temperature_exception(monkeypatch, tmpdir, logs):
+    """
+        Get the CPU temperature, behavior on exception
+    """
+    monkeypatch.setattr(system, "CPU_TEMPERATURE_PATH", tmpdir / "missing")
+    assert system.get_cpu_temperature() is None
+    assert len(logs) == 1
+    assert in_logs(logs, "Could not read the CPU temperature")
+
+
 def test_get_ram_stats_success(monkeypatch, meminfo, logs):
     """
         Get RAM data, normal conditions
@@ -400,6 +424,37 @@ def test_get_ram_stats_exception(monkeypatch, meminfo, logs):
     assert in_logs(logs, "Could not get RAM data")
 
 
+def test_get_bytes_written_success(monkeypatch, logs):
+    """
+        Get the bytes written on disk, normal conditions
+    """
+    mock_open = mock.mock_open(read_data=dedent("""\
+        rchar: 323934931
+        wchar: 323929600
+        syscr: 632687
+        syscw: 632675
+        read_bytes: 0
+        write_bytes: 8192
+        cancelled_write_bytes: 0
+    """))
+    monkeypatch.setattr(builtins, 'open', mock_open)
+    assert system.get_bytes_written() == 8192
+    assert len(logs) == 0
+
+
+def test_get_bytes_written_exception(monkeypatch, logs):
+    """
+        Get the bytes written on disk, behavior on exception
+    """
+    def fail_open(*args, **kwargs):
+        raise PermissionError()
+
+    monkeypatch.setattr(builtins, 'open', fail_open)
+    assert system.get_bytes_written() is None
+    assert len(logs) == 1
+    assert in_logs(logs, "Could not get the amount of bytes written on disk")
+
+
 def test_report_general_status(monkeypatch):
     """
         Stub test that the status is reported.
@@ -704,6 +759,27 @@ def test_update_crontab_success(tmpdir, logs):
             for hour in range(24)]
 
 
+def test_update_crontab_with_timelapse(monkeypatch, tmpdir, logs):
+    """
+        z-timelapse is scheduled only if the timelapse is enabled
+    """
+    monkeypatch.setattr(system, "copy_system_file", lambda source, dest: shutil.copy(source, dest))
+    monkeypatch.setattr(system, "give_ownership_to_root", lambda path: None)
+    monkeypatch.setattr(system, "remove_root_owned_file", os.remove)
+    with open(webcam.system.CRONJOB_FILE, 'w'):
+        pass
+    system.update_crontab({}, timelapse={"enabled": True})
+    assert in_logs(logs, "Crontab updated successfully")
+    assert open(webcam.system.CRONJOB_FILE, 'r').readlines()[-2:] == [
+        "# ZANZOCAM - assemble the timelapse\n",
+        f"{constants.TIMELAPSE_CRON} {constants.SYSTEM_USER} "
+        f"{Path(sys.argv[0]).parent / 'z-timelapse'}\n"
+    ]
+
+    system.update_crontab({}, timelapse={"enabled": False})
+    assert not "z-timelapse" in open(webcam.system.CRONJOB_FILE, 'r').read()
+
+
 def test_update_crontab_prepare_strings_fails(monkeypatch, tmpdir, logs):
     """
         Test that the crontab is unchanged if there is trouble
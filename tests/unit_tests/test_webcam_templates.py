@@ -0,0 +1,109 @@
+import os
+import pytest
+from freezegun import freeze_time
+from PIL import ImageChops
+
+import zanzocam.constants as constants
+from zanzocam.webcam import system, telemetry, timings
+from zanzocam.webcam.templates import Template, compile_template, uses_placeholder
+from zanzocam.webcam.overlay_cache import OverlayCache
+from zanzocam.webcam.overlays import Overlay
+
+
+@pytest.fixture(autouse=True)
+def new_run():
+    telemetry.start_run()
+
+
+@pytest.fixture()
+def no_queries(monkeypatch):
+    """ Fails if the system is queried for anything """
+    def query():
+        raise AssertionError("The system was queried")
+    for function in ["get_wifi_data", "get_free_space_on_disk", "get_cpu_temperature"]:
+        monkeypatch.setattr(system, function, query)
+
+
+@freeze_time("2021-01-01 12:30:00")
+@pytest.mark.parametrize("text", [
+    "No placeholders",
+    "%%TIME",
+    "%%DATE %%TIME, again %%TIME",
+    "%%TIMES %%DATE_ %TIME %%%DATE %%time %%UNKNOWN",
+])
+def test_time_and_date_as_before(text):
+    # As create_text_overlay replaced them before the templates
+    before = text.replace("%%TIME", "12:30").replace("%%DATE", "01 January 2021")
+    assert Template(text).render("%d %B %Y", "%H:%M") == before
+
+
+def test_templates_are_compiled_once():
+    template = compile_template("Shot at %%TIME, ISO %%ISO")
+    assert template.placeholders == {"TIME", "ISO"}
+    assert compile_template("Shot at %%TIME, ISO %%ISO") is template
+    assert uses_placeholder(["Hello", "Shot at %%TIME, ISO %%ISO"], "ISO")
+    assert not uses_placeholder(["Hello", "Shot at %%TIME, ISO %%ISO"], "LUMINANCE")
+
+
+def test_run_data_is_reused(no_queries):
+    telemetry.record("luminance", 63.7)
+    telemetry.record("exposure", (4000, 200))
+    telemetry.record("CPU temperature", 48.312)
+    telemetry.record("free disk space", "1.20 GB")
+    telemetry.record("wifi data", {"ssid": "rifugio", "signal level": "-52 dBm"})
+
+    text = "%%LUMINANCE %%SHUTTER %%ISO %%CPU_TEMPERATURE %%FREE_DISK %%WIFI_SIGNAL"
+    assert Template(text).render() == "64 1/250s 200 48°C 1.20 GB -52 dBm"
+
+    telemetry.record("exposure", (2500000, 800))
+    assert Template("%%SHUTTER, ISO %%ISO").render() == "2.5s, ISO 800"
+
+
+def test_missing_values(no_queries):
+    telemetry.record("CPU temperature", None)
+    telemetry.record("free disk space", None)
+    telemetry.record("wifi data", {"ssid": "", "signal level": "n/a"})
+    text = "%%LUMINANCE %%SHUTTER %%ISO %%CPU_TEMPERATURE %%FREE_DISK %%WIFI_SIGNAL %%UPLOAD_TIME"
+    assert Template(text).render() == " ".join(["n/a"] * 7)
+
+
+def test_values_not_measured_yet_are_queried_once(monkeypatch):
+    queries = []
+    monkeypatch.setattr(system, "get_free_space_on_disk", lambda: queries.append(1) or "900.00 MB")
+    assert Template("Free: %%FREE_DISK").render() == "Free: 900.00 MB"
+    assert Template("%%FREE_DISK free").render() == "900.00 MB free"
+    assert len(queries) == 1
+
+
+def test_upload_time_of_the_previous_run(monkeypatch, logs):
+    clock = [100.0]
+    monkeypatch.setattr(timings, "monotonic", lambda: clock[0])
+    timings.start_run()
+    with timings.timed("upload"):
+        clock[0] += 30  # The random wait before the upload does not count
+        timings.record_phase("transfer", clock[0], 2.34)
+    os.makedirs(constants.CAMERA_LOGS)
+    timings.save_run_record(constants.RUN_RECORD)
+
+    # The new run does not change the record of the previous one until it ends
+    timings.start_run()
+    assert Template("Upload: %%UPLOAD_TIME").render() == "Upload: 2.3s"
+
+
+def test_upload_time_of_this_run(no_queries):
+    telemetry.record("upload time", 1.26)
+    assert Template("Upload: %%UPLOAD_TIME").render() == "Upload: 1.3s"
+
+
+def test_overlay_with_run_data_is_updated():
+    cache = OverlayCache()
+    data = {"type": "text", "text": "Webcam of the Rifugio\nISO %%ISO - %%SHUTTER", "font_size": 20}
+    telemetry.record("exposure", (4000, 100))
+    Overlay("top_left", data, 400, 100, None, None, cache=cache)
+
+    telemetry.record("exposure", (8000, 200))
+    updated = Overlay("top_left", data, 400, 100, None, None, cache=cache)
+    drawn_again = Overlay("top_left", data, 400, 100, None, None)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert "ISO 200 - 1/125s" in updated.text
+    assert not ImageChops.difference(updated.rendered_image, drawn_again.rendered_image).getbbox()
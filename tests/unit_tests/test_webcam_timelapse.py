@@ -0,0 +1,287 @@
+import os
+import struct
+import datetime
+import pytest
+from io import BytesIO
+from pathlib import Path
+from freezegun import freeze_time
+from PIL import Image
+
+import zanzocam.webcam as webcam
+import zanzocam.constants as constants
+from zanzocam.webcam import timelapse
+from zanzocam.webcam.camera import Camera
+from zanzocam.webcam.timelapse import (archive_frame, day_frames, prune_archive,
+        assemble_timelapse, MjpegAviWriter)
+
+from tests.conftest import in_logs, MockServer
+
+
+class FakeCamera:
+    def __init__(self, renditions=()):
+        self.processed_image = self.picture((100, 50))
+        self.extension = "jpg"
+        self.processed_renditions = list(renditions)
+
+    @staticmethod
+    def picture(size, format="JPEG"):
+        picture = BytesIO()
+        Image.new("RGB", size, color="#FF0000").save(picture, format=format)
+        picture.seek(0)
+        return picture
+
+
+class FakeConfig:
+    def __init__(self, start="00:00", stop="23:59", active=True, **timelapse_settings):
+        self.start, self.stop, self.active = start, stop, active
+        self.timelapse = timelapse_settings
+
+    def get_start_time(self):
+        return self.start
+
+    def get_stop_time(self):
+        return self.stop
+
+    def within_active_hours(self):
+        return self.active
+
+    def get_timelapse_settings(self):
+        return {**constants.TIMELAPSE_DEFAULTS, **self.timelapse}
+
+    def get_camera_settings(self):
+        return {'image': {'name': 'cam'}}
+
+    def get_server_settings(self):
+        return {}
+
+
+def store_frames(day, count, size=(64, 48), format="JPEG", extension="jpg"):
+    folder = constants.TIMELAPSE_ARCHIVE / day
+    os.makedirs(folder, exist_ok=True)
+    for frame in range(count):
+        Image.new("RGB", size, color=(frame * 20, 0, 0)).save(folder / f"10-{frame:02d}-00.{extension}", format=format)
+    return folder
+
+
+def read_avi(path):
+    """ Returns the header values and the frames listed in the index """
+    data = open(path, "rb").read()
+    assert data[:4] == b"RIFF" and data[8:12] == b"AVI "
+    assert struct.unpack("<I", data[4:8])[0] == len(data) - 8
+    avih = data.index(b"avih") + 8
+    microseconds, _, _, flags, frames = struct.unpack("<5I", data[avih: avih + 20])
+    width, height = struct.unpack("<2I", data[avih + 32: avih + 40])
+    movi = data.index(b"movi")
+    index = data.index(b"idx1")
+    entries = [struct.unpack("<4sIII", data[index + 8 + 16 * i: index + 24 + 16 * i]) for i in range(frames)]
+    jpegs = [data[movi + offset + 8: movi + offset + 8 + size] for _, _, offset, size in entries]
+    return microseconds, flags, (width, height), jpegs
+
+
+@freeze_time("2021-01-01 10:30:00")
+def test_archive_frame(logs):
+    path = archive_frame(FakeCamera())
+    assert path == constants.TIMELAPSE_ARCHIVE / "2021-01-01" / "10-30-00.jpg"
+    assert Image.open(path).size == (100, 50)
+    assert not logs
+
+
+@freeze_time("2021-01-01 10:30:00")
+def test_archive_frame_prefers_the_timelapse_rendition(logs):
+    camera = FakeCamera([("thumb", "jpg", FakeCamera.picture((10, 5))),
+                         ("timelapse", "webp", FakeCamera.picture((40, 20), "WEBP"))])
+    path = archive_frame(camera)
+    assert path.name == "10-30-00.webp"
+    assert Image.open(path).size == (40, 20)
+
+
+@freeze_time("2021-01-01 10:30:00")
+def test_frame_rendition_is_archived_scaled_down(tmpdir, logs):
+    camera = Camera({'image': {}})
+    assert timelapse.add_frame_rendition(camera, constants.TIMELAPSE_DEFAULTS)
+    assert constants.CAMERA_DEFAULTS["renditions"] == []
+    camera.temp_photo = FakeCamera.picture((2000, 1000))
+    camera._process_picture()
+
+    path = archive_frame(camera)
+    assert path.name == "10-30-00.jpg"
+    assert Image.open(path).size == (1280, 640)
+
+
+def test_frame_rendition_not_added(logs):
+    # At full size
+    camera = Camera({'image': {}})
+    assert not timelapse.add_frame_rendition(camera, dict(constants.TIMELAPSE_DEFAULTS, width=0))
+    assert not camera.renditions
+
+    # Configured already
+    renditions = [{"name": "timelapse", "width": 800}]
+    camera = Camera({'image': {'renditions': renditions}})
+    assert not timelapse.add_frame_rendition(camera, constants.TIMELAPSE_DEFAULTS)
+    assert camera.renditions == renditions
+
+
+def test_archive_frame_fails(logs):
+    camera = FakeCamera()
+    camera.processed_renditions = None
+    assert archive_frame(camera) is None
+    assert in_logs(logs, "Could not store the picture for the timelapse")
+
+
+def test_day_frames_and_prune(logs):
+    store_frames("2021-01-01", 3)
+    store_frames("2021-01-05", 1)
+    frames = day_frames(datetime.date(2021, 1, 1))
+    assert [frame.name for frame in frames] == ["10-00-00.jpg", "10-01-00.jpg", "10-02-00.jpg"]
+    assert day_frames(datetime.date(2021, 1, 2)) == []
+
+    prune_archive(3, today=datetime.date(2021, 1, 6))
+    assert not os.path.exists(constants.TIMELAPSE_ARCHIVE / "2021-01-01")
+    assert os.path.exists(constants.TIMELAPSE_ARCHIVE / "2021-01-05")
+
+
+def test_mjpeg_avi_writer(tmpdir):
+    frames = [FakeCamera.picture((32, 16)).getvalue() + b"x" * padding for padding in (0, 1)]
+    with MjpegAviWriter(tmpdir / "video.avi", 32, 16, 5) as video:
+        for frame in frames:
+            video.add_frame(frame)
+
+    microseconds, flags, size, jpegs = read_avi(tmpdir / "video.avi")
+    assert microseconds == 200000
+    assert flags == timelapse.AVIF_HASINDEX
+    assert size == (32, 16)
+    assert jpegs == frames
+
+
+def test_mjpeg_avi_writer_size_limit(tmpdir):
+    frame = FakeCamera.picture((32, 16)).getvalue()
+    with MjpegAviWriter(tmpdir / "probe.avi", 32, 16, 5) as video:
+        video.add_frame(frame)
+    # Room for three frames and their index entries, not for a fourth
+    frame_size = 8 + len(frame) + len(frame) % 2 + 16
+    max_size = os.path.getsize(tmpdir / "probe.avi") + 2 * frame_size + frame_size // 2
+
+    with MjpegAviWriter(tmpdir / "video.avi", 32, 16, 5, max_size=max_size) as video:
+        assert [video.add_frame(frame) for _ in range(5)] == [True, True, True, False, False]
+
+    assert os.path.getsize(tmpdir / "video.avi") <= max_size
+    riff_size = struct.unpack("<I", open(tmpdir / "video.avi", "rb").read()[4:8])[0]
+    assert riff_size == os.path.getsize(tmpdir / "video.avi") - 8
+    assert len(read_avi(tmpdir / "video.avi")[3]) == 3
+
+    with pytest.raises(ValueError):
+        MjpegAviWriter(tmpdir / "huge.avi", 32, 16, 5, max_size=2**32)
+
+
+def test_assemble_avi_size_limit(tmpdir, logs, monkeypatch):
+    store_frames("2021-01-01", 6)
+    frames = day_frames(datetime.date(2021, 1, 1))
+    frame_size = os.path.getsize(frames[0])
+
+    # The frames are twice the limit: one every two is used
+    monkeypatch.setattr(timelapse, "TIMELAPSE_AVI_MAX_SIZE", 3 * frame_size + 2048)
+    assemble_timelapse(frames, tmpdir / "video.avi", "avi")
+    assert len(read_avi(tmpdir / "video.avi")[3]) == 3
+    assert in_logs(logs, "using one frame every 2")
+
+    # The headers don't fit in the estimate: the last frame is left out
+    logs.clear()
+    monkeypatch.setattr(timelapse, "TIMELAPSE_AVI_MAX_SIZE", 3 * frame_size + 64)
+    assemble_timelapse(frames, tmpdir / "video.avi", "avi")
+    assert len(read_avi(tmpdir / "video.avi")[3]) == 2
+    assert in_logs(logs, "the last 1 frames are left out")
+    assert os.path.getsize(tmpdir / "video.avi") <= 3 * frame_size + 64
+
+
+def test_assemble_avi(tmpdir, logs):
+    folder = store_frames("2021-01-01", 3)
+    # A frame of a different size and format is encoded again
+    Image.new("RGB", (128, 96), color="#00FF00").save(folder / "11-00-00.png")
+    original = open(folder / "10-01-00.jpg", "rb").read()
+
+    assemble_timelapse(day_frames(datetime.date(2021, 1, 1)), tmpdir / "video.avi", "avi", fps=10)
+
+    _, _, size, jpegs = read_avi(tmpdir / "video.avi")
+    assert size == (64, 48)
+    assert len(jpegs) == 4
+    assert jpegs[1] == original  # JPEG frames of the right size are not encoded again
+    last = Image.open(BytesIO(jpegs[3]))
+    assert last.size == (64, 48)
+    assert last.getpixel((32, 24))[1] > 200
+    assert not logs
+
+
+def test_assemble_webp(tmpdir, logs):
+    store_frames("2021-01-01", 4)
+    assemble_timelapse(day_frames(datetime.date(2021, 1, 1)), tmpdir / "video.webp", "webp", fps=4)
+
+    video = Image.open(str(tmpdir / "video.webp"))
+    assert video.format == "WEBP"
+    assert video.n_frames == 4
+    assert video.size == (64, 48)
+
+
+def test_assemble_webp_too_many_frames(tmpdir, logs, monkeypatch):
+    monkeypatch.setattr(timelapse, "TIMELAPSE_WEBP_MAX_FRAMES", 3)
+    store_frames("2021-01-01", 4)
+    video = assemble_timelapse(day_frames(datetime.date(2021, 1, 1)), tmpdir / "video.webp", "webp", fps=4)
+
+    assert video == tmpdir / "video.avi"
+    assert not os.path.exists(tmpdir / "video.webp")
+    assert len(read_avi(video)[3]) == 4
+    assert in_logs(logs, "assembling an AVI instead")
+
+
+def test_day_to_assemble():
+    with freeze_time("2021-01-02 22:00:00"):
+        assert timelapse._day_to_assemble(FakeConfig()) == datetime.date(2021, 1, 1)
+        assert timelapse._day_to_assemble(FakeConfig("08:00", "20:00", active=False)) == datetime.date(2021, 1, 2)
+        assert timelapse._day_to_assemble(FakeConfig("9:00", "20:00", active=False)) == datetime.date(2021, 1, 2)
+    with freeze_time("2021-01-02 05:00:00"):
+        assert timelapse._day_to_assemble(FakeConfig("08:00", "20:00", active=False)) == datetime.date(2021, 1, 1)
+    with freeze_time("2021-01-02 12:00:00"):
+        assert timelapse._day_to_assemble(FakeConfig("08:00", "20:00", active=True)) is None
+
+
+@freeze_time("2021-01-02 22:00:00")
+def test_main_assembles_and_uploads(monkeypatch, logs):
+    store_frames("2021-01-02", 3)
+    monkeypatch.setattr(timelapse, "load_configuration_from_disk", lambda: FakeConfig("08:00", "20:00", active=False))
+    uploaded = []
+    monkeypatch.setattr(timelapse, "Server", MockServer)
+    monkeypatch.setattr(MockServer, "upload_picture", lambda self, *a, **k: uploaded.append(a), raising=False)
+    monkeypatch.setattr(timelapse.os, "nice", lambda increment: 0)
+
+    timelapse.main([])
+
+    assert in_logs(logs, "Assembling 3 frames into cam_timelapse_2021-01-02.avi")
+    assert uploaded == [(constants.TIMELAPSE_PATH / "cam_timelapse_2021-01-02.avi",
+                         "cam_timelapse_2021-01-02", "avi")]
+    assert in_logs(logs, "Timelapse uploaded, its frames have been deleted.")
+    assert not os.path.exists(constants.TIMELAPSE_ARCHIVE / "2021-01-02")
+
+
+@freeze_time("2021-01-02 12:00:00")
+def test_main_waits_for_the_end_of_the_active_hours(monkeypatch, logs):
+    store_frames("2021-01-02", 3)
+    monkeypatch.setattr(timelapse, "load_configuration_from_disk", lambda: FakeConfig("08:00", "20:00", active=True))
+    monkeypatch.setattr(timelapse.os, "nice", lambda increment: 0)
+
+    timelapse.main([])
+
+    assert in_logs(logs, "Within the active hours: the timelapse will be assembled later.")
+    assert os.path.exists(constants.TIMELAPSE_ARCHIVE / "2021-01-02")
+
+
+@freeze_time("2021-01-03 10:00:00")
+def test_main_keeps_frames_if_upload_fails(monkeypatch, logs):
+    store_frames("2021-01-02", 2)
+    monkeypatch.setattr(timelapse, "load_configuration_from_disk", lambda: FakeConfig())
+    monkeypatch.setattr(timelapse, "Server", MockServer)
+    monkeypatch.setattr(MockServer, "upload_picture", lambda self, *a, **k: 1/0, raising=False)
+    monkeypatch.setattr(timelapse.os, "nice", lambda increment: 0)
+
+    timelapse.main(["2021-01-02"])
+
+    assert in_logs(logs, "The frames are kept: it will be tried again on the next run.")
+    assert os.path.exists(constants.TIMELAPSE_ARCHIVE / "2021-01-02")
@@ -0,0 +1,82 @@
+import json
+import pytest
+
+from zanzocam.webcam import timings
+from zanzocam.webcam.timings import timed
+
+from tests.conftest import in_logs
+
+
+@pytest.fixture()
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(timings, "monotonic", lambda: now[0])
+    timings.start_run()
+    return now
+
+
+def test_timed_as_context_manager(clock):
+    clock[0] += 1
+    with timed("upload"):
+        clock[0] += 2.5
+    record = timings.run_record()
+    assert record["phases"] == [{"phase": "upload", "start": 1, "seconds": 2.5}]
+    assert record["seconds"] == 3.5
+
+
+def test_timed_as_decorator_records_every_call(clock):
+    @timed("capture")
+    def capture(seconds):
+        clock[0] += seconds
+        return seconds
+
+    assert capture(1) == 1
+    capture(2)
+    record = timings.run_record()
+    assert len(record["phases"]) == 2
+    assert record["totals"] == {"capture": {"count": 2, "seconds": 3}}
+
+
+def test_timed_records_failed_phases(clock):
+    with pytest.raises(ValueError):
+        with timed("config download"):
+            clock[0] += 1
+            raise ValueError("failed")
+    assert timings.run_record()["totals"]["config download"]["seconds"] == 1
+
+
+def test_start_run_resets_the_phases(clock):
+    with timed("upload"):
+        pass
+    timings.start_run()
+    assert timings.run_record()["phases"] == []
+
+
+def test_save_run_record(clock, tmpdir, logs):
+    with timed("capture"):
+        clock[0] += 3
+    with timed("upload"):
+        clock[0] += 1
+
+    record = timings.save_run_record(tmpdir / "run.json", successful=False)
+    with open(tmpdir / "run.json") as r:
+        assert json.load(r) == record
+    assert record["successful"] is False
+    assert in_logs(logs, "Slowest phases: capture 3.00s, upload 1.00s")
+    assert in_logs(logs, "Run record: {")
+
+
+def test_save_run_record_fails(clock, tmpdir, logs):
+    assert timings.save_run_record(tmpdir / "missing" / "run.json") is None
+    assert in_logs(logs, "Could not save the run record")
+
+
+def test_load_run_record(clock, tmpdir, logs):
+    assert timings.load_run_record(tmpdir / "run.json") is None
+    record = timings.save_run_record(tmpdir / "run.json")
+    assert timings.load_run_record(tmpdir / "run.json") == record
+
+    with open(tmpdir / "run.json", "w") as r:
+        r.write("{")
+    assert timings.load_run_record(tmpdir / "run.json") is None
+    assert in_logs(logs, "Could not read the run record")
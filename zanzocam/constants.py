@@ -38,12 +38,33 @@ CAMERA_LOG = CAMERA_LOGS / 'camera.log'
 #: Used with datetime to format the log name
 LOG_NAME_FORMAT = "logs %d-%m-%Y %H:%M:%S.log"
 
+#: Uploaded instead of the logs when the picture was not uploaded and logs are disabled
+SCENE_CHANGE_HEARTBEAT = CAMERA_LOGS / 'heartbeat.log'
+
+#: Record of the last run, with the duration of each phase (JSON)
+RUN_RECORD = CAMERA_LOGS / 'run.json'
+
+#: Used with datetime to format the name of the stored run records
+RUN_RECORD_NAME_FORMAT = "run %d-%m-%Y %H:%M:%S.json"
+
 #: Logs produced in case of issues with the server
 FAILURE_REPORT_PATH = DATA_PATH / 'failure_report.txt'
 
 #: Main configuration file
 CONFIGURATION_FILE = DATA_PATH / "configuration.json"
 
+#: Logs produced by the camera daemon (stay on disk, not sent to the server)
+CAMERA_DAEMON_LOG = DATA_PATH / 'camera-daemon.log'
+
+#: Logs produced by z-timelapse (stay on disk, not sent to the server)
+TIMELAPSE_LOG = DATA_PATH / 'timelapse.log'
+
+#: Where the frames of the timelapse are kept, in a folder for each day
+TIMELAPSE_ARCHIVE = DATA_PATH / "timelapse_frames"
+
+#: Where the timelapse videos are assembled before the upload
+TIMELAPSE_PATH = DATA_PATH / "timelapse"
+
 #: Temporary camera logs for the web UI
 PICTURE_LOGS = DATA_PATH / "picture_logs.txt"
 
@@ -62,6 +83,13 @@ PREVIEW_PICTURE = BASE_PATH / "web_ui" / PREVIEW_PICTURE_URL
 #: Local camera overlays path
 IMAGE_OVERLAYS_PATH = DATA_PATH / "overlays"
 
+#: Where the rendered overlays that don't change between runs are kept
+OVERLAY_CACHE = DATA_PATH / "overlay_cache"
+
+#: Max size of the overlay cache in bytes: beyond it, the overlays
+#:  that were not used for the longest time are deleted
+OVERLAY_CACHE_SIZE = 20 * 1024 * 1024
+
 #: Remote camera overlays path
 REMOTE_IMAGES_PATH = "configuration/overlays/"
 
@@ -100,6 +128,9 @@ CHECK_UPLINK_URL = "http://www.google.com"
 #: Path to the autohotspot script
 AUTOHOTSPOT_BINARY_PATH = "/usr/bin/autohotspot"
 
+#: Where the kernel reports the CPU temperature, in thousandths of °C
+CPU_TEMPERATURE_PATH = "/sys/class/thermal/thermal_zone0/temp"
+
 #: Ecoding of the FTP server files
 FTP_CONFIG_FILE_ENCODING = 'utf-8'
 
@@ -135,10 +166,124 @@ MAX_SHUTTER_SPEED = int(9.5 * 10**6)
 #: How much tolerance to give to the low light search algorithm
 TARGET_LUMINOSITY_MARGIN = 3
 
-#: Time to allow the firmware to compute the right exposure in normal
-#:  light conditions (AWB requires more)
+#: Bounds to how fast the light measured by the low light search can grow
+#:  with the exposure (light ~ exposure ^ slope, ideally slope = 1),
+#:  to keep noisy pictures from sending the search too far
+LOW_LIGHT_MIN_SLOPE = 0.5
+LOW_LIGHT_MAX_SLOPE = 2
+
+#: Max captures the histogram low light strategy can take to reach the target
+HISTOGRAM_MAX_CAPTURES = 3
+
+#: If 99% of the picture is darker than this level (0-255), its histogram is
+#:  too coarse to estimate the exposure, and a long exposure is taken first
+HISTOGRAM_MIN_LEVEL = 8
+
+#: Max frames that can be stacked at night (see `night_stacking_frames`):
+#:  more would overflow the 16 bits accumulator
+NIGHT_STACKING_MAX_FRAMES = 16
+
+#: Stack frames only if the low light correction needs exposures at least this long
+NIGHT_STACKING_MIN_SHUTTER_SPEED = 10**6
+
+#: Frames with at most this luminance are not stacked: the camera
+#:  sometimes returns pitch black pictures for no good reason
+NIGHT_STACKING_BLACK_FRAME_LUMINANCE = 0.001
+
+#: Height of the bands the frames are stacked in, to keep the temporary arrays small
+STACKING_BAND_HEIGHT = 128
+
+#: How much smaller than the picture is the frame used to measure its luminance.
+#:  JPEG pictures can be decoded directly at 1/2, 1/4 or 1/8 of their size.
+LUMINANCE_METERING_SCALE = 8
+
+#: Where the low light search remembers the exposures it converged to
+EXPOSURE_MEMORY = DATA_PATH / "exposure_memory.json"
+
+#: Exposure memory entries older than this (in days) are discarded
+EXPOSURE_MEMORY_MAX_AGE = 7
+
+#: Max number of entries kept in the exposure memory
+EXPOSURE_MEMORY_MAX_ENTRIES = 200
+
+#: Only entries taken within this many minutes of the current
+#:  time of day are used to seed the low light search
+EXPOSURE_MEMORY_TIME_WINDOW = 60
+
+#: Only entries whose ambient luminance was at most this many
+#:  times higher or lower than the current one are used
+EXPOSURE_MEMORY_LUMINANCE_RATIO = 2
+
+#: Format of the timestamps in the exposure memory
+EXPOSURE_MEMORY_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+#: Where the fingerprint of the last uploaded picture is kept (see `scene_change_threshold`)
+SCENE_CHANGE_STATE = DATA_PATH / "scene_change.json"
+
+#: Size of the grayscale thumbnails compared to detect a change in the scene
+SCENE_CHANGE_FINGERPRINT_SIZE = (32, 24)
+
+#: Where the quality -> size curve of the last encodings is kept (see `target_size`)
+QUALITY_CURVE = DATA_PATH / "quality_curve.json"
+
+#: Where the glyph widths of the overlay fonts are kept between runs.
+#:  Written only when the camera daemon is used (see zanzocam.webcam.fonts)
+FONT_METRICS = DATA_PATH / "font_metrics.json"
+
+#: Texts whose sum of glyph advances is this far (in em) from the limit,
+#:  on either side, are not measured exactly: the kerning and the overhang
+#:  of the last glyph never make up for it.
+FONT_WIDTH_TOLERANCE = 1
+
+#: What the placeholders of the text overlays show when their value
+#:  could not be measured (see zanzocam.webcam.templates)
+TEMPLATE_MISSING_VALUE = "n/a"
+
+#: Range of qualities the search for the byte budget can choose from
+BYTE_BUDGET_QUALITY_RANGE = (10, 95)
+
+#: Max number of trial encodes to fit the byte budget. Bisection over
+#:  BYTE_BUDGET_QUALITY_RANGE always converges within 7.
+BYTE_BUDGET_MAX_TRIALS = 7
+
+#: How many trial encodes can be guided by the quality curve before
+#:  falling back to plain bisection (if the curve is way off)
+BYTE_BUDGET_CURVE_GUIDED_TRIALS = 3
+
+#: Above this elevation of the sun (in degrees) the automatic exposure
+#:  is assumed to be enough, and the luminance is not checked.
+#:  Used only if the camera location is configured.
+DAYLIGHT_SUN_ELEVATION = 10
+
+#: Below this elevation of the sun (in degrees) a long exposure is assumed
+#:  to be needed, and the low light search starts right away.
+#:  Used only if the camera location is configured.
+NIGHT_SUN_ELEVATION = -12
+
+#: Max time to allow the firmware to compute the right exposure in normal
+#:  light conditions (AWB requires more). The warm-up ends earlier if the 
+#:  gains, exposure and AWB settle before.
 CAMERA_WARM_UP_TIME = 5
 
+#: How often to poll the camera during the warm-up (seconds).
+#:  With long exposures, the camera is polled once per frame instead.
+CAMERA_SETTLE_POLL_INTERVAL = 0.2
+
+#: Max relative change between two polls for a camera reading to be stable
+CAMERA_SETTLE_TOLERANCE = 0.02
+
+#: How many consecutive stable polls are needed to consider the camera settled
+CAMERA_SETTLE_STABLE_POLLS = 3
+
+#: Unix socket where the camera daemon (z-camera-daemon) listens
+#:  for capture requests. If the socket is missing, the camera is
+#:  opened directly at every run.
+CAMERA_DAEMON_SOCKET = DATA_PATH / ".camera-daemon.sock"
+
+#: How long to wait for the camera daemon to reply (seconds).
+#:  Must be longer than the longest exposure.
+CAMERA_DAEMON_TIMEOUT = 60
+
 #: White balancing modes from picamera
 PICAMERA_AWB_MODES = [
     'off',
@@ -164,10 +309,24 @@ CAMERA_DEFAULTS = {
     "ver_flip": False,
     "hor_flip": False,
     "rotation": 0,
-    "jpeg_quality": 90,
+    "jpeg_quality": 90,  # used by WebP and AVIF as well
     "jpeg_subsampling": 0,
+    "jpeg_optimize": False,  # optimized Huffman tables: a bit smaller, a bit slower
+    "jpeg_progressive": False,
+    "webp_method": 4,
+    "avif_speed": 8,
     "background_color": (0, 0, 0, 0),
     "awb_mode": 'auto',
+    "use_camera_daemon": True,
+    "use_exposure_memory": True,
+    "low_light_strategy": "search",  # 'search' or 'histogram'
+    "night_stacking_frames": 0,  # 0 to disable stacking
+    "raw_capture": False,  # capture unencoded RGB frames, encode only the final image
+    "scene_change_threshold": 0,  # 0 uploads every picture, see SceneChange
+    "scene_change_max_skipped": 12,  # upload anyway after skipping these many in a row
+    "target_size": 0,  # in KB: the highest quality that fits is chosen. 0 uses jpeg_quality
+    "overlay_threads": 1,  # threads rendering the overlays, 0 for one per CPU core. See benchmarks/overlay_threads.py
+    "renditions": [],  # smaller versions of the picture to upload with it, see RENDITION_DEFAULTS
 
     # These two are "experimental" and mostly untested,
     # don't use them unless really necessary
@@ -175,6 +334,65 @@ CAMERA_DEFAULTS = {
     'let_awb_settle_in_dark': False,
 }
 
+#: Fallback values for the options of the encoders (see zanzocam.webcam.encoders)
+ENCODER_DEFAULTS = {
+    "quality": 90,
+    "subsampling": 0,
+    "optimize": False,
+    "progressive": False,
+    "webp_method": 4,  # 0 (fast) to 6 (small)
+    "avif_speed": 8,   # 0 (small) to 10 (fast)
+}
+
+#: Fallback values for the 'timelapse' section of the configuration
+TIMELAPSE_DEFAULTS = {
+    "enabled": False,
+    "format": "avi",  # MJPEG in an AVI container, or 'webp' (animated, for short ones)
+    "fps": 10,
+    "quality": 80,  # of the WebP, of the archived frames, and of the AVI frames that are not JPEG of the right size
+    "keep_days": 3,  # frames not assembled in this many days are deleted
+    "width": 1280,  # of the archived frames, scaled down from the picture. 0 archives the full picture
+}
+
+#: Largest AVI the timelapse can write, in bytes. The sizes in the AVI
+#:  headers can't pass 4 GB, and many AVI 1.0 readers stop at 1 GB:
+#:  past this size frames are left out of the video.
+TIMELAPSE_AVI_MAX_SIZE = 2**30
+
+#: Most frames an animated WebP timelapse can have. Pillow needs all the
+#:  frames decoded in memory to encode it (about 3 MB each at 1280x720):
+#:  with more frames the timelapse is assembled as an AVI instead.
+TIMELAPSE_WEBP_MAX_FRAMES = 60
+
+#: Name of the rendition archived as frame of the timelapse. If it's not
+#:  configured in `renditions`, it's created with the `width` of the
+#:  timelapse settings just for the archive, and it's not uploaded.
+TIMELAPSE_RENDITION = "timelapse"
+
+#: Used with datetime to name the folders of the timelapse frames
+TIMELAPSE_DAY_FORMAT = "%Y-%m-%d"
+
+#: Used with datetime to name the timelapse frames
+TIMELAPSE_FRAME_FORMAT = "%H-%M-%S"
+
+#: When z-timelapse runs (crontab format). It does nothing during
+#:  the active hours, nor if there are no frames to assemble.
+TIMELAPSE_CRON = "45 * * * *"
+
+#: Niceness of z-timelapse, so that it does not slow down the camera
+TIMELAPSE_NICENESS = 19
+
+#: Fallback values for each of the renditions listed in the 'renditions'
+#:  of the camera configuration. With only one of width and height,
+#:  the other one keeps the aspect ratio of the picture.
+RENDITION_DEFAULTS = {
+    "name": "small",
+    "width": 640,
+    "height": None,
+    "quality": 80,
+    "format": "jpg",
+}
+
 #: Fallback values for the image overlays
 OVERLAY_DEFAULTS = {
     "font_size": 30,
@@ -7,6 +7,7 @@ import subprocess
 from flask import abort, flash
 
 from zanzocam.web_ui.utils import read_log_file, write_json_file, write_text_file, toggle_flag, send_from_path, clear_logs
+from zanzocam.webcam.daemon import DaemonCamera
 from zanzocam.constants import *
 
 
@@ -171,8 +172,12 @@ def get_all_logs():
 def get_preview():
     """
     Makes a new preview with raspistill and returns the new image.
+    If the camera daemon is running, it holds the camera: ask it instead.
     """
-    with picamera.PiCamera() as camera:
+    camera = DaemonCamera.connect()
+    if not camera:
+        camera = picamera.PiCamera()
+    with camera:
         camera.resolution = (640, 480)
         camera.capture(str(PREVIEW_PICTURE))
     return send_from_path(PREVIEW_PICTURE)
@@ -0,0 +1,167 @@
+from typing import Any, Dict, Optional, Tuple
+
+import os
+import json
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+from zanzocam.constants import *
+from zanzocam.webcam.utils import log_error
+from zanzocam.webcam import encoders
+
+
+class QualityCurve:
+    """
+    Remembers how large the pictures were at each quality in the last
+    runs, for each format and resolution, so that the search for the
+    quality that fits the byte budget can start close to the answer.
+
+    The size at a given quality changes with the scene (a noisy night
+    picture is much larger than a foggy one), but the shape of the curve
+    doesn't change much: the curve is rescaled to the sizes measured
+    in the current run before predicting anything.
+    """
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or QUALITY_CURVE)
+        self.curves = self._load()
+
+
+    def _load(self) -> Dict[str, Dict[int, int]]:
+        """
+        Reads the curves from disk.
+        A missing or unreadable file results in no curves.
+        """
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as curve_file:
+                curves = json.load(curve_file)
+            return {key: {int(quality): int(size) for quality, size in curve.items()}
+                        for key, curve in curves.items()}
+        except Exception as e:
+            log_error("Could not read the quality curve. It will be reset.", e)
+            return {}
+
+
+    def save(self) -> None:
+        """
+        Writes the curves on disk.
+        """
+        try:
+            with open(self.path, "w") as curve_file:
+                json.dump(self.curves, curve_file, indent=4)
+        except Exception as e:
+            log_error("Could not save the quality curve. The next picture "
+                      "might need more trial encodes to fit the byte budget.", e)
+
+
+    @staticmethod
+    def _interpolate(curve: Dict[int, int], quality: int) -> Optional[float]:
+        """
+        Size at the given quality, interpolated linearly between the two
+        nearest points of the curve (extrapolated from the two nearest,
+        outside of it). None if the curve has less than two points.
+        """
+        if quality in curve:
+            return float(curve[quality])
+        if len(curve) < 2:
+            return None
+        qualities = sorted(curve)
+        below = [q for q in qualities if q < quality]
+        above = [q for q in qualities if q > quality]
+        if below and above:
+            first, second = below[-1], above[0]
+        elif below:
+            first, second = below[-2], below[-1]
+        else:
+            first, second = above[0], above[1]
+        slope = (curve[second] - curve[first]) / (second - first)
+        return max(1.0, curve[first] + slope * (quality - first))
+
+
+    def predict(self, key: str, quality: int, measured: Dict[int, int]) -> Optional[float]:
+        """
+        Predicts the size at the given quality, with the curve rescaled to
+        go through the measurement of this run nearest to that quality.
+        None if there's no curve for this key.
+        """
+        curve = self.curves.get(key, {})
+        size = self._interpolate(curve, quality)
+        if size is None:
+            return None
+        if measured:
+            reference = min(measured, key=lambda q: abs(q - quality))
+            reference_size = self._interpolate(curve, reference)
+            if reference_size:
+                size *= measured[reference] / reference_size
+        return size
+
+
+    def update(self, key: str, measured: Dict[int, int]) -> None:
+        """
+        Rescales the curve to the sizes measured in this run and
+        adds the measured points to it.
+        """
+        curve = self.curves.get(key, {})
+        ratios = sorted(size / self._interpolate(curve, quality)
+                            for quality, size in measured.items()
+                            if self._interpolate(curve, quality))
+        if ratios:
+            ratio = ratios[len(ratios) // 2]
+            curve = {quality: int(size * ratio) for quality, size in curve.items()}
+        curve.update(measured)
+        self.curves[key] = curve
+
+
+
+def encode_within_budget(image: Image.Image, extension: str, target_size: int,
+                         options: Dict[str, Any],
+                         curve: Optional[QualityCurve] = None) -> Tuple[BytesIO, int, int]:
+    """
+    Encodes the image with the highest quality in BYTE_BUDGET_QUALITY_RANGE
+    that results in at most `target_size` bytes. Bisects the range, but
+    the first trials go where the quality curve of the last runs predicts
+    the answer to be, so usually one or two trial encodes are enough.
+    If even the lowest quality does not fit, the smallest picture is kept.
+
+    Returns the picture, its quality and the number of trial encodes.
+    The curve is updated and saved.
+    """
+    curve = curve or QualityCurve()
+    key = f"{encoders.image_format(extension)} {image.width}x{image.height}"
+    low, high = BYTE_BUDGET_QUALITY_RANGE
+    measured = {}
+    best = None      # highest quality that fits, as (quality, picture)
+    smallest = None  # lowest quality that doesn't fit, as (quality, picture)
+
+    while low <= high and len(measured) < BYTE_BUDGET_MAX_TRIALS:
+
+        quality = (low + high) // 2
+        if len(measured) < BYTE_BUDGET_CURVE_GUIDED_TRIALS:
+            predictions = {q: curve.predict(key, q, measured) for q in range(low, high + 1)}
+            if None not in predictions.values():
+                fitting = [q for q, size in predictions.items() if size <= target_size]
+                if not fitting and best:
+                    break  # the curve says that nothing better fits
+                quality = max(fitting) if fitting else low
+
+        picture = BytesIO()
+        encoders.encode(image, picture, extension, dict(options, quality=quality))
+        measured[quality] = len(picture.getvalue())
+
+        if measured[quality] <= target_size:
+            best = (quality, picture)
+            low = quality + 1
+        else:
+            if not smallest or quality < smallest[0]:
+                smallest = (quality, picture)
+            high = quality - 1
+
+    curve.update(key, measured)
+    curve.save()
+
+    quality, picture = best or smallest
+    picture.seek(0)
+    return picture, quality, len(measured)
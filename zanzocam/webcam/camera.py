@@ -1,12 +1,14 @@
-from typing import Any, Dict, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
 
 import os
 import math
 import piexif
-from time import sleep
-from pathlib import Path
+from io import BytesIO
+from time import sleep, monotonic
+from datetime import datetime
 from fractions import Fraction
-from PIL import Image, ImageStat
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
 
 try:
     from picamera import PiCamera
@@ -16,6 +18,19 @@ except ImportError:  # On the CI picamera is not installed
 from zanzocam.constants import *
 from zanzocam.webcam.utils import log, log_error
 from zanzocam.webcam.overlays import Overlay
+from zanzocam.webcam.metering import (luminance_from_picture, luminance_from_histograms, 
+        linear_light, gamma_encode, channel_histograms, histogram_percentile, clipped_fraction, exposure_gain)
+from zanzocam.webcam.exposure_memory import ExposureMemory
+from zanzocam.webcam.solar import solar_elevation, predict_exposure_regime
+from zanzocam.webcam.daemon import DaemonCamera
+from zanzocam.webcam.stacking import FrameStack, estimate_noise
+from zanzocam.webcam.timings import timed
+from zanzocam.webcam import encoders, telemetry
+from zanzocam.webcam.byte_budget import encode_within_budget
+from zanzocam.webcam.fonts import save_metrics
+from zanzocam.webcam.overlay_cache import OverlayCache
+from zanzocam.webcam.compositing import compose_picture
+from zanzocam.webcam.templates import uses_placeholder
 
 
 
@@ -47,10 +62,19 @@ class Camera:
         if 'overlays' in camera_data.keys():
             self.overlays = camera_data['overlays']
 
-        # Image name
-        self.temp_photo_path = DATA_PATH / ('.temp_image.' + self.extension)
+        # Coordinates of the camera, used to predict the exposure from the sun position
+        self.location = camera_data.get('location') or {}
+
+        # The pictures are kept in memory, the SD card is not written.
+        # With `raw_capture`, temp_photo is a PIL image instead of a JPEG.
+        self.temp_photo = None
+        self.processed_image = None
+        # Where the final image used to be written: removed if it's left over
         self.processed_image_path = DATA_PATH / ('.final_image.' + self.extension)
 
+        # The smaller renditions of processed_image, as (name, extension, picture) tuples
+        self.processed_renditions = []
+
 
     def __getattr__(self, name):
         """ 
@@ -70,16 +94,25 @@ class Camera:
         self._process_picture()
 
 
+    @timed("camera init")
     def _prepare_camera_object(self, expanded_framerate_range: bool = False) -> int:
         """ 
         Sets up the camera object in a consistent way. Returns the PiCamera object, ready to use.
         if `expanded_framerate_range` is given, framerate_range is set to (1/10, 90).
         Use this function in `with` blocks only, or remember to close the returned `camera` object!
+
+        If the camera daemon is running, returns a DaemonCamera instead, which 
+        behaves like a PiCamera but does not need to warm up.
         """
-        if expanded_framerate_range:
-            camera = PiCamera(sensor_mode=3, framerate_range=(Fraction(1, 10), Fraction(15, 1)))
-        else:
-            camera = PiCamera(sensor_mode=3)  # sensor_mode 1 has a blue halo on v2!
+        camera = None
+        if self.use_camera_daemon:
+            camera = DaemonCamera.connect(expanded_framerate_range)
+
+        if not camera:
+            if expanded_framerate_range:
+                camera = PiCamera(sensor_mode=3, framerate_range=(Fraction(1, 10), Fraction(15, 1)))
+            else:
+                camera = PiCamera(sensor_mode=3)  # sensor_mode 1 has a blue halo on v2!
 
         if int(self.width) > camera.MAX_RESOLUTION.width:
             log(f"WARNING! The requested image width ({self.width}) "
@@ -101,13 +134,107 @@ class Camera:
             camera.awb_mode = self.awb_mode
         return camera
 
+
+    @staticmethod
+    @timed("warm-up")
+    def _camera_warm_up(camera) -> None:
+        """
+        Gives the firmware the time to compute the right exposure,
+        waiting at most CAMERA_WARM_UP_TIME seconds.
+        Not needed if the camera is kept open by the camera daemon, as long
+        as its ISO and exposure mode were not changed (see DaemonCamera).
+        """
+        if getattr(camera, "is_warm", False):
+            log("Camera already warm (camera daemon), no warm-up needed.")
+            return
+        Camera._wait_for_camera_to_settle(camera, CAMERA_WARM_UP_TIME, phase="Camera warm-up")
+
+
+    @staticmethod
+    def _camera_readings(camera) -> Optional[List[float]]:
+        """
+        Returns the analog and digital gain, the exposure speed and the 
+        AWB gains of the camera, or None if any of them is not available.
+        """
+        try:
+            readings = [camera.analog_gain, camera.digital_gain, camera.exposure_speed]
+            readings += list(camera.awb_gains or [None, None])
+            if any(reading is None for reading in readings):
+                return None
+            return [float(reading) for reading in readings]
+        except Exception:
+            return None
+
+
+    @staticmethod
+    def _wait_for_camera_to_settle(camera, max_wait: float, frame_time: float = 0,
+                                   phase: Optional[str] = None) -> Optional[float]:
+        """
+        Polls the camera until its gains, exposure speed and AWB gains
+        stop changing, for at most max_wait seconds. The camera is polled
+        at most once per frame, as the readings change only once per frame.
+        If `phase` is given, logs how the wait went under that name.
+
+        Returns how long it took to settle, or None if the camera did not
+        settle in time. If the camera doesn't report these readings there
+        is nothing to poll: returns None right away, without waiting.
+        """
+        start = monotonic()
+        previous = Camera._camera_readings(camera)
+        if previous is None:
+            if phase:
+                log(f"{phase}: the camera reports no gains to poll, not waiting.")
+            return None
+
+        interval = max(CAMERA_SETTLE_POLL_INTERVAL, frame_time)
+        stable_polls = 0
+        for _ in range(max(1, int(max_wait / interval))):
+            sleep(interval)
+            current = Camera._camera_readings(camera)
+
+            if current and all(abs(new - old) <= CAMERA_SETTLE_TOLERANCE * max(abs(old), 10**-6)
+                                for new, old in zip(current, previous)):
+                stable_polls += 1
+                if stable_polls >= CAMERA_SETTLE_STABLE_POLLS:
+                    settle_time = monotonic() - start
+                    if phase:
+                        log(f"{phase}: settled in {settle_time:.2f}s (upper bound: {max_wait:.1f}s).")
+                    return settle_time
+            else:
+                stable_polls = 0
+            previous = current or previous
+
+        if phase:
+            log(f"{phase}: waited the full {max_wait:.1f}s.")
+        return None
+
+
+    @timed("capture")
     def _camera_capture(self, camera):
         """
-        Takes a picture and saves it in the temporary picture path,
+        Takes a picture and stores it in memory in self.temp_photo,
         taking care of the logging too.
         """
         log("Taking picture...")
-        camera.capture(str(self.temp_photo_path))
+        if self.raw_capture:
+            # Unencoded frame: the final image will be encoded only once
+            frame = BytesIO()
+            camera.capture(frame, format="rgb")
+            self.temp_photo = self._image_from_rgb_frame(frame.getbuffer(), *camera.resolution)
+            self.temp_photo.info["exif"] = self._exif_for_raw_frame(camera)
+        else:
+            capture_format = self.extension.lower()
+            if capture_format == "jpg":
+                capture_format = "jpeg"
+            capture_arguments = {}
+            if capture_format == "jpeg":
+                # The picture might be uploaded as it is (see _process_picture)
+                capture_arguments['quality'] = self.jpeg_quality
+            self.temp_photo = BytesIO()
+            camera.capture(self.temp_photo, format=capture_format, **capture_arguments)
+            self.temp_photo.seek(0)
+        # For the overlays that show it
+        telemetry.record("exposure", self._camera_exposure(camera))
         exposure_speed = f"{camera.exposure_speed/10**6:.4f}" if camera.exposure_speed else '[auto]'
         shutter_speed = f"{camera.shutter_speed/10**6:.4f}" if camera.shutter_speed else '[auto]'
         iso = camera.iso if camera.iso else '[auto]'
@@ -115,33 +242,130 @@ class Camera:
             f"shutter speed: {shutter_speed}, iso: {iso}).")
             
 
+    @staticmethod
+    def _image_from_rgb_frame(frame: Any, width: int, height: int) -> Image.Image:
+        """
+        Wraps an unencoded RGB frame from the camera into a PIL image.
+        The camera pads the rows to a multiple of 32 pixels and the frame
+        to a multiple of 16 rows: the padding is cropped away.
+        """
+        width, height = int(width), int(height)
+        padded_width = (width + 31) // 32 * 32
+        padded_height = (height + 15) // 16 * 16
+        if len(frame) == width * height * 3:
+            padded_width, padded_height = width, height
+        elif len(frame) != padded_width * padded_height * 3:
+            raise ValueError(f"The frame is {len(frame)} bytes long, but a {width}x{height} "
+                             f"RGB frame should be {padded_width * padded_height * 3} bytes long.")
+
+        image = Image.frombuffer("RGB", (padded_width, padded_height), bytes(frame), "raw", "RGB", 0, 1)
+        if (padded_width, padded_height) != (width, height):
+            image = image.crop((0, 0, width, height))
+        return image
+
+
+    @staticmethod
+    def _exif_for_raw_frame(camera) -> bytes:
+        """
+        Unencoded frames have no EXIF data: builds the essential ones
+        (time, exposure time and ISO) from the camera readings.
+        """
+        exif_dict = {"0th": {}, "Exif": {}}
+        exif_dict["Exif"][piexif.ExifIFD.DateTimeOriginal] = datetime.now().strftime("%Y:%m:%d %H:%M:%S")
+        try:
+            if camera.exposure_speed:
+                exif_dict["Exif"][piexif.ExifIFD.ExposureTime] = (int(camera.exposure_speed), 10**6)
+            if camera.iso:
+                exif_dict["Exif"][piexif.ExifIFD.ISOSpeedRatings] = int(camera.iso)
+        except Exception:
+            pass
+        return piexif.dump(exif_dict)
+
+
+    @staticmethod
+    def _camera_exposure(camera) -> Optional[Tuple[int, int]]:
+        """
+        Returns the exposure speed and the equivalent ISO (100 per unit of
+        gain) of the last picture, or None if the camera doesn't report them.
+        """
+        try:
+            gain = float(camera.analog_gain) * float(camera.digital_gain)
+            if camera.exposure_speed and gain:
+                return int(camera.exposure_speed), int(round(100 * gain))
+        except Exception:
+            pass
+        return None
+
+
     def _shoot_picture(self) -> None:
         """
         Shoots the picture using PiCamera. If the luminance is found  
         to be too low, uses an iterative algorithm to adjusts the 
         shutter speed of the camera value and tries again.
         """
-        with self._prepare_camera_object() as camera:
-            log(f"Camera warm-up ({CAMERA_WARM_UP_TIME}s)...")
-            sleep(CAMERA_WARM_UP_TIME)
-            self._camera_capture(camera)
+        predicted_regime = None
+        if self.use_low_light_algorithm:
+            predicted_regime = self._predict_exposure_regime()
 
-        # If the low light algorithm is disabled, return
-        if not self.use_low_light_algorithm:
-            log(f"Luminance won't be checked, because "
-                f"`use_low_light_algorithm = {self.use_low_light_algorithm}`.")
-            return
+        if predicted_regime == "night":
+            # The automatic exposure would surely be too dark:
+            # skip the probe shot and go straight for a long exposure
+            log("Night predicted: skipping the automatic exposure.")
+            initial_luminance = 0
+            new_luminance, shutter_speed, iso, attempts = self._low_light_correction(initial_luminance)
 
-        # Test the luminance: if the picture is bright enough, return
-        initial_luminance = self._luminance_from_path(self.temp_photo_path)
-        if initial_luminance >= MINIMUM_DAYLIGHT_LUMINANCE:
-            log(f"Daylight luminance detected: {initial_luminance:.2f} "
-                f"(lower bound is {MINIMUM_DAYLIGHT_LUMINANCE}).")
-            return
+            # Estimate what the automatic exposure would have measured:
+            # the exposure scales the linear light, not the luminance
+            probe_light = (linear_light(new_luminance) * (MIN_SHUTTER_SPEED / shutter_speed)
+                                                       * (INITIAL_LOW_LIGHT_ISO / iso))
+            probe_luminance = float(gamma_encode(probe_light))
+            time_saved = MIN_SHUTTER_SPEED / 10**6
+            if not (self.use_camera_daemon and os.path.exists(CAMERA_DAEMON_SOCKET)):
+                time_saved += CAMERA_WARM_UP_TIME
+            log(f"Exposure regime predicted: night, measured: "
+                f"{self._measured_exposure_regime(probe_luminance)} (estimated). "
+                f"Time saved: about {time_saved:.1f}s (warm-up and automatic exposure).")
+
+        else:
+            with self._prepare_camera_object() as camera:
+                self._camera_warm_up(camera)
+                self._camera_capture(camera)
+                automatic_exposure = self._camera_exposure(camera)
 
-        # We're in low light conditions and allowed to try correcting it.
-        # Calculate new shutter speed with the low light algorithm
-        new_luminance, shutter_speed, iso, attempts = self._low_light_search(initial_luminance)
+            # If the low light algorithm is disabled, return
+            if not self.use_low_light_algorithm:
+                log(f"Luminance won't be checked, because "
+                    f"`use_low_light_algorithm = {self.use_low_light_algorithm}`.")
+                return
+
+            # If it's surely daytime, don't even check the luminance
+            if predicted_regime == "day":
+                log("Exposure regime predicted: day, measured: not checked. "
+                    "Time saved: the luminance check.")
+                return
+
+            # Test the luminance: if the picture is bright enough, return
+            initial_luminance = self._luminance_from_picture(self.temp_photo)
+            if predicted_regime:
+                log(f"Exposure regime predicted: {predicted_regime}, measured: "
+                    f"{self._measured_exposure_regime(initial_luminance)}. Time saved: none.")
+
+            if initial_luminance >= MINIMUM_DAYLIGHT_LUMINANCE:
+                log(f"Daylight luminance detected: {initial_luminance:.2f} "
+                    f"(lower bound is {MINIMUM_DAYLIGHT_LUMINANCE}).")
+                return
+
+            # We're in low light conditions and allowed to try correcting it.
+            # Calculate new shutter speed with the low light algorithm
+            new_luminance, shutter_speed, iso, attempts = self._low_light_correction(
+                initial_luminance, automatic_exposure)
+
+        # Long exposures can be replaced by a burst of shorter ones, stacked
+        if (self.night_stacking_frames and int(self.night_stacking_frames) > 1 and
+                shutter_speed >= NIGHT_STACKING_MIN_SHUTTER_SPEED):
+            target_luminance = self._compute_target_luminance(initial_luminance)
+            self._stack_night_frames(new_luminance, shutter_speed, iso, target_luminance)
+            return
 
         # If we're good without one final picture with the long wait for the AWB, return here
         if not self.let_awb_settle_in_dark:
@@ -157,19 +381,257 @@ class Camera:
             camera.iso = iso
             
             timeout = (shutter_speed/10**6) * 7 + 5
-            log(f"Adjusting white balance: will take {timeout:.1f} seconds...")
-            sleep(timeout)
+            self._wait_for_camera_to_settle(camera, timeout, frame_time=shutter_speed/10**6,
+                                            phase="Adjusting white balance")
             camera.exposure_mode = "off"
 
             self._camera_capture(camera)
 
-        final_luminance = self._luminance_from_path(str(self.temp_photo_path))
+        final_luminance = self._luminance_from_picture(self.temp_photo)
+        log(f"Final luminance: {final_luminance:.2f}.")
+
+
+    def _stack_night_frames(self, luminance: float, shutter_speed: int, iso: int,
+                            target_luminance: float) -> None:
+        """
+        Replaces the single long exposure found by the low light correction
+        with a burst of `night_stacking_frames` shorter ones, summed in linear
+        light (see FrameStack) and brightened to the target luminance.
+        The frames are captured and added to the stack one at a time, so only
+        one of them is in memory at any time. Black frames are left out, and
+        the stack is brightened for the frames that are in it.
+
+        Logs the time taken and the noise of the stack compared with the
+        single long exposure, which is kept if anything goes wrong.
+        """
+        frames = min(int(self.night_stacking_frames), NIGHT_STACKING_MAX_FRAMES)
+
+        # The exposure (shutter speed * ISO) needed to reach the target,
+        # which can be more than a single picture can get
+        exposure = (shutter_speed * iso * linear_light(target_luminance) / 
+                    linear_light(max(luminance, NO_LUMINANCE_THRESHOLD)))
+        frame_shutter_speed, frame_iso = self._split_exposure(exposure / frames)
+        frame_exposure = frame_shutter_speed * frame_iso
+
+        log(f"Stacking {frames} frames (shutter speed: {frame_shutter_speed/10**6:.2f}s, "
+            f"ISO: {frame_iso}, gain: {exposure / (frames * frame_exposure):.2f}) "
+            f"instead of a single exposure (shutter speed: {shutter_speed/10**6:.2f}s, ISO: {iso}).")
+
+        single_noise = "unknown"
+        if isinstance(self.temp_photo, Image.Image):
+            single_noise = f"{estimate_noise(self.temp_photo):.2f}"
+        elif self.temp_photo:
+            single_noise = f"{estimate_noise(Image.open(self.temp_photo)):.2f}"
+            self.temp_photo.seek(0)
+
+        capture_format = self.extension.lower()
+        if capture_format == "jpg":
+            capture_format = "jpeg"
+
+        try:
+            start = monotonic()
+            stack = FrameStack()
+            stream = BytesIO()
+
+            with self._prepare_camera_object(expanded_framerate_range=True) as camera:
+                camera.shutter_speed = frame_shutter_speed
+                camera.iso = frame_iso
+                timeout = (frame_shutter_speed/10**6) * 7 + 5
+                self._wait_for_camera_to_settle(camera, timeout, frame_time=frame_shutter_speed/10**6,
+                                                phase="Night stacking")
+                camera.exposure_mode = "off"
+
+                # capture_continuous keeps the sensor running between the frames.
+                # The camera daemon can only capture one picture at a time.
+                captures = None
+                if not isinstance(camera, DaemonCamera):
+                    captures = camera.capture_continuous(stream, format=capture_format)
+                try:
+                    for frame in range(frames):
+                        if captures:
+                            next(captures)
+                        else:
+                            camera.capture(stream, format=capture_format)
+                        stream.seek(0)
+                        stack.add(stream)
+                        stream.seek(0)
+                        stream.truncate()
+                finally:
+                    if captures:
+                        captures.close()
+
+            if stack.skipped:
+                log(f"Night stacking: {stack.skipped} black frames left out of the stack.")
+            gain = exposure / (stack.frames * frame_exposure) if stack.frames else 1
+            stacked_image = stack.image(gain)
+            if self.raw_capture:
+                # No need to encode it: it's encoded once it's processed
+                stacked_photo = stacked_image
+                if stack.exif:
+                    stacked_photo.info["exif"] = stack.exif
+            else:
+                stacked_photo = BytesIO()
+                save_arguments = {'format': capture_format}
+                if capture_format == "jpeg":
+                    save_arguments['quality'] = 95
+                    if stack.exif:
+                        save_arguments['exif'] = stack.exif
+                stacked_image.save(stacked_photo, **save_arguments)
+                stacked_photo.seek(0)
+            stack_time = monotonic() - start
+
+        except Exception as e:
+            log_error("Night stacking failed. Keeping the single exposure.", e)
+            return
+
+        self.temp_photo = stacked_photo
+        telemetry.record("exposure", (stack.frames * frame_shutter_speed, int(round(frame_iso * gain))))
+        stacked_noise = estimate_noise(stacked_image)
+        single_time = shutter_speed / 10**6
+        if self.let_awb_settle_in_dark:
+            single_time += (shutter_speed / 10**6) * 7 + 5
+
+        log(f"Night stacking: {stack.frames} frames in {stack_time:.1f}s "
+            f"(single exposure: up to {single_time:.1f}s). "
+            f"Noise: {stacked_noise:.2f} (single exposure: {single_noise}).")
+        final_luminance = self._luminance_from_picture(self.temp_photo)
         log(f"Final luminance: {final_luminance:.2f}.")
 
 
-    def _low_light_search(self, initial_luminance: int) -> Tuple[float, int, int, int]:
+    def _low_light_correction(self, initial_luminance: float, 
+                              automatic_exposure: Optional[Tuple[int, int]] = None) -> Tuple[float, int, int, int]:
+        """
+        Runs the low light strategy selected with `low_light_strategy`:
+        'search' (iterative, see _low_light_search) or 'histogram' 
+        (estimated from the histogram, see _histogram_exposure).
+        Logs how many captures it needed, to compare them in the field.
+        """
+        strategy = self.low_light_strategy
+        if strategy == "histogram":
+            result = self._histogram_exposure(initial_luminance, automatic_exposure)
+        else:
+            if strategy != "search":
+                log(f"WARNING! Unknown low light strategy '{strategy}'. Using 'search'.")
+                strategy = "search"
+            result = self._low_light_search(initial_luminance, automatic_exposure)
+
+        log(f"Low light strategy '{strategy}': {result[3]} captures needed.")
+        return result
+
+
+    def _histogram_exposure(self, initial_luminance: float, 
+                            automatic_exposure: Optional[Tuple[int, int]] = None) -> Tuple[float, int, int, int]:
+        """
+        Estimates the shutter speed and ISO needed to reach the target
+        luminance from the histogram of the last picture taken, accounting
+        for the tone curve and for the saturated pixels, so that most of 
+        the times one corrective capture is enough. If it's not, estimates
+        again from the new picture, up to HISTOGRAM_MAX_CAPTURES times.
+
+        If known, `automatic_exposure` is the (shutter speed, ISO) the last 
+        picture was taken with. Returns the final luminance, the shutter 
+        speed, the ISO and the number of captures, in this order.
+        """
+        target_luminance = self._compute_target_luminance(initial_luminance)
+        log(f"Low light detected: {initial_luminance:.2f} "
+            f"(lower bound is {MINIMUM_DAYLIGHT_LUMINANCE}). "
+            f"Estimating the exposure from the histogram. "
+            f"Target luminance: {target_luminance:.2f} (tolerance: {TARGET_LUMINOSITY_MARGIN})")
+
+        # Without the readings of the camera, assume the automatic exposure
+        # was as long as PiCamera would go on its own
+        shutter_speed, iso = automatic_exposure or (MIN_SHUTTER_SPEED, INITIAL_LOW_LIGHT_ISO)
+        histograms = channel_histograms(self.temp_photo) if self.temp_photo else None
+        luminance = initial_luminance
+
+        with self._prepare_camera_object(expanded_framerate_range=True) as camera:
+
+            camera.iso = INITIAL_LOW_LIGHT_ISO
+            self._camera_warm_up(camera)
+
+            # The black pictures are retried without counting as captures,
+            # but at most HISTOGRAM_MAX_CAPTURES times
+            capture, black_pictures = 0, 0
+            while (capture - black_pictures < HISTOGRAM_MAX_CAPTURES and
+                    black_pictures < HISTOGRAM_MAX_CAPTURES):
+                capture += 1
+
+                # The exposure and the picture the histograms are of
+                previous_exposure, previous_photo = (shutter_speed, iso), self.temp_photo
+                exposure = shutter_speed * iso
+                estimated = not (histograms is None or
+                                 histogram_percentile(histograms, 99) < HISTOGRAM_MIN_LEVEL)
+                if not estimated:
+                    # Too dark to say anything: try a long exposure first,
+                    # or the longest if that was dark too
+                    gain = NO_LUMINANCE_SHUTTER_SPEED * INITIAL_LOW_LIGHT_ISO / exposure
+                    if gain <= 1:
+                        gain = MAX_SHUTTER_SPEED * 800 / exposure
+                    log(f"# {capture}: too dark to estimate the exposure from the histogram. "
+                        f"Exposing {gain:.1f} times longer.")
+                else:
+                    gain = exposure_gain(histograms, target_luminance)
+                    log(f"# {capture}: median level {histogram_percentile(histograms, 50)}, "
+                        f"99th percentile {histogram_percentile(histograms, 99)}, "
+                        f"{clipped_fraction(histograms)*100:.1f}% clipped. "
+                        f"Exposing {gain:.2f} times longer.")
+
+                shutter_speed, iso = self._split_exposure(exposure * gain)
+                camera.iso = iso
+                camera.shutter_speed = shutter_speed
+                camera.exposure_mode = "off"
+                self._camera_capture(camera)
+
+                # In rare cases, the camera might return pitch black images for no good reason.
+                # So if the exposure was estimated for some light and the luminance is 0,
+                # forget the picture and retry the same exposure.
+                new_histograms = channel_histograms(self.temp_photo)
+                if estimated and luminance_from_histograms(new_histograms) <= 0.001:
+                    log(f"# {capture}: The camera shot a fully black picture. Trying again.")
+                    shutter_speed, iso = previous_exposure
+                    self.temp_photo = previous_photo
+                    black_pictures += 1
+                    continue
+                histograms = new_histograms
+                luminance = telemetry.record("luminance", luminance_from_histograms(histograms))
+
+                if abs(luminance - target_luminance) <= TARGET_LUMINOSITY_MARGIN:
+                    log(f"# {capture}: OK! Luminance achieved: {luminance:.2f}.")
+                    return luminance, shutter_speed, iso, capture
+
+                if (luminance < target_luminance and 
+                        shutter_speed >= MAX_SHUTTER_SPEED and iso >= 800):
+                    log(f"WARNING! ISO is at 800 and shutter speed is at max "
+                        f"({MAX_SHUTTER_SPEED/10**6:.2f}). Cannot increase further.")
+                    return luminance, shutter_speed, iso, capture
+
+                log(f"# {capture}: missed. Luminance achieved: {luminance:.2f}.")
+
+        log_error(f"The histogram estimate did not reach the target luminance! "
+                  f"Returning the last values (shutter speed: {shutter_speed}, "
+                  f"luminance: {luminance}, iso: {iso}).")
+        return luminance, shutter_speed, iso, capture
+
+
+    @staticmethod
+    def _split_exposure(exposure: float) -> Tuple[int, int]:
+        """
+        Splits an exposure (shutter speed * ISO) into shutter speed and ISO,
+        keeping the ISO as low as possible (starting from INITIAL_LOW_LIGHT_ISO),
+        and both within what the camera allows.
+        """
+        iso = INITIAL_LOW_LIGHT_ISO
+        while exposure / iso > MAX_SHUTTER_SPEED and iso < 800:
+            iso *= 2
+        shutter_speed = int(min(max(exposure / iso, 1), MAX_SHUTTER_SPEED))
+        return shutter_speed, iso
+
+
+    def _low_light_search(self, initial_luminance: int, 
+                          automatic_exposure: Optional[Tuple[int, int]] = None) -> Tuple[float, int, int, int]:
         """
         Tries to find the correct shutter speed in low-light conditions.
+        If known, `automatic_exposure` is the (shutter speed, ISO) the initial picture was taken with.
         Returns the final luminance, the shutter speed, and the number of attempts done, in this order.
         """
         target_luminance = self._compute_target_luminance(initial_luminance)        
@@ -181,11 +643,33 @@ class Camera:
             f"max exposure time: {MAX_SHUTTER_SPEED/10**6:.2f}, "
             f"initial ISO: {INITIAL_LOW_LIGHT_ISO}")
 
+        # If a similar night has been seen recently, start from
+        # the values the search converged to back then
+        memory = None
+        seed = None
+        if self.use_exposure_memory:
+            memory = ExposureMemory()
+            seed = memory.seed(initial_luminance, target_luminance)
+
+        iso = INITIAL_LOW_LIGHT_ISO
+        samples = []
+        if seed:
+            shutter_speed, iso = seed
+
+        # The automatic picture already tells how bright the scene is
+        # for a known exposure, so the first attempt can aim at the target
+        elif automatic_exposure and initial_luminance >= NO_LUMINANCE_THRESHOLD:
+            samples.append((*automatic_exposure, initial_luminance))
+            shutter_speed = self._low_light_solver(samples, iso, target_luminance)
+            log(f"Starting from the automatic exposure (shutter speed: "
+                f"{automatic_exposure[0]/10**6:.4f}s, ISO: {automatic_exposure[1]}): "
+                f"shutter speed set to {shutter_speed/10**6:.2f}s")
+
         # When luminance is <1, the equation doesn't work very well and 
         # gives an overestimated shutter speed value. So we'd rather
         # attempt a random 2sec shot to get a better initial estimate
         # of the actual ambient luminance and try again
-        if initial_luminance < 1:
+        elif initial_luminance < 1:
             log(f"Luminance is below {NO_LUMINANCE_THRESHOLD}: "
                 f"shutter speed set to {NO_LUMINANCE_SHUTTER_SPEED/10**6:.2f}s")
             shutter_speed = NO_LUMINANCE_SHUTTER_SPEED
@@ -199,9 +683,8 @@ class Camera:
         # time and require a warm-up of at least 5 seconds every time.
         with self._prepare_camera_object(expanded_framerate_range=True) as camera:
 
-            camera.iso = INITIAL_LOW_LIGHT_ISO
-            log(f"Camera warm-up ({CAMERA_WARM_UP_TIME}s)...")
-            sleep(CAMERA_WARM_UP_TIME)
+            camera.iso = iso
+            self._camera_warm_up(camera)
 
             for attempt in range(1, 10):
                 
@@ -209,7 +692,8 @@ class Camera:
                 camera.shutter_speed = shutter_speed          
                 camera.exposure_mode = "off"
                 self._camera_capture(camera)
-                new_luminance = self._luminance_from_path(self.temp_photo_path)
+                new_luminance = self._luminance_from_picture(self.temp_photo)
+                samples.append((shutter_speed, camera.iso, new_luminance))
 
                 # In rare cases, the camera might return pitch black images for no good reason.
                 # So if the luminance is 0, just retry.
@@ -232,6 +716,8 @@ class Camera:
                         if camera.iso >= 800:
                             log(f"WARNING! ISO is at 800 and shutter speed is at max "
                                 f"({MAX_SHUTTER_SPEED/10**6:.2f}). Cannot increase further.")
+                            if memory:
+                                memory.remember(initial_luminance, shutter_speed, camera.iso, new_luminance)
                             return new_luminance, shutter_speed, camera.iso, attempt
 
                         log(f"Not allowed to raise the shutter speed further. "
@@ -242,10 +728,12 @@ class Camera:
                 # Otherwise return the match
                 else:
                     log(f"# {attempt}: OK! Luminance achieved: {new_luminance:.2f}.")
+                    if memory:
+                        memory.remember(initial_luminance, shutter_speed, camera.iso, new_luminance)
                     return new_luminance, shutter_speed, camera.iso, attempt
 
                 # Compute the shutter speed and loop
-                shutter_speed = self._low_light_equation(shutter_speed, new_luminance, target_luminance)
+                shutter_speed = self._low_light_solver(samples, camera.iso, target_luminance)
 
             # Exit condition - 10 iterations      
             log_error(f"The low light algorithm failed! "
@@ -254,34 +742,102 @@ class Camera:
                       f"luminance: {new_luminance}, iso: {camera.iso}).")
             return new_luminance, shutter_speed, camera.iso, attempt
         
+    def _predict_exposure_regime(self) -> Optional[str]:
+        """
+        Predicts the exposure regime ('day', 'twilight' or 'night') from the
+        position of the sun. Returns None if the location of the camera is
+        not configured or invalid, so that the luminance gets measured.
+        """
+        if not self.location:
+            return None
+        try:
+            elevation = solar_elevation(float(self.location["latitude"]),
+                                        float(self.location["longitude"]))
+        except Exception as e:
+            log_error("Could not compute the position of the sun. "
+                      "Check the 'location' section of the configuration. "
+                      "The luminance will be measured instead.", e)
+            return None
+
+        regime = predict_exposure_regime(elevation)
+        log(f"Sun elevation: {elevation:.1f} degrees. Predicted exposure regime: {regime}.")
+        return regime
+
+
+    @staticmethod
+    def _measured_exposure_regime(luminance: float) -> str:
+        """
+        The exposure regime an automatically exposed picture 
+        with the given luminance belongs to.
+        """
+        if luminance >= MINIMUM_DAYLIGHT_LUMINANCE:
+            return "day"
+        if luminance < NO_LUMINANCE_THRESHOLD:
+            return "night"
+        return "twilight"
+
+
     @staticmethod
-    def _low_light_equation(shutter_speed, initial_luminance, target_luminance) -> int:
+    def _low_light_solver(samples: List[Tuple[int, int, float]], iso: int, target_luminance: float) -> int:
         """
-        Given a starting luminance, computes the best estimate of 
-        the shutter speed needed to achieve the target luminance.
+        Given the pictures taken so far as (shutter speed, ISO, luminance) 
+        triples, computes the best estimate of the shutter speed needed to 
+        achieve the target luminance at the given ISO.
+
+        The luminance is computed on gamma encoded pixels, so it's not 
+        proportional to the exposure (shutter speed * ISO): it's converted 
+        back to linear light first. The response of the sensor is then 
+        modeled as light = k * exposure ^ slope, where the slope is 1 until
+        two pictures are available, and then is fitted by secant on the two 
+        pictures closest to the target. If the model points outside of the 
+        exposures already known to be too dark and too bright, the estimate 
+        bisects them instead.
         """
-        # There should be a check in _low_light_search,
-        # but let's make real sure that no zero division errors occur.
-        if not initial_luminance:
-            initial_luminance = 0.001  
-        target_shutter_speed = (shutter_speed / initial_luminance) * target_luminance
+        # Fully black pictures carry no information
+        samples = [(shutter * sample_iso, linear_light(luminance))
+                    for shutter, sample_iso, luminance in samples if luminance > 0.001]
+        if not samples:
+            return int(NO_LUMINANCE_SHUTTER_SPEED)
+        target_light = linear_light(target_luminance)
+
+        too_dark = [sample for sample in samples if sample[1] < target_light]
+        too_bright = [sample for sample in samples if sample[1] >= target_light]
+        darker = max(too_dark) if too_dark else None      # Brightest of the dark ones
+        brighter = min(too_bright) if too_bright else None  # Darkest of the bright ones
+
+        # Fit the slope on the bracket if there is one, otherwise on the last two pictures
+        slope = 1
+        pair = (darker, brighter) if darker and brighter else samples[-2:]
+        if len(pair) == 2 and pair[0][0] != pair[1][0]:
+            (first_exposure, first_light), (second_exposure, second_light) = pair
+            fitted_slope = (math.log(second_light / first_light) / 
+                            math.log(second_exposure / first_exposure))
+            slope = min(max(fitted_slope, LOW_LIGHT_MIN_SLOPE), LOW_LIGHT_MAX_SLOPE)
 
+        # Move from the picture closest to the target
+        exposure, light = min(samples, key=lambda sample: abs(math.log(sample[1] / target_light)))
+        target_exposure = exposure * (target_light / light) ** (1 / slope)
+
+        if darker and brighter and not darker[0] < target_exposure < brighter[0]:
+            target_exposure = math.sqrt(darker[0] * brighter[0])
+
+        target_shutter_speed = target_exposure / iso
         if target_shutter_speed > MAX_SHUTTER_SPEED:
             log(f"Max shutter speed has been reached, "
                 f"capping it to {MAX_SHUTTER_SPEED/10**6}.")
             return int(MAX_SHUTTER_SPEED)
 
-        return int(target_shutter_speed)
+        return max(int(target_shutter_speed), 1)
 
 
     @staticmethod
-    def _luminance_from_path(path: Path) -> int:
+    @timed("luminance")
+    def _luminance_from_picture(picture: Any) -> int:
         """
-        Given a path to an image, returns its luminance
+        Given an image (a path, a file-like object or a PIL image), returns its luminance.
+        See zanzocam.webcam.metering for the details.
         """
-        photo = Image.open(str(path))
-        r, g, b = ImageStat.Stat(photo).mean
-        return math.sqrt(0.241*(r**2) + 0.691*(g**2) + 0.068*(b**2))
+        return telemetry.record("luminance", luminance_from_picture(picture))
 
 
     @staticmethod
@@ -302,30 +858,51 @@ class Camera:
     def _process_picture(self) -> None:
         """ 
         Renders text and images over the picture and saves the resulting image.
+
+        Without overlays, a JPEG picture is not decoded at all: only its
+        EXIF data is updated (see _process_picture_without_overlays),
+        unless the JPEG encoder options or the byte budget (`target_size`)
+        ask for a different encoding.
         """
+        target_size = self._target_size()
+        if (not self.overlays and self.extension.lower() in ["jpg", "jpeg"] and
+                isinstance(self.temp_photo, BytesIO) and not target_size and
+                not self.jpeg_optimize and not self.jpeg_progressive):
+            self._process_picture_without_overlays()
+            return
+
         # Open and measures the picture
         try:
-            photo = Image.open(str(self.temp_photo_path)).convert("RGBA")
+            with timed("decode"):
+                if isinstance(self.temp_photo, Image.Image):
+                    photo = self.temp_photo
+                else:
+                    photo = Image.open(self.temp_photo)
+                    photo.load()
+                if photo.mode != "RGB":
+                    photo = photo.convert("RGB")
         except Exception as e:
             log_error("Failed to open the image for editing. "
                       "The photo will have no overlays applied.", e)
             return
 
+        # The luminance is not measured in daylight: measure it if an overlay shows it
+        texts = [str(data.get("text", "")) for data in self.overlays.values() if isinstance(data, dict)]
+        if uses_placeholder(texts, "LUMINANCE"):
+            telemetry.collect("luminance", lambda: self._luminance_from_picture(photo))
+
         # Create the overlay images
-        rendered_overlays = []
-        for position, data in self.overlays.items():
-            try:
-                overlay = Overlay(position, data, 
-                                  photo.width, 
-                                  photo.height, 
-                                  self.date_format, 
-                                  self.time_format)
-                if overlay.rendered_image:
-                    rendered_overlays.append(overlay)
-                    
-            except Exception as e:
-                log_error(f"Something happened processing the overlay {position}. "
-                          f"This overlay will be skipped.", e)
+        overlay_cache = OverlayCache()
+        with timed("overlay render"):
+            rendered_overlays = self._render_overlays(photo.width, photo.height, overlay_cache)
+
+        if overlay_cache.misses:
+            overlay_cache.evict()
+
+        # With the camera daemon the runs are short: the glyph metrics
+        # are kept for the next one instead of being measured again
+        if self.use_camera_daemon and os.path.exists(CAMERA_DAEMON_SOCKET):
+            save_metrics()
 
         # Calculate final image size
         border_top = 0
@@ -340,19 +917,12 @@ class Camera:
                     border_bottom = max(border_bottom, overlay.rendered_image.height)
         total_height = photo.height + border_top + border_bottom
 
-        # Generate canvas of the correct size
-        image = Image.new("RGBA", 
-                          (photo.width, total_height),
-                          color=self.background_color)
-
-        # Add the picture on the canvas
-        image.paste(photo, (0, border_top))
-
-        # Add the overlays on the canvas in the right position
+        # Find where to paste the overlays
+        positioned_overlays = []
         for overlay in rendered_overlays:
             if overlay.rendered_image:  # it might be None if it failed along the way
-                x, y = overlay.compute_position(image.width, image.height, border_top, border_bottom)
-                if x + overlay.rendered_image.width > image.width:
+                x, y = overlay.compute_position(photo.width, total_height, border_top, border_bottom)
+                if x + overlay.rendered_image.width > photo.width:
                     log("WARNING! This overlay exceeds the margin of the image itself "
                         "on the right. It might not be fully visible in the final picture.")
                 if x < 0:
@@ -361,16 +931,26 @@ class Camera:
                 if y < 0:
                     log("WARNING! This overlay exceeds the margin of the image itself "
                         "at the top. It might not be fully visible in the final picture.")
-                if y + overlay.rendered_image.height > image.height:
+                if y + overlay.rendered_image.height > total_height:
                     log("WARNING! This overlay exceeds the margin of the image itself "
                         "at the bottom. It might not be fully visible in the final picture.")
-                # mask is to allow for transparent images
-                image.paste(overlay.rendered_image, (x, y), mask=overlay.rendered_image)  
+                positioned_overlays.append((overlay.rendered_image, (x, y)))
+
+        # Paste them in one pass, without copying the photo if possible
+        if photo is self.temp_photo and not border_top and not border_bottom:
+            # It would be modified in place, but it's compared with the last picture
+            photo = photo.copy()
+        exif = photo.info.get("exif")
+        keep_transparency = (encoders.is_supported(self.extension) and
+                             encoders.keeps_transparency(self.extension))
+        image = compose_picture(photo, positioned_overlays, border_top, border_bottom,
+                                self.background_color, keep_transparency)
+        del photo
 
         # Recover and edit the EXIF data
         exif_bytes = None
         try:
-            exif_dict = piexif.load(photo.info["exif"])
+            exif_dict = piexif.load(exif)
             exif_dict["0th"][piexif.ImageIFD.Make] = f"ZanzoCam {VERSION} (https://zanzocam.github.io)"
             exif_dict["0th"][piexif.ImageIFD.Software] = f"ZanzoCam {VERSION} (https://zanzocam.github.io)"
             exif_dict["0th"][piexif.ImageIFD.ProcessingSoftware] = f"ZanzoCam {VERSION} (https://zanzocam.github.io)"
@@ -380,32 +960,254 @@ class Camera:
             # EXIF data is not critical, if something happens just drop them
             log_error("Failed to copy EXIF information from the photo to the final image. Ignoring them.", e)
         
-        # Save the image appropriately
-        save_arguments = {}
-        if exif_bytes:
-            save_arguments['exif'] = exif_bytes
+        # Save the image appropriately (in memory: the format can't be
+        # guessed from the file extension)
+        if not encoders.is_supported(self.extension):
+            log(f"WARNING! This version of Pillow can't write '{self.extension}' pictures. "
+                f"The picture will be saved as JPEG instead.")
+            self.extension = "jpg"
+            self.processed_image_path = DATA_PATH / ('.final_image.' + self.extension)
+
+        with timed("encode"):
+            image_format = encoders.image_format(self.extension)
+            if target_size and image_format in ["JPEG", "WEBP", "AVIF"]:
+                self.processed_image, quality, trials = encode_within_budget(
+                    image, self.extension, target_size,
+                    dict(self._encoder_options(), exif=exif_bytes))
+                log(f"Byte budget: quality {quality}, "
+                    f"{len(self.processed_image.getvalue()) // 1024} KB "
+                    f"(target: {target_size // 1024} KB, {trials} trial encodes).")
+                if len(self.processed_image.getvalue()) > target_size:
+                    log("WARNING! The picture does not fit in the byte budget even at "
+                        "the lowest quality. Consider a higher target_size or a smaller picture.")
+            else:
+                self.processed_image = BytesIO()
+                encoders.encode(image, self.processed_image, self.extension,
+                                dict(self._encoder_options(), exif=exif_bytes))
+                self.processed_image.seek(0)
 
-        if self.extension.lower() in ["jpg", "jpeg"]:
-            image = image.convert('RGB')
-            save_arguments['format'] = 'JPEG'
-            save_arguments['subsampling'] = self.jpeg_subsampling
-            save_arguments['quality'] = self.jpeg_quality
+        cache_use = ""
+        if overlay_cache.hits or overlay_cache.misses:
+            cache_use = f" (overlay cache: {overlay_cache.hits} hits, {overlay_cache.misses} misses)"
+        log(f"Picture processed: {len(rendered_overlays)} overlays rendered{cache_use}, "
+            f"picture encoded again as {image_format}.")
 
-        image.save(self.processed_image_path, **save_arguments)
+        # The renditions come from the same decoded and composed image
+        self._process_renditions(image, self._rendition_sizes(image.width, image.height))
+
+
+    def _target_size(self) -> int:
+        """
+        The byte budget of the picture in bytes (`target_size` is in KB),
+        or 0 if there is none.
+        """
+        try:
+            target_size = int(self.target_size or 0)
+            if target_size < 0:
+                raise ValueError(f"Negative target_size: {target_size}")
+        except (TypeError, ValueError):
+            log(f"WARNING! target_size must be a positive number of KB, not '{self.target_size}'. "
+                f"The picture will be encoded with jpeg_quality.")
+            return 0
+        return target_size * 1024
+
+
+    def _overlay_threads(self) -> int:
+        """
+        How many threads render the overlays: `overlay_threads`,
+        or one per CPU core if it's 0.
+        """
+        try:
+            threads = int(self.overlay_threads)
+        except (TypeError, ValueError):
+            log(f"WARNING! overlay_threads must be a number, not '{self.overlay_threads}'. "
+                f"The overlays will be rendered one by one.")
+            return 1
+        return threads if threads > 0 else (os.cpu_count() or 1)
+
+
+    def _render_overlays(self, photo_width: int, photo_height: int,
+                         cache: Optional[OverlayCache] = None) -> List[Overlay]:
+        """
+        Renders the overlays, in several threads if `overlay_threads`
+        allows it. Returns the ones that could be rendered, in the order
+        of the configuration (they might overlap).
+        """
+        render = lambda overlay: self._render_overlay(*overlay, photo_width, photo_height, cache)
+        threads = min(self._overlay_threads(), len(self.overlays))
+        if threads > 1:
+            # Pillow releases the GIL while decoding, resizing and drawing
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                overlays = list(pool.map(render, self.overlays.items()))
+        else:
+            overlays = [render(overlay) for overlay in self.overlays.items()]
+        return [overlay for overlay in overlays if overlay]
+
+
+    def _render_overlay(self, position: str, data: Dict[str, Any], photo_width: int,
+                        photo_height: int, cache: Optional[OverlayCache]) -> Optional[Overlay]:
+        """
+        Renders one overlay. Returns None if it can't be rendered:
+        any problem with it only skips this overlay.
+        """
+        try:
+            overlay = Overlay(position, data, 
+                              photo_width, 
+                              photo_height, 
+                              self.date_format, 
+                              self.time_format,
+                              cache=cache)
+            if overlay.rendered_image:
+                return overlay
+            
+        except Exception as e:
+            log_error(f"Something happened processing the overlay {position}. "
+                      f"This overlay will be skipped.", e)
+        return None
+
+
+    def _encoder_options(self) -> Dict[str, Any]:
+        """
+        The options of the encoders (see ENCODER_DEFAULTS) from the
+        camera configuration.
+        """
+        return {
+            "quality": self.jpeg_quality,
+            "subsampling": self.jpeg_subsampling,
+            "optimize": self.jpeg_optimize,
+            "progressive": self.jpeg_progressive,
+            "webp_method": self.webp_method,
+            "avif_speed": self.avif_speed,
+        }
+
+
+    def _process_picture_without_overlays(self) -> None:
+        """
+        Fast path of _process_picture: rewrites the EXIF data of the 
+        JPEG picture in place and uses the picture as it is, with no decoding
+        and no encoding. Saves a lot of time and memory on the smaller Pis.
+        """
+        with timed("exif update"):
+            picture = self.temp_photo.getvalue()
+            try:
+                exif_dict = piexif.load(picture)
+                exif_dict["0th"][piexif.ImageIFD.Make] = f"ZanzoCam {VERSION} (https://zanzocam.github.io)"
+                exif_dict["0th"][piexif.ImageIFD.Software] = f"ZanzoCam {VERSION} (https://zanzocam.github.io)"
+                exif_dict["0th"][piexif.ImageIFD.ProcessingSoftware] = f"ZanzoCam {VERSION} (https://zanzocam.github.io)"
+                exif_bytes = piexif.dump(exif_dict)
+                if exif_bytes:
+                    edited_picture = BytesIO()
+                    piexif.insert(exif_bytes, picture, edited_picture)
+                    picture = edited_picture.getvalue()
+
+            except Exception as e:
+                # EXIF data is not critical, if something happens just keep them as they are
+                log_error("Failed to copy EXIF information from the photo to the final image. Ignoring them.", e)
+
+            self.processed_image = BytesIO(picture)
+
+        log("Picture processed: no overlays, the picture was not encoded again.")
+
+        # The renditions need the picture to be decoded, but only
+        # at the size of the largest of them (JPEG draft mode)
+        if self.renditions:
+            try:
+                photo = Image.open(BytesIO(picture))
+                renditions = self._rendition_sizes(photo.width, photo.height)
+                if not renditions:
+                    return
+                with timed("decode"):
+                    photo.draft("RGB", renditions[0][3])
+                    photo = photo.convert("RGB")
+            except Exception as e:
+                log_error("Failed to open the image to create its renditions. "
+                          "Only the full picture will be uploaded.", e)
+                return
+            self._process_renditions(photo, renditions)
+
+
+    def _rendition_sizes(self, width: int, height: int) -> List[Tuple[str, str, int, Tuple[int, int]]]:
+        """
+        Reads the 'renditions' of the configuration (see RENDITION_DEFAULTS)
+        and computes the size of each for a picture of the given size.
+        Renditions are never larger than the picture.
+
+        Returns (name, extension, quality, size) tuples, from the largest 
+        rendition to the smallest.
+        """
+        renditions = []
+        for rendition in self.renditions or []:
+            try:
+                rendition = {**RENDITION_DEFAULTS, **rendition}
+                target_width, target_height = rendition["width"], rendition["height"]
+                if not target_width and not target_height:
+                    raise ValueError("Renditions need at least a width or a height.")
+                if not target_height:
+                    target_height = target_width * height / width
+                if not target_width:
+                    target_width = target_height * width / height
+                size = (max(1, min(width, int(round(target_width)))),
+                        max(1, min(height, int(round(target_height)))))
+                renditions.append((str(rendition["name"]), str(rendition["format"]).lower(), 
+                                   int(rendition["quality"]), size))
+
+            except Exception as e:
+                log_error(f"The rendition {rendition} is not valid. It will be skipped.", e)
+
+        return sorted(renditions, key=lambda rendition: -rendition[3][0] * rendition[3][1])
+
+
+    def _process_renditions(self, image: Image.Image, 
+                            renditions: List[Tuple[str, str, int, Tuple[int, int]]]) -> None:
+        """
+        Encodes the renditions computed by _rendition_sizes into
+        self.processed_renditions. Each rendition is scaled down from the
+        previous (larger) one, not from the full image: first with
+        Image.reduce(), that averages blocks of pixels and is very cheap,
+        then to its exact size with a resize by less than a factor of 2.
+        """
+        self.processed_renditions = []
+        if not renditions:
+            return
+
+        source = image
+        encoded = []
+        with timed("renditions"):
+            for name, extension, quality, (width, height) in renditions:
+                try:
+                    factor = min(source.width // width, source.height // height)
+                    if factor >= 2:
+                        source = source.reduce(factor)
+                    if source.size != (width, height):
+                        source = source.resize((width, height), Image.BILINEAR)
+
+                    picture = BytesIO()
+                    encoders.encode(source, picture, extension, 
+                                    dict(self._encoder_options(), quality=quality))
+                    picture.seek(0)
+                    self.processed_renditions.append((name, extension, picture))
+                    encoded.append(f"{name} {width}x{height} ({len(picture.getvalue()) // 1024} KB)")
+
+                except Exception as e:
+                    log_error(f"Failed to create the rendition '{name}'. It will be skipped.", e)
+
+        if encoded:
+            log(f"Renditions created: {', '.join(encoded)}.")
 
 
     def cleanup_image_files(self) -> bool:
         """
-        Delete all the image files that got created in the process.
+        Delete all the image files that got created in the process,
+        and release the in-memory pictures.
 
         Return True if no errors occurred, False otherwise
         """
         log("Cleaning up image files.")
+        self.temp_photo = None
+        self.processed_image = None
+        self.processed_renditions = []
 
         try:
-            if os.path.exists(self.temp_photo_path):
-                os.remove(self.temp_photo_path)
-
             if os.path.exists(self.processed_image_path):
                 os.remove(self.processed_image_path)
 
@@ -0,0 +1,45 @@
+from typing import Any, List, Tuple
+
+from PIL import Image, ImageColor
+
+
+def is_transparent(color: Any) -> bool:
+    """
+    Whether the color (a name, or an RGB or RGBA tuple) is not fully opaque.
+    """
+    if isinstance(color, str):
+        color = ImageColor.getrgb(color)
+    return len(color) > 3 and color[3] < 255
+
+
+def compose_picture(photo: Image.Image, overlays: List[Tuple[Image.Image, Tuple[int, int]]],
+                    border_top: int = 0, border_bottom: int = 0,
+                    background_color: Any = (0, 0, 0, 0),
+                    keep_transparency: bool = False) -> Image.Image:
+    """
+    Pastes the overlays, each given as an RGBA image and the position of
+    its top left corner, over the photo with the given borders above and
+    below it. Each overlay is blended only over its own area.
+
+    The picture stays in RGB, like the photo: only if the borders must be
+    transparent (`keep_transparency` and a transparent `background_color`)
+    it's RGBA. Without borders, the overlays are pasted on the photo
+    itself, which must then be RGB and is modified in place. With borders,
+    the photo is copied once into a picture of the final size.
+    """
+    if isinstance(background_color, list):
+        background_color = tuple(background_color)
+
+    if not border_top and not border_bottom:
+        picture = photo
+    else:
+        mode = "RGBA" if keep_transparency and is_transparent(background_color) else "RGB"
+        picture = Image.new(mode, (photo.width, photo.height + border_top + border_bottom),
+                            color=background_color)
+        picture.paste(photo, (0, border_top))
+
+    for overlay, position in overlays:
+        # The overlay is its own mask, to allow for transparent images
+        picture.paste(overlay, position, mask=overlay)
+
+    return picture
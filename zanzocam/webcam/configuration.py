@@ -7,7 +7,7 @@ import shutil
 from datetime import datetime
 from pathlib import Path
 
-from zanzocam.constants import CONFIGURATION_FILE
+from zanzocam.constants import CONFIGURATION_FILE, TIMELAPSE_DEFAULTS
 from zanzocam.webcam.utils import log, log_error, AllStringEncoder
 
 
@@ -143,9 +143,11 @@ class Configuration:
         """
         image_data = getattr(self, "image", {})
         overlays_data = getattr(self, "overlays", {})
+        location_data = getattr(self, "location", {})
         return {
             'image': image_data,
-            'overlays': overlays_data
+            'overlays': overlays_data,
+            'location': location_data
         }
 
     def get_system_settings(self):
@@ -153,13 +155,24 @@ class Configuration:
         Return all the information relative to the settings 
         that should be applied to the system.
 
-        For now is just the time settings.
+        For now is just the time settings, and the timelapse
+        ones (z-timelapse runs from the crontab).
         """
         time_data = getattr(self, "time", {})
+        timelapse_data = getattr(self, "timelapse", {})
         return {
-            'time': time_data
+            'time': time_data,
+            'timelapse': timelapse_data
         }
 
+    def get_timelapse_settings(self):
+        """
+        Return the settings of the daily timelapse, 
+        with the default values of the missing ones.
+        """
+        timelapse_data = getattr(self, "timelapse", {})
+        return {**TIMELAPSE_DEFAULTS, **timelapse_data}
+
     def within_active_hours(self) -> Optional[bool]:
         """
         Compares the current time with the start-stop times.
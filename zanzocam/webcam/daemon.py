@@ -0,0 +1,446 @@
+from typing import Any, Dict, Optional
+
+import os
+import sys
+import json
+import signal
+import socket
+import logging
+from io import BytesIO
+from pathlib import Path
+from fractions import Fraction
+from collections import namedtuple
+
+from zanzocam.constants import *
+from zanzocam.webcam.utils import log, log_error, log_row
+
+
+#: Settings that the client can forward to the daemon's camera
+DAEMON_CAMERA_SETTINGS = [
+    "resolution",
+    "framerate_range",
+    "vflip",
+    "hflip",
+    "rotation",
+    "awb_mode",
+    "iso",
+    "shutter_speed",
+    "exposure_mode",
+]
+
+#: What the daemon's camera measures, read by the client with the "read"
+#:  command. The gains are sent as fractions, like "1573/1000"
+DAEMON_CAMERA_READINGS = [
+    "exposure_speed",
+    "analog_gain",
+    "digital_gain",
+    "awb_gains",
+]
+
+#: The exposure settings of the daemon's camera between clients: the
+#:  camera has to warm up again if a client changes them
+DAEMON_AUTOMATIC_EXPOSURE = {"iso": 0, "exposure_mode": "auto"}
+
+Resolution = namedtuple('Resolution', 'width height')
+
+
+def _send_message(connection: socket.socket, message: Dict[str, Any], payload: bytes = b"") -> None:
+    """
+    Sends a JSON message on a single line, followed by the optional
+    binary payload (its length is given in the message as 'size').
+    """
+    if payload:
+        message = dict(message, size=len(payload))
+    connection.sendall(json.dumps(message).encode("utf-8") + b"\n" + payload)
+
+
+def _receive_message(stream: Any) -> Optional[Dict[str, Any]]:
+    """
+    Reads one JSON message from a file-like view of the socket.
+    If the message announces a payload, it is read and stored under 'payload'.
+    Returns None if the other side closed the connection.
+    """
+    line = stream.readline()
+    if not line:
+        return None
+    message = json.loads(line.decode("utf-8"))
+    if message.get("size"):
+        message["payload"] = stream.read(message["size"])
+    return message
+
+
+def _encode_setting(name: str, value: Any) -> Any:
+    """
+    The value of a camera setting as it can be sent as JSON.
+    """
+    if name == "framerate_range":
+        return [str(v) for v in value]
+    return value
+
+
+def _encode_reading(name: str, value: Any) -> Any:
+    """
+    A reading of the camera as it can be sent as JSON: the gains
+    become fraction strings, like "1573/1000".
+    """
+    if value is None or name == "exposure_speed":
+        return value
+    if name == "awb_gains":
+        return [str(gain) for gain in value]
+    return str(value)
+
+
+def _decode_reading(name: str, value: Any) -> Any:
+    """
+    A reading of the camera as PiCamera would return it.
+    """
+    if value is None or name == "exposure_speed":
+        return value
+    if name == "awb_gains":
+        return tuple(Fraction(gain) for gain in value)
+    return Fraction(value)
+
+
+
+class DaemonCamera:
+    """
+    Client side of the camera daemon. Mimics the subset of the PiCamera
+    interface used by Camera, so it can be used in its place: settings are
+    sent to the daemon as soon as they are assigned, and applied right
+    away like PiCamera does, so that the camera can settle on them before
+    the capture.
+
+    Use DaemonCamera.connect() to get an instance: it returns None if the
+    daemon is not running, so the caller can fall back to PiCamera.
+    """
+    def __init__(self, connection: socket.socket, framerate_range: Optional[tuple] = None):
+        self._connection = connection
+        self._stream = connection.makefile("rb")
+        self._settings = {}
+
+        _send_message(self._connection, {"command": "info"})
+        info = _receive_message(self._stream)
+        if not info or "error" in info:
+            raise RuntimeError(f"The camera daemon didn't reply properly: {info}")
+
+        self.MAX_RESOLUTION = Resolution(*info["max_resolution"])
+
+        # The daemon keeps the sensor running: AE and AWB are already converged,
+        # until the client changes the ISO or the exposure mode
+        self.is_warm = True
+
+        if framerate_range:
+            self.framerate_range = framerate_range
+
+
+    @staticmethod
+    def connect(expanded_framerate_range: bool = False,
+                socket_path: Optional[Path] = None) -> Optional["DaemonCamera"]:
+        """
+        Connects to the camera daemon, if it's running.
+        Returns None if it's not reachable.
+        """
+        if not socket_path:
+            socket_path = CAMERA_DAEMON_SOCKET
+        if not os.path.exists(socket_path):
+            return None
+
+        framerate_range = None
+        if expanded_framerate_range:
+            framerate_range = (Fraction(1, 10), Fraction(15, 1))
+
+        connection = None
+        try:
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(CAMERA_DAEMON_TIMEOUT)
+            connection.connect(str(socket_path))
+            camera = DaemonCamera(connection, framerate_range=framerate_range)
+            log("Using the camera daemon.")
+            return camera
+
+        except Exception as e:
+            log_error("The camera daemon socket exists, but the daemon "
+                      "can't be reached. Opening the camera directly.", e)
+            if connection:
+                connection.close()
+        return None
+
+
+    def __setattr__(self, name, value):
+        """
+        Camera settings are applied by the daemon as soon as they are assigned.
+        """
+        if name in DAEMON_CAMERA_SETTINGS:
+            self._request({
+                "command": "configure",
+                "settings": {name: _encode_setting(name, value)}
+            }, "apply the settings")
+            previous = self._settings.get(name, DAEMON_AUTOMATIC_EXPOSURE.get(name))
+            if name in DAEMON_AUTOMATIC_EXPOSURE and value != previous:
+                self.is_warm = False
+            self._settings[name] = value
+        else:
+            super().__setattr__(name, value)
+
+
+    def __getattr__(self, name):
+        """
+        Returns the settings as set by the client, or the readings of the
+        camera (like exposure_speed). The readings are asked to the daemon
+        every time, as PiCamera reads them from the camera: they can be
+        polled while the camera settles.
+        """
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in DAEMON_CAMERA_READINGS:
+            readings = self._request({"command": "read"}, "read the camera")["readings"]
+            return _decode_reading(name, readings.get(name))
+        return self._settings.get(name, None)
+
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a, **k):
+        self.close()
+
+    def close(self):
+        """
+        Closing the connection tells the daemon to go back to automatic mode.
+        """
+        try:
+            self._stream.close()
+            self._connection.close()
+        except Exception as e:
+            log_error("Failed to close the connection with the camera daemon.", e)
+
+
+    def _request(self, message: Dict[str, Any], action: str) -> Dict[str, Any]:
+        """
+        Sends a request to the daemon and returns its reply.
+        Raises RuntimeError if the daemon failed to `action`.
+        """
+        _send_message(self._connection, message)
+        reply = _receive_message(self._stream)
+
+        if reply is None:
+            raise RuntimeError("The camera daemon closed the connection.")
+        if "error" in reply:
+            raise RuntimeError(f"The camera daemon failed to {action}: {reply['error']}")
+        return reply
+
+
+    def capture(self, output: Any, format: Optional[str] = None, **kwargs) -> None:
+        """
+        Asks the daemon for a picture with the settings applied so far and
+        writes it into output, which can be a path or a writable file-like object.
+        """
+        if not format:
+            format = Path(str(output)).suffix.lstrip(".").lower() or "jpeg"
+        if format == "jpg":
+            format = "jpeg"
+
+        reply = self._request({"command": "capture", "format": format}, "capture")
+
+        if isinstance(output, (str, os.PathLike)):
+            with open(output, "wb") as picture:
+                picture.write(reply["payload"])
+        else:
+            output.write(reply["payload"])
+
+
+
+class CameraDaemon:
+    """
+    Keeps the PiCamera open and the sensor running, so that the automatic
+    exposure and white balance are always converged, and serves capture
+    requests coming from z-webcam on a Unix socket, one client at a time.
+    """
+    def __init__(self, socket_path: Optional[Path] = None):
+        self.socket_path = Path(socket_path or CAMERA_DAEMON_SOCKET)
+        self.camera = None
+        self._server = None
+
+
+    def open(self) -> None:
+        """
+        Opens the camera and the socket.
+        """
+        # Imported here because camera.py imports this module
+        from zanzocam.webcam.camera import PiCamera
+
+        log("Opening the camera...")
+        self.camera = PiCamera(sensor_mode=3)  # sensor_mode 1 has a blue halo on v2!
+        self._restore_automatic_mode()
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(str(self.socket_path))
+        self._server.listen(1)
+        log(f"Camera daemon listening on {self.socket_path}")
+
+
+    def close(self) -> None:
+        """
+        Closes the camera and removes the socket, so that z-webcam
+        goes back to open the camera directly.
+        """
+        if self._server:
+            server, self._server = self._server, None
+            try:
+                server.shutdown(socket.SHUT_RDWR)  # Wakes up accept()
+            except OSError:
+                pass
+            server.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        if self.camera:
+            self.camera.close()
+            self.camera = None
+        log("Camera daemon stopped.")
+
+
+    def serve_forever(self) -> None:
+        """
+        Serves one client at a time until the socket is closed.
+        """
+        while self._server:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                # The socket was closed by close()
+                break
+            try:
+                self.serve_client(connection)
+            except Exception as e:
+                log_error("Something went wrong serving a capture request.", e)
+            finally:
+                connection.close()
+                self._restore_automatic_mode()
+
+
+    def serve_client(self, connection: socket.socket) -> None:
+        """
+        Handles all the requests of a client, until it disconnects.
+        """
+        stream = connection.makefile("rb")
+        while True:
+            request = _receive_message(stream)
+            if request is None:
+                return
+
+            command = request.get("command")
+            if command == "info":
+                max_resolution = self.camera.MAX_RESOLUTION
+                _send_message(connection, {
+                    "max_resolution": [max_resolution.width, max_resolution.height]
+                })
+
+            elif command == "read":
+                try:
+                    _send_message(connection, {"readings": self._readings()})
+
+                except Exception as e:
+                    log_error("The camera could not be read.", e)
+                    _send_message(connection, {"error": str(e)})
+
+            elif command == "configure":
+                try:
+                    self._apply_settings(request.get("settings", {}))
+                    _send_message(connection, {})
+
+                except Exception as e:
+                    log_error("The settings could not be applied.", e)
+                    _send_message(connection, {"error": str(e)})
+
+            elif command == "capture":
+                try:
+                    picture = BytesIO()
+                    self.camera.capture(picture, format=request.get("format", "jpeg"))
+                    _send_message(connection, {}, payload=picture.getvalue())
+
+                except Exception as e:
+                    log_error("The capture failed.", e)
+                    _send_message(connection, {"error": str(e)})
+
+            else:
+                _send_message(connection, {"error": f"Unknown command: {command}"})
+
+
+    def _readings(self) -> Dict[str, Any]:
+        """
+        What the camera measured for the current frame.
+        """
+        return {name: _encode_reading(name, getattr(self.camera, name))
+                    for name in DAEMON_CAMERA_READINGS}
+
+
+    def _apply_settings(self, settings: Dict[str, Any]) -> None:
+        """
+        Applies the settings sent by the client to the camera,
+        in the same order Camera would apply them to a PiCamera.
+        """
+        for key in DAEMON_CAMERA_SETTINGS:
+            if key not in settings:
+                continue
+            value = settings[key]
+            if key == "resolution":
+                value = tuple(value)
+            if key == "framerate_range":
+                value = tuple(Fraction(v) for v in value)
+            if getattr(self.camera, key) != value:
+                setattr(self.camera, key, value)
+
+
+    def _restore_automatic_mode(self) -> None:
+        """
+        Puts the camera back in fully automatic mode,
+        so AE and AWB keep tracking the scene between clients.
+        """
+        if not self.camera:
+            return
+        self.camera.framerate = 30
+        self.camera.shutter_speed = 0
+        for key, value in DAEMON_AUTOMATIC_EXPOSURE.items():
+            setattr(self.camera, key, value)
+        self.camera.awb_mode = "auto"
+
+
+
+def main():
+    """
+    Runs the camera daemon until it's terminated.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(message)s',
+        handlers=[
+            logging.FileHandler(CAMERA_DAEMON_LOG),
+            logging.StreamHandler(sys.stdout),
+        ]
+    )
+    log_row()
+    log("Starting the camera daemon...")
+
+    daemon = CameraDaemon()
+
+    def stop(*args):
+        log("Termination requested.")
+        daemon.close()
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        daemon.open()
+        daemon.serve_forever()
+    except Exception as e:
+        log_error("The camera daemon stopped unexpectedly.", e)
+    finally:
+        daemon.close()
+
+
+if "__main__" == __name__:
+    main()
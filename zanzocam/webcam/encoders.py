@@ -0,0 +1,147 @@
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+
+from PIL import Image
+
+try:
+    # Adds AVIF support to the Pillow versions that don't have it built in
+    import pillow_avif
+except ImportError:
+    pass
+
+from zanzocam.constants import *
+
+
+def _rgb(image: Image.Image) -> Image.Image:
+    """
+    The image in RGB, not copied if it already is.
+    """
+    return image if image.mode == "RGB" else image.convert("RGB")
+
+
+def _encode_jpeg(image: Image.Image, output: BinaryIO, options: Dict[str, Any]) -> None:
+    """
+    Baseline or progressive JPEG, optionally with optimized Huffman
+    tables (a few % smaller, at the cost of a second pass on the data).
+    """
+    arguments = {
+        "quality": options["quality"],
+        "subsampling": options["subsampling"],
+        "optimize": bool(options["optimize"]),
+        "progressive": bool(options["progressive"]),
+    }
+    if options.get("exif"):
+        arguments["exif"] = options["exif"]
+    _rgb(image).save(output, format="JPEG", **arguments)
+
+
+def _encode_webp(image: Image.Image, output: BinaryIO, options: Dict[str, Any]) -> None:
+    """
+    Lossy WebP. `method` goes from 0 (fast) to 6 (small).
+    """
+    arguments = {
+        "quality": options["quality"],
+        "method": options["webp_method"],
+    }
+    if options.get("exif"):
+        arguments["exif"] = options["exif"]
+    image.save(output, format="WEBP", **arguments)
+
+
+def _encode_avif(image: Image.Image, output: BinaryIO, options: Dict[str, Any]) -> None:
+    """
+    AVIF. `speed` goes from 0 (small) to 10 (fast): AVIF is very
+    slow to encode, so on the Pi only the fastest speeds are usable.
+    """
+    arguments = {
+        "quality": options["quality"],
+        "speed": options["avif_speed"],
+    }
+    if options.get("exif"):
+        arguments["exif"] = options["exif"]
+    _rgb(image).save(output, format="AVIF", **arguments)
+
+
+def _encode_other(image: Image.Image, output: BinaryIO, options: Dict[str, Any]) -> None:
+    """
+    Any other format Pillow can write, with its default settings.
+    """
+    arguments = {}
+    if options.get("exif"):
+        arguments["exif"] = options["exif"]
+    image.save(output, format=options["format"], **arguments)
+
+
+#: The encoder of each file extension, and the Pillow format it writes.
+#:  Extensions not listed here use _encode_other.
+ENCODERS = {
+    "jpg": ("JPEG", _encode_jpeg),
+    "jpeg": ("JPEG", _encode_jpeg),
+    "webp": ("WEBP", _encode_webp),
+    "avif": ("AVIF", _encode_avif),
+}
+
+
+#: The formats that can store transparent pixels (AVIF can, but it's written in RGB)
+TRANSPARENT_FORMATS = ["PNG", "WEBP", "GIF", "TIFF"]
+
+
+def register_encoder(extension: str, format: str,
+                     encoder: Callable[[Image.Image, BinaryIO, Dict[str, Any]], None]) -> None:
+    """
+    Makes `encoder` the encoder of the given file extension.
+    It's called with the image, the output and the encoder options.
+    """
+    ENCODERS[extension.lower()] = (format.upper(), encoder)
+
+
+def image_format(extension: str) -> str:
+    """
+    The Pillow format matching the given file extension.
+    """
+    extension = extension.lower()
+    if extension in ENCODERS:
+        return ENCODERS[extension][0]
+    return Image.registered_extensions().get("." + extension, extension.upper())
+
+
+def is_supported(extension: str) -> bool:
+    """
+    Whether this Pillow build can write pictures with the given extension
+    (WebP and AVIF support depend on how Pillow was built).
+    """
+    Image.init()  # Pillow loads its format plugins lazily
+    return image_format(extension) in Image.SAVE
+
+
+def keeps_transparency(extension: str) -> bool:
+    """
+    Whether pictures with the given extension can have transparent pixels.
+    """
+    return image_format(extension) in TRANSPARENT_FORMATS
+
+
+def supported_extensions() -> List[str]:
+    """
+    The extensions with a dedicated encoder that this Pillow build can write.
+    """
+    return [extension for extension in ENCODERS if is_supported(extension)]
+
+
+def encode(image: Image.Image, output: BinaryIO, extension: str,
+           options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Encodes the image into `output` in the format of the given file
+    extension. `options` override ENCODER_DEFAULTS and can contain the
+    EXIF data to embed ('exif').
+
+    Returns the Pillow format the image was written in.
+    Raises ValueError if the format is not supported by this Pillow build.
+    """
+    format = image_format(extension)
+    if not is_supported(extension):
+        raise ValueError(f"This version of Pillow can't write {format} pictures.")
+
+    options = {**ENCODER_DEFAULTS, **(options or {}), "format": format}
+    encoder = ENCODERS.get(extension.lower(), (format, _encode_other))[1]
+    encoder(image, output, options)
+    return format
@@ -0,0 +1,180 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import os
+import json
+import math
+from pathlib import Path
+from datetime import datetime, timedelta
+
+from zanzocam.constants import *
+from zanzocam.webcam.utils import log, log_error
+
+
+class ExposureMemory:
+    """
+    Remembers the exposure parameters the low light search converged to,
+    so that the next search can start from there instead of from scratch.
+
+    Each entry records when the picture was taken, the luminance of the
+    automatically exposed picture (a proxy of the ambient light) and the
+    shutter speed, ISO and luminance found by the search. Entries older
+    than EXPOSURE_MEMORY_MAX_AGE are dropped when the memory is loaded.
+    """
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or EXPOSURE_MEMORY)
+        self.entries = self._load()
+
+
+    def _load(self) -> List[Dict[str, Any]]:
+        """
+        Reads the entries from disk, dropping the stale and the malformed
+        ones. A missing or unreadable file results in an empty memory.
+        """
+        if not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path, "r") as memory_file:
+                entries = json.load(memory_file)
+            if not isinstance(entries, list):
+                raise ValueError(f"expected a list of entries, found {type(entries).__name__}")
+        except Exception as e:
+            log_error("Could not read the exposure memory. It will be reset.", e)
+            return []
+
+        now = datetime.now()
+        valid_entries = []
+        for entry in entries:
+            try:
+                age = now - self._timestamp(entry)
+                for key in ("initial_luminance", "shutter_speed", "iso", "luminance"):
+                    float(entry[key])
+            except Exception as e:
+                log_error(f"Malformed entry in the exposure memory: {entry}. Skipping it.", e)
+                continue
+            if age <= timedelta(days=EXPOSURE_MEMORY_MAX_AGE):
+                valid_entries.append(entry)
+        return valid_entries
+
+
+    def save(self) -> None:
+        """
+        Writes the entries on disk.
+        """
+        try:
+            with open(self.path, "w") as memory_file:
+                json.dump(self.entries, memory_file, indent=4)
+        except Exception as e:
+            log_error("Could not save the exposure memory. The next low light "
+                      "search will not be able to use this run's values.", e)
+
+
+    @staticmethod
+    def _timestamp(entry: Dict[str, Any]) -> datetime:
+        return datetime.strptime(entry["time"], EXPOSURE_MEMORY_TIME_FORMAT)
+
+
+    @staticmethod
+    def _minutes_apart(first: datetime, second: datetime) -> float:
+        """
+        Distance in minutes between the time of day of the two datetimes,
+        wrapping around midnight.
+        """
+        first_minutes = first.hour * 60 + first.minute
+        second_minutes = second.hour * 60 + second.minute
+        difference = abs(first_minutes - second_minutes)
+        return min(difference, 24*60 - difference)
+
+
+    @staticmethod
+    def _luminance_distance(first: float, second: float) -> float:
+        """
+        How far apart two luminances are, as the log of their ratio:
+        ambient light changes multiplicatively. Luminances below
+        NO_LUMINANCE_THRESHOLD are all considered equally black.
+        """
+        first = max(first, NO_LUMINANCE_THRESHOLD)
+        second = max(second, NO_LUMINANCE_THRESHOLD)
+        return abs(math.log(first / second))
+
+
+    def find(self, initial_luminance: float, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns the entry that best matches the current time of day and
+        ambient luminance, or None if no entry is close enough.
+        """
+        now = now or datetime.now()
+        best_entry = None
+        best_score = None
+
+        for entry in self.entries:
+            minutes_apart = self._minutes_apart(now, self._timestamp(entry))
+            luminance_distance = self._luminance_distance(initial_luminance, entry["initial_luminance"])
+            if (minutes_apart > EXPOSURE_MEMORY_TIME_WINDOW or
+                    luminance_distance > math.log(EXPOSURE_MEMORY_LUMINANCE_RATIO)):
+                continue
+
+            # Recent entries are preferred at equal distance
+            age = (now - self._timestamp(entry)).total_seconds() / (24 * 60 * 60)
+            score = (minutes_apart / EXPOSURE_MEMORY_TIME_WINDOW +
+                     luminance_distance / math.log(EXPOSURE_MEMORY_LUMINANCE_RATIO) +
+                     age / EXPOSURE_MEMORY_MAX_AGE)
+            if best_score is None or score < best_score:
+                best_entry, best_score = entry, score
+
+        return best_entry
+
+
+    def seed(self, initial_luminance: float, target_luminance: float,
+             now: Optional[datetime] = None) -> Optional[Tuple[int, int]]:
+        """
+        Returns the shutter speed and ISO the low light search should start
+        from, or None if the memory has nothing relevant.
+
+        The remembered shutter speed is scaled by how much the ambient light
+        and the target changed since then, as the luminance is roughly
+        proportional to the exposure time.
+        """
+        entry = self.find(initial_luminance, now=now)
+        if not entry:
+            log(f"Exposure memory: {len(self.entries)} entries, "
+                f"none matching the current time and luminance.")
+            return None
+
+        ambient_ratio = (max(entry["initial_luminance"], NO_LUMINANCE_THRESHOLD) /
+                         max(initial_luminance, NO_LUMINANCE_THRESHOLD))
+        target_ratio = target_luminance / max(entry["luminance"], NO_LUMINANCE_THRESHOLD)
+        shutter_speed = entry["shutter_speed"] * ambient_ratio * target_ratio
+        shutter_speed = int(min(max(shutter_speed, MIN_SHUTTER_SPEED), MAX_SHUTTER_SPEED))
+
+        log(f"Exposure memory: {len(self.entries)} entries, best match: "
+            f"{self.describe(entry)}. Starting from shutter speed "
+            f"{shutter_speed/10**6:.2f}s and ISO {entry['iso']}.")
+        return shutter_speed, entry["iso"]
+
+
+    def remember(self, initial_luminance: float, shutter_speed: int, iso: int,
+                 luminance: float, now: Optional[datetime] = None) -> None:
+        """
+        Adds an entry to the memory and saves it, keeping only the
+        most recent EXPOSURE_MEMORY_MAX_ENTRIES entries.
+        """
+        entry = {
+            "time": (now or datetime.now()).strftime(EXPOSURE_MEMORY_TIME_FORMAT),
+            "initial_luminance": round(initial_luminance, 3),
+            "shutter_speed": int(shutter_speed),
+            "iso": int(iso),
+            "luminance": round(luminance, 3),
+        }
+        self.entries = (self.entries + [entry])[-EXPOSURE_MEMORY_MAX_ENTRIES:]
+        self.save()
+        log(f"Exposure memory updated: {self.describe(entry)}.")
+
+
+    @staticmethod
+    def describe(entry: Dict[str, Any]) -> str:
+        """
+        One-line summary of an entry, for the logs.
+        """
+        return (f"[{entry['time']}] ambient luminance {entry['initial_luminance']:.2f} -> "
+                f"shutter speed {entry['shutter_speed']/10**6:.2f}s, "
+                f"ISO {entry['iso']}, luminance {entry['luminance']:.2f}")
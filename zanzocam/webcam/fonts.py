@@ -0,0 +1,234 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import os
+import json
+import threading
+from pathlib import Path
+
+from PIL import ImageFont
+
+from zanzocam.constants import *
+from zanzocam.webcam.utils import log_error
+
+
+#: The fonts loaded by this process, by (path, size)
+_fonts = {}
+_fonts_lock = threading.Lock()
+
+#: The glyph widths read from FONT_METRICS, by "path:size". None until read.
+_stored_advances = None
+
+
+class FontMetrics:
+    """
+    A font at a given size, with a table of the advance width of each
+    glyph measured so far and the exact width of the strings measured
+    so far, so that nothing is measured twice.
+
+    The advances come from the metrics of the font, so they don't depend
+    on the text: they can be kept between runs (see save_metrics).
+
+    FreeType can't use the same font from several threads at once:
+    anything that uses `font` must hold `lock`.
+    """
+    def __init__(self, path: str, size: int, advances: Optional[Dict[str, float]] = None):
+        self.path = str(path)
+        self.size = size
+        self.font = ImageFont.truetype(self.path, size)
+        self.ascent, self.descent = self.font.getmetrics()
+        # Distance between the lines drawn by ImageDraw.multiline_text
+        self.line_spacing = self.font.getbbox("A")[3] + 4
+        self.advances = dict(advances or {})
+        self.widths = {}
+        self.new_glyphs = False
+        self.lock = threading.RLock()
+
+
+    def advance(self, glyph: str) -> float:
+        """
+        How much the pen moves after drawing this glyph.
+        """
+        if glyph not in self.advances:
+            with self.lock:
+                self.advances[glyph] = self.font.getlength(glyph)
+            self.new_glyphs = True
+        return self.advances[glyph]
+
+
+    def estimate_width(self, text: str) -> float:
+        """
+        Width of the text from the glyph advances alone. It differs from
+        width() by the kerning and by how much the last glyph overhangs
+        its advance, always less than FONT_WIDTH_TOLERANCE em.
+        """
+        return sum(self.advance(glyph) for glyph in text)
+
+
+    def fits(self, text: str, max_width: int) -> bool:
+        """
+        Whether width(text) <= max_width. Texts far enough from the limit
+        are decided from the glyph advances alone, only the ones close to
+        the limit are actually measured.
+        """
+        return self._fits(self.estimate_width(text), max_width, lambda: text)
+
+
+    def _fits(self, estimate: float, max_width: int, text: Callable[[], str]) -> bool:
+        """
+        Like fits(), given the estimated width of the text: the text is
+        only built (calling `text`) and measured if it's close to the limit.
+        """
+        tolerance = self.size * FONT_WIDTH_TOLERANCE
+        if estimate + tolerance <= max_width:
+            return True
+        if estimate - tolerance > max_width:
+            return False
+        return self.width(text()) <= max_width
+
+
+    def width(self, text: str) -> int:
+        """
+        Exact width of the text in pixels, as the deprecated
+        `font.getsize(text)[0]` measured it: from the origin, or from the
+        ink if it starts before the origin, to the right edge of the ink.
+        """
+        if text not in self.widths:
+            with self.lock:
+                left, _, right, _ = self.font.getbbox(text)
+            self.widths[text] = right - min(left, 0)
+        return self.widths[text]
+
+
+    def wrap(self, text: str, max_width: int) -> Tuple[List[str], List[int]]:
+        """
+        Breaks the text into lines no wider than max_width. The lines are
+        broken at the spaces, and the words too long for a line by
+        themselves are broken between two glyphs. A paragraph that fits
+        is kept as it is, otherwise its lines end with a space.
+
+        Returns the lines and their widths. Each word is measured only
+        once and its width is added up along the line: only the lines
+        close to max_width are measured again, so the time grows linearly
+        with the length of the text.
+        """
+        space = self.advance(" ")
+        lines = []
+        for paragraph in text.split("\n"):
+            words = paragraph.split(" ")
+            word_widths = [self.estimate_width(word) for word in words]
+            paragraph_width = sum(word_widths) + space * (len(words) - 1)
+            if self._fits(paragraph_width, max_width, lambda: paragraph):
+                lines.append(paragraph)
+                continue
+
+            # The words of the current line, and the width of the line with a space after them
+            line, line_width = [], 0.0
+            for word, word_width in zip(words, word_widths):
+
+                if not self._fits(line_width + word_width, max_width, lambda: " ".join(line + [word])):
+                    if line:
+                        lines.append(" ".join(line) + " ")
+                        line, line_width = [], 0.0
+
+                    if not self._fits(word_width, max_width, lambda: word):
+                        *pieces, word = self._break_word(word, max_width)
+                        lines += pieces
+                        word_width = self.estimate_width(word)
+
+                line.append(word)
+                line_width += word_width + space
+
+            lines.append(" ".join(line) + " ")
+
+        return lines, [self.width(line) for line in lines]
+
+
+    def _break_word(self, word: str, max_width: int) -> List[str]:
+        """
+        Breaks a word too long for a line into pieces that fit,
+        each with at least one glyph.
+        """
+        pieces = []
+        start, width = 0, 0.0
+        for end, glyph in enumerate(word):
+            advance = self.advance(glyph)
+            if end > start and not self._fits(width + advance, max_width, lambda: word[start:end + 1]):
+                pieces.append(word[start:end])
+                start, width = end, 0.0
+            width += advance
+        pieces.append(word[start:])
+        return pieces
+
+
+
+def _font_key(path: str, size: int) -> str:
+    return f"{path}:{size}"
+
+
+def font_signature(path: str) -> str:
+    """
+    Changes if the font file is updated, which invalidates
+    its stored metrics and the overlays rendered with it.
+    """
+    stat = os.stat(path)
+    return f"{stat.st_size}-{int(stat.st_mtime)}"
+
+
+def load_metrics(path: Optional[Path] = None) -> Dict[str, Any]:
+    """
+    Reads the glyph advances stored by the previous runs.
+    A missing or unreadable file results in no metrics.
+    """
+    path = Path(path or FONT_METRICS)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as metrics_file:
+            return json.load(metrics_file)
+    except Exception as e:
+        log_error("Could not read the font metrics. They will be reset.", e)
+        return {}
+
+
+def get_font(size: int, path: str = FONT_PATH) -> FontMetrics:
+    """
+    The font at the given size: loaded once per process, with the glyph
+    advances of the previous runs if they were stored.
+    """
+    global _stored_advances
+
+    key = (str(path), size)
+    with _fonts_lock:
+        if key not in _fonts:
+            if _stored_advances is None:
+                _stored_advances = load_metrics()
+            stored = _stored_advances.get(_font_key(*key), {})
+            advances = None
+            if stored.get("signature") == font_signature(path):
+                advances = stored.get("advances")
+            _fonts[key] = FontMetrics(path, size, advances)
+        return _fonts[key]
+
+
+def save_metrics(path: Optional[Path] = None) -> None:
+    """
+    Stores the glyph advances of the fonts of this process for the next
+    runs. Nothing is written if no new glyph was measured.
+    """
+    if not any(metrics.new_glyphs for metrics in _fonts.values()):
+        return
+    stored = dict(load_metrics(path))
+    for metrics in _fonts.values():
+        stored[_font_key(metrics.path, metrics.size)] = {
+            "signature": font_signature(metrics.path),
+            "advances": metrics.advances,
+        }
+    try:
+        with open(Path(path or FONT_METRICS), "w") as metrics_file:
+            json.dump(stored, metrics_file)
+    except Exception as e:
+        log_error("Could not save the font metrics. The next run will "
+                  "have to measure the glyphs again.", e)
+        return
+    for metrics in _fonts.values():
+        metrics.new_glyphs = False
@@ -11,15 +11,20 @@ from time import sleep
 from zanzocam.constants import (
     CAMERA_LOGS,
     LOG_NAME_FORMAT,
+    RUN_RECORD,
+    RUN_RECORD_NAME_FORMAT,
     SEND_LOGS_FLAG,
     CAMERA_LOG,
+    TIMELAPSE_RENDITION,
     WAIT_AFTER_CAMERA_FAIL
 )
-from zanzocam.webcam import system
+from zanzocam.webcam import system, telemetry, timings, timelapse
 from zanzocam.webcam.configuration import load_configuration_from_disk
 from zanzocam.webcam.server import Server
 from zanzocam.webcam.camera import Camera
+from zanzocam.webcam.scene_change import SceneChange
 from zanzocam.webcam.errors import ServerError
+from zanzocam.webcam.timings import timed
 from zanzocam.webcam.utils import log, log_error, log_row, read_flag_file
 
 
@@ -51,15 +56,20 @@ def main():
 
     try:
         start = datetime.datetime.now()
+        timings.start_run()
+        telemetry.start_run()
 
         # System check
-        no_errors = system.log_general_status()
+        with timed("status check"):
+            no_errors = system.log_general_status()
  
         # Locale setup
-        no_errors = system.set_locale()
+        with timed("locale setup"):
+            no_errors = system.set_locale()
  
         # Load the configuration from disk
-        config = load_configuration_from_disk()
+        with timed("config load"):
+            config = load_configuration_from_disk()
         if not config:
             log_error("", fatal="cannot proceed without any data. Exiting.")
             no_errors = False
@@ -79,11 +89,13 @@ def main():
         server = Server(config.get_server_settings())
 
         # Update the configuration file
-        new_config = server.update_configuration(config)
+        with timed("config download"):
+            new_config = server.update_configuration(config)
         if new_config:
         
             # Update the system to conform to the new configuration file
-            no_errors = system.apply_system_settings(new_config.get_system_settings())
+            with timed("system settings"):
+                no_errors = system.apply_system_settings(new_config.get_system_settings())
             config = new_config
 
         log(f"Configuration in use:\n{config}")
@@ -93,13 +105,20 @@ def main():
 
         # Download the overlays
         overlays_list = config.list_overlays()
-        no_errors = server.download_overlay_images(overlays_list)
+        with timed("overlay downloads"):
+            no_errors = server.download_overlay_images(overlays_list)
+
+        # The frame of the daily timelapse is created with the picture
+        timelapse_settings = config.get_timelapse_settings() or {}
+        frame_rendition = False
 
         # Take the picture
         for _ in range(3):
             log("Initializing camera...")
             try:
                 camera = Camera(config.get_camera_settings())
+                if timelapse_settings.get("enabled"):
+                    frame_rendition = timelapse.add_frame_rendition(camera, timelapse_settings)
                 camera.take_picture()
                 break
 
@@ -114,8 +133,28 @@ def main():
             no_errors = False
             return
 
-        # Send the picture
-        server.upload_picture(camera.processed_image_path, camera.name, camera.extension)
+        # Keep a copy of the picture for the daily timelapse
+        if timelapse_settings.get("enabled"):
+            timelapse.archive_frame(camera)
+
+        # Skip the upload if the scene did not change since the last uploaded picture.
+        # If the logs are not sent, send a tiny heartbeat instead.
+        scene_change = SceneChange()
+        if not scene_change.should_upload(camera.temp_photo, camera.scene_change_threshold,
+                                          camera.scene_change_max_skipped):
+            scene_change.skipped_upload()
+            if not upload_logs:
+                server.upload_logs(scene_change.write_heartbeat())
+
+        else:
+            # Send the picture (the frame of the timelapse is only archived)
+            renditions = camera.processed_renditions
+            if frame_rendition:
+                renditions = [rendition for rendition in renditions if rendition[0] != TIMELAPSE_RENDITION]
+            with timed("upload"):
+                server.upload_picture(camera.processed_image, camera.name, camera.extension,
+                                      renditions=renditions)
+            scene_change.uploaded()
 
         # Cleanup the image files
         no_errors = no_errors and camera.cleanup_image_files()
@@ -158,8 +197,17 @@ def main():
         else:
             errors_str = "with errors"
 
+        bytes_written = system.get_bytes_written()
+        if bytes_written is not None:
+            log(f"Bytes written to disk during this run: "
+                f"{system.convert_bytes_into_string(bytes_written)}")
+
         end = datetime.datetime.now()
         log(f"Execution completed {errors_str} in: {end - start}")
+
+        # Store the timings of the run (they're logged as well, to be uploaded)
+        if timings.save_run_record(RUN_RECORD, successful=no_errors):
+            shutil.copy2(RUN_RECORD, CAMERA_LOGS / datetime.datetime.now().strftime(RUN_RECORD_NAME_FORMAT))
         log_row()
 
         # Store the logs
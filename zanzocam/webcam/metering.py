@@ -0,0 +1,135 @@
+from typing import Any
+
+import os
+import math
+import numpy as np
+from PIL import Image
+
+from zanzocam.constants import *
+
+
+def channel_histograms(picture: Any, scale: int = LUMINANCE_METERING_SCALE) -> np.ndarray:
+    """
+    Given an image (a path, a file-like object or a PIL image), returns
+    the histograms of its R, G and B channels, as a 3x256 array.
+
+    JPEG pictures are not fully decoded: the decoder is asked for a draft
+    `scale` times smaller, which skips most of the IDCT work, and the
+    histograms of the smaller frame have virtually the same shape.
+    PIL images are already decoded, so they are measured in full.
+    File-like objects are rewound after reading.
+    """
+    if isinstance(picture, os.PathLike):
+        picture = str(picture)
+
+    if isinstance(picture, Image.Image):
+        photo = picture
+    else:
+        photo = Image.open(picture)
+        if scale > 1:
+            photo.draft("RGB", (photo.width // scale, photo.height // scale))
+    if photo.mode != "RGB":
+        photo = photo.convert("RGB")
+
+    # PIL computes the histograms in a single pass in C:
+    # much faster than working on the pixel array itself.
+    histograms = np.array(photo.histogram(), dtype=np.float64).reshape(3, 256)
+
+    if hasattr(picture, "seek"):
+        picture.seek(0)
+
+    return histograms
+
+
+def luminance_from_means(r: float, g: float, b: float) -> float:
+    """
+    The luminance of a picture with the given channel means: their root
+    mean square, weighted with 0.241 (R), 0.691 (G) and 0.068 (B).
+    """
+    return math.sqrt(0.241*(r**2) + 0.691*(g**2) + 0.068*(b**2))
+
+
+def luminance_from_histograms(histograms: np.ndarray) -> float:
+    """
+    The luminance of a picture with the given channel histograms.
+    """
+    r, g, b = histograms @ np.arange(256) / histograms.sum(axis=1)
+    return luminance_from_means(r, g, b)
+
+
+def luminance_from_picture(picture: Any, scale: int = LUMINANCE_METERING_SCALE) -> float:
+    """
+    Given an image (a path, a file-like object or a PIL image), returns its luminance.
+    See channel_histograms() and luminance_from_means().
+    """
+    return luminance_from_histograms(channel_histograms(picture, scale=scale))
+
+
+def linear_light(luminance: float) -> float:
+    """
+    Converts a luminance (0-255, gamma encoded) back to linear light (0-1),
+    which is proportional to the exposure. The camera's tone curve is
+    approximated with the Rec.709 one (linear toe, then 0.45 gamma).
+    """
+    value = min(max(luminance / 255, 0), 1)
+    if value < 0.081:
+        return value / 4.5
+    return ((value + 0.099) / 1.099) ** (1 / 0.45)
+
+
+def gamma_encode(light: np.ndarray) -> np.ndarray:
+    """
+    Inverse of linear_light(), on arrays: from linear light (0-1) to 0-255.
+    """
+    light = np.clip(light, 0, 1)
+    encoded = np.where(light < 0.018, 4.5 * light, 1.099 * light ** 0.45 - 0.099)
+    return 255 * encoded
+
+
+#: Linear light of each of the 256 levels of a channel
+_LEVELS_LIGHT = np.array([linear_light(level) for level in range(256)])
+
+
+def histogram_percentile(histograms: np.ndarray, percentile: float) -> int:
+    """
+    The level below which the given percentage of the values of all
+    channels falls.
+    """
+    cumulative = np.cumsum(histograms.sum(axis=0))
+    return int(np.searchsorted(cumulative, cumulative[-1] * percentile / 100))
+
+
+def clipped_fraction(histograms: np.ndarray) -> float:
+    """
+    The fraction of the values of all channels that are saturated.
+    """
+    return float(histograms[:, 255].sum() / histograms.sum())
+
+
+def predict_luminance(histograms: np.ndarray, gain: float) -> float:
+    """
+    Predicts the luminance of the picture with the given histograms,
+    if it was taken with `gain` times its exposure. Accounts for the tone
+    curve and for the values that would saturate (saturated values stay so).
+    """
+    levels = gamma_encode(_LEVELS_LIGHT * gain)
+    levels[255] = 255
+    r, g, b = histograms @ levels / histograms.sum(axis=1)
+    return luminance_from_means(r, g, b)
+
+
+def exposure_gain(histograms: np.ndarray, target_luminance: float) -> float:
+    """
+    How many times the exposure of the picture with the given histograms
+    should be multiplied to reach the target luminance.
+    The predicted luminance grows with the gain, so it's found by bisection
+    (on the logarithm of the gain, between 1/1000 and 100000).
+    """
+    low, high = math.log(10**-3), math.log(10**5)
+    for _ in range(50):
+        middle = (low + high) / 2
+        if predict_luminance(histograms, math.exp(middle)) < target_luminance:
+            low = middle
+        else:
+            high = middle
+    return math.exp((low + high) / 2)
@@ -0,0 +1,173 @@
+from typing import Any, Dict, Optional
+
+import os
+import json
+import mmap
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+from zanzocam.constants import *
+from zanzocam.webcam.utils import log_error
+
+
+class OverlayCache:
+    """
+    Keeps the rendered overlays that don't change between runs on disk,
+    so that they don't need to be rendered again. The key of an overlay
+    is a hash of everything its pixels depend on (see key()).
+
+    The overlays are stored uncompressed, as raw RGBA pixels, and are
+    memory-mapped back: loading them costs nearly nothing. Text overlays
+    that change at every run are stored with their layout, so that the
+    next run can update them instead of drawing them again. The cache is
+    kept within OVERLAY_CACHE_SIZE by deleting the overlays that were
+    not used for the longest time.
+    """
+    def __init__(self, path: Optional[Path] = None, max_size: Optional[int] = None):
+        self.path = Path(path or OVERLAY_CACHE)
+        self.max_size = OVERLAY_CACHE_SIZE if max_size is None else max_size
+        self.hits = 0
+        self.misses = 0
+        # The overlays can be rendered by several threads
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        """
+        Hash of the given parts, which must be JSON serializable
+        (or have a meaningful string representation).
+        """
+        data = json.dumps([VERSION, *parts], sort_keys=True, default=str)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+    def _find(self, key: str) -> Optional[Path]:
+        """
+        The file of this key, if it's in the cache.
+        """
+        if not os.path.exists(self.path):
+            return None
+        for cached in self.path.glob(f"{key}-*.rgba"):
+            return cached
+        return None
+
+
+    def load(self, key: str) -> Optional[Image.Image]:
+        """
+        The overlay stored under this key, or None if it's not in the cache.
+        """
+        cached = self._find(key)
+        if cached:
+            try:
+                width, height = (int(value) for value in cached.stem.split("-")[1].split("x"))
+                with open(cached, "rb") as cached_file:
+                    pixels = mmap.mmap(cached_file.fileno(), 0, access=mmap.ACCESS_READ)
+                if len(pixels) != width * height * 4:
+                    raise ValueError(f"{cached.name} is {len(pixels)} bytes long.")
+                overlay = Image.frombuffer("RGBA", (width, height), pixels, "raw", "RGBA", 0, 1)
+
+                # Marks it as recently used
+                os.utime(cached)
+                with self._lock:
+                    self.hits += 1
+                return overlay
+
+            except Exception as e:
+                log_error("Could not load the overlay from the cache. "
+                          "It will be rendered again.", e)
+                try:
+                    os.remove(cached)
+                except OSError:
+                    pass
+
+        self.count_miss()
+        return None
+
+
+    def count_miss(self) -> None:
+        """
+        Counts an overlay that had to be rendered from scratch.
+        """
+        with self._lock:
+            self.misses += 1
+
+
+    def load_layout(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        The layout stored with the overlay under this key, if any.
+        """
+        layout_path = self.path / f"{key}.json"
+        if not os.path.exists(layout_path):
+            return None
+        try:
+            with open(layout_path, "r") as layout_file:
+                return json.load(layout_file)
+        except Exception as e:
+            log_error("Could not read the layout of the overlay from the cache. "
+                      "It will be drawn again.", e)
+            return None
+
+
+    def store(self, key: str, overlay: Image.Image, layout: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Stores the overlay under this key, with its layout if given.
+        """
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            cached = self.path / f"{key}-{overlay.width}x{overlay.height}.rgba"
+            for stale in self.path.glob(f"{key}-*.rgba"):
+                if stale != cached:
+                    try:
+                        os.remove(stale)
+                    except FileNotFoundError:
+                        pass  # Removed by another thread
+
+            # Replaced, not overwritten: the old overlay might still be mapped in memory
+            self._replace(cached, overlay.convert("RGBA").tobytes())
+            if layout:
+                self._replace(self.path / f"{key}.json", json.dumps(layout).encode("utf-8"))
+        except Exception as e:
+            log_error("Could not store the overlay in the cache. "
+                      "It will be rendered again on the next run.", e)
+
+
+    def _replace(self, path: Path, data: bytes) -> None:
+        """
+        Writes the data to a temporary file of its own, then moves it
+        to the given path: threads storing the same overlay at once
+        never write the same file.
+        """
+        descriptor, temp_path = tempfile.mkstemp(dir=self.path, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used overlays until the cache
+        fits in its maximum size.
+        """
+        if not os.path.exists(self.path):
+            return
+        try:
+            cached = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry)
+                                for entry in os.scandir(self.path) if entry.is_file()),
+                            key=lambda item: item[0])
+            size = sum(entry_size for _, entry_size, _ in cached)
+            for _, entry_size, entry in cached:
+                if size <= self.max_size:
+                    break
+                os.remove(entry.path)
+                size -= entry_size
+        except Exception as e:
+            log_error("Could not clean up the overlay cache.", e)
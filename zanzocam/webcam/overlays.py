@@ -1,23 +1,34 @@
-from typing import Any, Dict, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
 
+import os
 import math
-import datetime
-from PIL import Image, ImageFont, ImageDraw
+from PIL import Image, ImageDraw
 
 from zanzocam.constants import *
 from zanzocam.webcam.utils import log, log_error
+from zanzocam.webcam.fonts import get_font, font_signature, FontMetrics
+from zanzocam.webcam.overlay_cache import OverlayCache
+from zanzocam.webcam.templates import compile_template
 
 
 
 class Overlay:
     """
     Represents one overlay to add to the picture.
+    If a cache is given, the overlays that don't change between runs are
+    taken from it when possible, and stored in it otherwise. Text with
+    placeholders (the time, the date or some data measured in the run,
+    see zanzocam.webcam.templates) is updated over the label of the
+    previous run (see create_text_overlay).
     """
-    def __init__(self, position: str, data: Dict, photo_width: int, photo_height: int, date_format: Optional[str], time_format: Optional[str]):
+    def __init__(self, position: str, data: Dict, photo_width: int, photo_height: int, date_format: Optional[str], time_format: Optional[str],
+                 cache: Optional[OverlayCache] = None):
         log(f"Creating overlay {position}.")
         
         # Where the rendered overlay is stored if can be generated
         self.rendered_image = None
+        # How the text was laid out, to update the label in the next run
+        self.layout = None
         self.defaults = OVERLAY_DEFAULTS
         
         # Populate the attributes with the overlay data 
@@ -50,17 +61,29 @@ class Overlay:
             return
         self.type = data.get("type")
 
-        if self.type == "text":
-            self.rendered_image = self.create_text_overlay(photo_width, photo_height)
-
-        elif self.type == "image":
-            self.rendered_image = self.create_image_overlay()
-        
-        else:
+        if self.type not in ["text", "image"]:
             log_error(f"Overlay type '{self.type}' not recognized. Valid names: "
             "text, image. This overlay will be skipped.")
             return
 
+        cache_key = self.cache_key(data, photo_width) if cache else None
+        dynamic = self.type == "text" and bool(compile_template(str(self.text)).placeholders)
+        if cache_key and not dynamic:
+            self.rendered_image = cache.load(cache_key)
+            if self.rendered_image:
+                return
+
+        if self.type == "text":
+            if dynamic and cache_key:
+                self.rendered_image = self.create_text_overlay(photo_width, photo_height, cache, cache_key)
+            else:
+                self.rendered_image = self.create_text_overlay(photo_width, photo_height)
+        else:
+            self.rendered_image = self.create_image_overlay()
+
+        if cache_key and self.rendered_image:
+            cache.store(cache_key, self.rendered_image, self.layout)
+
 
     def __getattr__(self, name):
         """ 
@@ -73,6 +96,23 @@ class Overlay:
         return None
 
 
+    def cache_key(self, data: Dict, photo_width: int) -> Optional[str]:
+        """
+        The key of this overlay in the overlay cache, from everything its
+        pixels depend on (for text with placeholders, everything but
+        their values). None if its source image can't be found.
+        """
+        try:
+            if self.type == "text":
+                source = [FONT_PATH, font_signature(FONT_PATH)]
+            else:
+                stat = os.stat(IMAGE_OVERLAYS_PATH / self.path)
+                source = [self.path, stat.st_size, stat.st_mtime_ns]
+        except Exception:
+            return None
+        return OverlayCache.key(data, self.defaults, photo_width, source)
+
+
     def compute_position(self, image_width: int, image_height: int, 
                 border_top: int, border_bottom: int) -> Tuple[int, int]:
         """
@@ -105,35 +145,58 @@ class Overlay:
         return x, y
 
 
-    def create_text_overlay(self, photo_width: int, photo_height: int) -> Any:
+    def create_text_overlay(self, photo_width: int, photo_height: int,
+                            cache: Optional[OverlayCache] = None,
+                            cache_key: Optional[str] = None) -> Any:
         """ 
         Prepares an overlay containing text.
         In case of issues, self.overlay_image will stay None.
+
+        If a cache is given, the paragraphs that didn't change since the
+        previous run are not wrapped again and, if the lines still fill
+        a label of the same size, only the lines that changed are drawn
+        again over the label of the previous run.
         """
         try:
-            # Creates the font and calculate the line height
-            font_size = self.font_size
-            font = ImageFont.truetype(FONT_PATH, font_size)
+            # Gets the font (loaded only once per process) and its metrics
+            metrics = get_font(self.font_size)
+
+            # Replace %%TIME, %%DATE and the other placeholders with their values
+            self.text = compile_template(self.text).render(self.date_format, self.time_format)
 
-            # Replace %%TIME and %%DATE with respective values
-            time_string = datetime.datetime.now().strftime(self.time_format)
-            date_string = datetime.datetime.now().strftime(self.date_format)
-            self.text = self.text.replace("%%TIME", time_string)
-            self.text = self.text.replace("%%DATE", date_string)
+            previous = cache.load_layout(cache_key) if cache else None
 
             # Calculate the dimension of the text with the padding added
-            text_width, text_height = self.process_text(font, photo_width)
+            text_width, text_height = self.process_text(
+                metrics, photo_width, previous["paragraphs"] if previous else None)
             text_size = (text_width + self.padding*2, text_height + self.padding*2)
 
             # Some very popular browsers use \r\n to save newlines from 
             # textareas: normalize
             self.text = self.text.replace("\r\n", "\n")
+            lines = self.text.split("\n")
+            if cache:
+                self.layout = {"paragraphs": self.paragraphs, "lines": lines, "size": text_size}
+
+            # Update the label of the previous run, if the layout allows it
+            if (previous and list(previous["size"]) == list(text_size) and
+                    len(previous["lines"]) == len(lines)):
+                label = cache.load(cache_key)
+                if label and label.size == text_size:
+                    label = label.copy()
+                    changed = [index for index, line in enumerate(lines)
+                                    if line != previous["lines"][index]]
+                    self.redraw_lines(label, lines, changed, metrics)
+                    return label
+            elif cache:
+                cache.count_miss()
 
             # Creates the image
             label = Image.new("RGBA", text_size, color=self.background_color)
             draw = ImageDraw.Draw(label)
-            draw.text((self.padding, self.padding, self.padding), 
-                      self.text, self.font_color, font=font)
+            with metrics.lock:
+                draw.text((self.padding, self.padding, self.padding), 
+                          self.text, self.font_color, font=metrics.font)
 
             # Store it
             return label
@@ -144,36 +207,58 @@ class Overlay:
             return
 
 
-    def process_text(self, font: Any, max_line_length: int) -> Tuple[int, int]:
+    def process_text(self, metrics: FontMetrics, max_line_length: int,
+                     known_paragraphs: Optional[Dict[str, Any]] = None) -> Tuple[int, int]:
         """ 
         Measures and insert returns into the text to make it fit into the image.
+        The paragraphs found in `known_paragraphs` (as their lines and line
+        widths) are not wrapped again. The paragraphs of this text are kept
+        in self.paragraphs in the same way.
         """
+        known_paragraphs = known_paragraphs or {}
+        self.paragraphs = {}
+
         # Insert as many returns as needed to make the text fit.
-        lines = []
-        for line in self.text.split("\n"):
-            if font.getsize(line)[0] <= max_line_length:
-                lines.append(line)
-            else:
-                new_line = ""
-                for word in line.split(" "):
-                    if font.getsize(new_line + word)[0] <= max_line_length:
-                        new_line = new_line + word + " "
-                    else:
-                        lines.append(new_line)
-                        new_line = word + " "
-                if new_line != "":
-                    lines.append(new_line)
+        lines, line_widths = [], []
+        for paragraph in self.text.split("\n"):
+            if paragraph not in self.paragraphs:
+                self.paragraphs[paragraph] = (known_paragraphs.get(paragraph) or
+                                              metrics.wrap(paragraph, max_line_length))
+            lines += self.paragraphs[paragraph][0]
+            line_widths += self.paragraphs[paragraph][1]
         self.text = '\n'.join(lines)
 
         # Measure text's bounding box (no margins applied here)
-        text_width = max([font.getsize(line)[0] for line in lines])
+        text_width = max(line_widths)
         # https://stackoverflow.com/questions/43060479/how-to-get-the-font-pixel-height-using-pils-imagefont-class
-        ascent, descent = font.getmetrics()
+        ascent, descent = metrics.ascent, metrics.descent
         # The text has approximately a 3% interline space
         text_height = math.ceil(len(lines) * ascent * 1.03) + descent
         return text_width, text_height
 
 
+    def redraw_lines(self, label: Image.Image, lines: List[str], changed: List[int],
+                     metrics: FontMetrics) -> None:
+        """
+        Draws the given lines of the text again over the label, which must
+        have been drawn with the same number of lines. Each changed line is
+        drawn on a clean strip together with its neighbours, as their
+        accents and descenders can reach into it, so that the result is
+        the same as drawing the whole label again.
+        """
+        spacing = metrics.line_spacing
+        for index in changed:
+            top = self.padding + index * spacing if index else 0
+            bottom = self.padding + (index + 1) * spacing if index < len(lines) - 1 else label.height
+            strip = Image.new("RGBA", (label.width, bottom - top), color=self.background_color)
+            draw = ImageDraw.Draw(strip)
+            with metrics.lock:
+                for line in range(max(0, index - 1), min(len(lines), index + 2)):
+                    draw.text((self.padding, self.padding + line * spacing - top),
+                              lines[line], self.font_color, font=metrics.font)
+            label.paste(strip, (0, top))
+
+
     def create_image_overlay(self) -> Any:
         """ 
         Prepares an overlay containing an image.
@@ -0,0 +1,184 @@
+from typing import Any, List, Optional
+
+import os
+import json
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+from zanzocam.constants import *
+from zanzocam.webcam.utils import log, log_error
+
+
+def picture_fingerprint(picture: Any) -> List[int]:
+    """
+    Given a picture (a path, a file-like object or a PIL image), returns
+    a tiny grayscale version of it (SCENE_CHANGE_FINGERPRINT_SIZE), as a
+    flat list of levels. Downscaling averages the sensor noise away, so
+    two pictures of a static scene have nearly identical fingerprints.
+
+    JPEG pictures are decoded in draft mode, like in the metering.
+    """
+    if isinstance(picture, os.PathLike):
+        picture = str(picture)
+    if hasattr(picture, "seek"):
+        picture.seek(0)
+
+    if isinstance(picture, Image.Image):
+        photo = picture
+    else:
+        photo = Image.open(picture)
+        photo.draft("L", (photo.width // LUMINANCE_METERING_SCALE,
+                          photo.height // LUMINANCE_METERING_SCALE))
+
+    thumbnail = photo.convert("L").resize(SCENE_CHANGE_FINGERPRINT_SIZE, Image.BILINEAR)
+
+    if hasattr(picture, "seek"):
+        picture.seek(0)
+    return [int(level) for level in thumbnail.getdata()]
+
+
+def fingerprint_difference(first: List[int], second: List[int]) -> float:
+    """
+    Mean absolute difference between two fingerprints, in levels (0-255).
+    """
+    if len(first) != len(second):
+        return 255.0
+    return float(np.mean(np.abs(np.array(first, dtype=np.int16) - np.array(second, dtype=np.int16))))
+
+
+class SceneChange:
+    """
+    Decides whether a picture is worth uploading, by comparing it with
+    the last uploaded one: pictures of a static scene (at night, in the
+    fog) can be skipped to save bandwidth on metered links.
+
+    The fingerprint of the last uploaded picture and the number of uploads
+    skipped since then are kept in a small state file.
+    """
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path or SCENE_CHANGE_STATE)
+        self.fingerprint = None
+        self.skipped = 0
+        self.last_upload = None
+        self._load()
+
+        # Fingerprint of the picture passed to should_upload(), if it was checked
+        self._new_fingerprint = None
+        self._checked = False
+
+
+    def _load(self) -> None:
+        """
+        Reads the state from disk. A missing or unreadable file means
+        that the next picture will be uploaded.
+        """
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as state_file:
+                state = json.load(state_file)
+            self.fingerprint = state["fingerprint"]
+            self.skipped = int(state.get("skipped", 0))
+            self.last_upload = state.get("last_upload")
+        except Exception as e:
+            log_error("Could not read the scene change state. It will be reset.", e)
+
+
+    def save(self) -> None:
+        """
+        Writes the state on disk.
+        """
+        try:
+            with open(self.path, "w") as state_file:
+                json.dump({
+                    "fingerprint": self.fingerprint,
+                    "skipped": self.skipped,
+                    "last_upload": self.last_upload
+                }, state_file)
+        except Exception as e:
+            log_error("Could not save the scene change state. "
+                      "The next picture will be uploaded.", e)
+
+
+    def should_upload(self, picture: Any, threshold: float, max_skipped: int) -> bool:
+        """
+        Returns False if the picture is too similar to the last uploaded one:
+        its fingerprint differs by less than `threshold` levels on average.
+        After `max_skipped` skipped uploads in a row, returns True anyway.
+        A threshold of 0 disables the check.
+        """
+        try:
+            threshold = float(threshold or 0)
+            max_skipped = int(max_skipped or 0)
+        except (TypeError, ValueError):
+            log(f"WARNING! scene_change_threshold and scene_change_max_skipped must be numbers, "
+                f"not '{threshold}' and '{max_skipped}'. Uploading.")
+            return True
+        if threshold <= 0:
+            return True
+        self._checked = True
+        try:
+            self._new_fingerprint = picture_fingerprint(picture)
+        except Exception as e:
+            log_error("Could not compare the picture with the last uploaded one. "
+                      "Uploading it.", e)
+            return True
+
+        if self.fingerprint is None:
+            log("Scene change: no previous picture to compare with. Uploading.")
+            return True
+
+        difference = fingerprint_difference(self._new_fingerprint, self.fingerprint)
+        if difference >= threshold:
+            log(f"Scene change: the scene changed (difference: {difference:.2f}, "
+                f"threshold: {threshold}). Uploading.")
+            return True
+
+        if self.skipped >= max_skipped:
+            log(f"Scene change: the scene did not change (difference: {difference:.2f}, "
+                f"threshold: {threshold}), but {self.skipped} uploads were skipped already. "
+                f"Uploading anyway.")
+            return True
+
+        log(f"Scene change: the scene did not change (difference: {difference:.2f}, "
+            f"threshold: {threshold}). Skipping the upload "
+            f"({self.skipped + 1}/{max_skipped} skipped, last upload: {self.last_upload}).")
+        return False
+
+
+    def uploaded(self) -> None:
+        """
+        Records that the picture passed to should_upload() was uploaded.
+        Does nothing if the check is disabled, to spare the SD card.
+        """
+        if not self._checked:
+            return
+        if self._new_fingerprint is not None:
+            self.fingerprint = self._new_fingerprint
+        self.skipped = 0
+        self.last_upload = datetime.now().isoformat(sep=" ", timespec="seconds")
+        self.save()
+
+
+    def skipped_upload(self) -> None:
+        """
+        Records that the picture passed to should_upload() was not uploaded.
+        """
+        self.skipped += 1
+        self.save()
+
+
+    def write_heartbeat(self, path: Optional[Path] = None) -> Path:
+        """
+        Writes a tiny heartbeat file to upload instead of the picture
+        (and of the full logs), so that the server knows the camera is alive.
+        """
+        path = Path(path or SCENE_CHANGE_HEARTBEAT)
+        with open(path, "w") as heartbeat:
+            heartbeat.write(f"{datetime.now().isoformat(sep=' ', timespec='seconds')} -> "
+                            f"Scene unchanged, picture not uploaded "
+                            f"({self.skipped} skipped, last upload: {self.last_upload}).\n")
+        return path
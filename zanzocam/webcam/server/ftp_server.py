@@ -1,14 +1,16 @@
-from typing import Any, List, Dict, Optional
+from typing import Any, List, Dict, Tuple, Union, BinaryIO, Optional
 
 import os
 import json
 import shutil
 import datetime
 import requests
+from time import monotonic
 from ftplib import FTP, FTP_TLS, error_perm
 from json import JSONDecodeError
 
 from zanzocam.constants import *
+from zanzocam.webcam import telemetry, timings
 from zanzocam.webcam.utils import log, log_error, retry
 from zanzocam.webcam.configuration import Configuration
 from zanzocam.webcam.errors import ServerError
@@ -121,13 +123,20 @@ class FtpServer:
                             "uploading the logs: " + response)
 
 
-    def upload_picture(self, image_path: Path, image_name: str, image_extension: str) -> str:
+    def upload_picture(self, image: Union[Path, BinaryIO], image_name: str, image_extension: str,
+                       renditions: Optional[List[Tuple[str, str, BinaryIO]]] = None) -> Optional[Path]:
         """
-        Uploads the new picture to the server.
-        Returns the final image path (for cleanup operations)
+        Uploads the new picture to the server. The picture can be either
+        a path or an in-memory file-like object.
+        The renditions, as (name, extension, file-like object) tuples, are
+        uploaded on the same connection as '<image_name>_<name>', and numbered
+        like the picture.
+        Returns the final image path (for cleanup operations), or None
+        if the picture was in memory.
         """
-        if not os.path.isfile(image_path):
-            raise ServerError(f"No picture to upload at {image_path}")
+        in_memory = not isinstance(image, (str, os.PathLike))
+        if not in_memory and not os.path.isfile(image):
+            raise ServerError(f"No picture to upload at {image}")
         
         # Rename the picture according to max_photos
         modifier = ""
@@ -136,8 +145,10 @@ class FtpServer:
         elif self.max_photos > 1:
             modifier = "__0"
         final_image_name = image_name + modifier + "." + image_extension
-        final_image_path = Path(image_path).parent / final_image_name
-        os.rename(image_path, final_image_path)
+        final_image_path = None
+        if not in_memory:
+            final_image_path = Path(image).parent / final_image_name
+            os.rename(image, final_image_path)
 
         # If the server is supposed to contain only a fixed amount of pictures,
         # apply the prefix to this one and scale the other pictures' prefixes.
@@ -149,27 +160,48 @@ class FtpServer:
             # The second -1 is the step
             # This procedure will also overwrite the oldest picture
             log("Renaming pictures of the server...")
-            for position in range(self.max_photos-1, -1, -1):
-                
-                old_name = f"{image_name}__{position}.{image_extension}"
-                new_name = f"{image_name}__{position+1}.{image_extension}"
-                
-                try:
-                    self._ftp_client.rename(f"pictures/{old_name}", f"pictures/{new_name}")
-                except Exception as e:
-                    if '550' in str(e):
-                        log(f"Error: {str(e)}. Probably the image didn't exist. Ignoring.")
+            names = [(image_name, image_extension)] + [
+                (f"{image_name}_{name}", extension) for name, extension, _ in renditions or []]
+            for name, extension in names:
+                for position in range(self.max_photos-1, -1, -1):
+                    
+                    old_name = f"{name}__{position}.{extension}"
+                    new_name = f"{name}__{position+1}.{extension}"
+                    
+                    try:
+                        self._ftp_client.rename(f"pictures/{old_name}", f"pictures/{new_name}")
+                    except Exception as e:
+                        if '550' in str(e):
+                            log(f"Error: {str(e)}. Probably the image didn't exist. Ignoring.")
                         
         # Upload the picture
+        if in_memory:
+            image.seek(0)
+            picture = image
+        else:
+            picture = open(final_image_path ,"rb")
+        transfer_start = monotonic()
         response = self._ftp_client.storbinary(
-            f"STOR pictures/{final_image_name}", open(final_image_path ,"rb"))
+            f"STOR pictures/{final_image_name}", picture)
                 
         # Make sure the server did not reply with an error
         if not "226" in response:
             raise ServerError("The server replied with an error code while " +
                             "uploading the picture. The image was probably not sent! " +
                             "FTP Error: " + response)
-            
+
+        # Upload the renditions on the same connection
+        for name, extension, rendition in renditions or []:
+            rendition.seek(0)
+            response = self._ftp_client.storbinary(
+                f"STOR pictures/{image_name}_{name}{modifier}.{extension}", rendition)
+            if not "226" in response:
+                raise ServerError("The server replied with an error code while " +
+                                f"uploading the rendition '{name}'. " +
+                                "FTP Error: " + response)
+
+        transfer_time = telemetry.record("upload time", monotonic() - transfer_start)
+        timings.record_phase("transfer", transfer_start, transfer_time)
         return final_image_path
 
 
@@ -1,4 +1,4 @@
-from typing import Any, Dict
+from typing import Any, List, Dict, Tuple, Union, BinaryIO, Optional
 
 import os
 import json
@@ -6,8 +6,10 @@ import shutil
 import datetime
 import requests
 import traceback
+from time import monotonic
 
 from zanzocam.constants import *
+from zanzocam.webcam import telemetry, timings
 from zanzocam.webcam.errors import ServerError
 from zanzocam.webcam.utils import log, log_error, retry, AllStringEncoder
 
@@ -187,36 +189,57 @@ class HttpServer:
             raise err.with_traceback(e.__traceback__)
 
 
-    def upload_picture(self, image_path: Path, image_name: str, image_extension: str) -> None:
+    def upload_picture(self, image: Union[Path, BinaryIO], image_name: str, image_extension: str,
+                       renditions: Optional[List[Tuple[str, str, BinaryIO]]] = None) -> Optional[Path]:
         """
-        Uploads the new picture to the server.
+        Uploads the new picture to the server. The picture can be either
+        a path or an in-memory file-like object.
+        The renditions, as (name, extension, file-like object) tuples, are
+        sent in the same request, each in a 'photo_<name>' field.
+        Returns the final image path (for cleanup operations), or None
+        if the picture was in memory.
         """
-        if not os.path.isfile(image_path):
-            raise ServerError(f"No picture to upload at {image_path}")
+        in_memory = not isinstance(image, (str, os.PathLike))
+        if not in_memory and not os.path.isfile(image):
+            raise ServerError(f"No picture to upload at {image}")
 
         # Deal only with the date-time if max_photos = 0, otherwise rename and send.
         # The server will take care of numbering them if needed
         r = {}
-        try:
-            date_time = ""
-            if not self.max_photos:
-                date_time = datetime.datetime.now().strftime("_%Y-%m-%d_%H:%M:%S")
-            final_image_name = f"{image_name}{date_time}.{image_extension}"
-            final_image_path = Path(image_path).parent / final_image_name
-            os.rename(image_path, final_image_path)
+        date_time = ""
+        if not self.max_photos:
+            date_time = datetime.datetime.now().strftime("_%Y-%m-%d_%H:%M:%S")
+        final_image_name = f"{image_name}{date_time}.{image_extension}"
+        final_image_path = None
 
-        except Exception as e:
-            log_error("Something went wrong renaming the image. "\
-                      f"It's going to be sent under its temporary name: {image_path}", e)
-            final_image_path = image_path
+        if not in_memory:
+            try:
+                final_image_path = Path(image).parent / final_image_name
+                os.rename(image, final_image_path)
+
+            except Exception as e:
+                log_error("Something went wrong renaming the image. "\
+                          f"It's going to be sent under its temporary name: {image}", e)
+                final_image_path = image
+                final_image_name = Path(image).name
 
         # Upload the picture
         try:
-            files = {'photo': open(final_image_path, 'rb')}
+            if in_memory:
+                image.seek(0)
+                files = {'photo': (final_image_name, image)}
+            else:
+                files = {'photo': (final_image_name, open(final_image_path, 'rb'))}
+            for name, extension, rendition in renditions or []:
+                rendition.seek(0)
+                files[f'photo_{name}'] = (f"{image_name}_{name}{date_time}.{extension}", rendition)
+            transfer_start = monotonic()
             r = requests.post(self.url, 
                             files=files, 
                             auth=self.credentials,
                             timeout=REQUEST_TIMEOUT)
+            transfer_time = telemetry.record("upload time", monotonic() - transfer_start)
+            timings.record_phase("transfer", transfer_start, transfer_time)
 
             if r.status_code >= 400:
                 raise ServerError(
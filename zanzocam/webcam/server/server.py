@@ -1,4 +1,4 @@
-from typing import Any, List, Dict, Optional
+from typing import Any, List, Dict, Tuple, Union, BinaryIO, Optional
 
 import os
 import random
@@ -147,10 +147,18 @@ class Server:
 
 
     @retry(times=5, wait_for=15)
-    def upload_picture(self, image_path: Path, image_name: str,
-                       image_extension: str, cleanup: bool = True) -> None:
+    def upload_picture(self, image: Union[Path, BinaryIO], image_name: str,
+                       image_extension: str, cleanup: bool = True,
+                       renditions: Optional[List[Tuple[str, str, BinaryIO]]] = None) -> None:
         """
-        Uploads the new picture to the server.
+        Uploads the new picture to the server. The picture can be either
+        a path or an in-memory file-like object: in-memory pictures are
+        sent as they are, without being written to disk.
+
+        `renditions` are smaller versions of the picture, as (name, extension,
+        file-like object) tuples: they are sent along with the picture, in the
+        same request (HTTP) or on the same connection (FTP), and named
+        after the picture with the rendition name as a suffix.
         """
         # Wait a random time, if enabled
         if RANDOM_UPLOAD_INTERVAL > 0:
@@ -159,27 +167,39 @@ class Server:
             sleep(interval)
 
         log(f"Uploading picture to {self.get_endpoint()}")
-        if not image_name or not image_path or not image_extension:
+        if not image_name or not image or not image_extension:
             raise ValueError("Cannot upload the picture: "
                             f"picture name ({image_name}) "
-                            f"or location ({image_path}) "
+                            f"or location ({image}) "
                             f"or extension ({image_extension}) "
                             f"not given.")
 
+        extra_arguments = {}
+        if renditions:
+            extra_arguments["renditions"] = renditions
+            log(f"Uploading {len(renditions)} renditions with the picture: "
+                f"{', '.join(name for name, _, _ in renditions)}")
+
+        # In-memory pictures have nothing to check or clean up on disk
+        if not isinstance(image, (str, os.PathLike)):
+            self._server.upload_picture(image, image_name, image_extension, **extra_arguments)
+            log(f"Picture '{image_name}.{image_extension}' uploaded successfully.")
+            return
+
         # Make sure the file in question exists
-        if not os.path.exists(image_path):
+        if not os.path.exists(image):
             raise ValueError("No picture to upload: "
-                            f"{image_path} does not exist")
+                            f"{image} does not exist")
 
         # Upload the picture
         self.final_image_path = Path(
             self._server.upload_picture(
-                image_path, image_name, image_extension))
+                image, image_name, image_extension, **extra_arguments))
         log(f"Picture '{self.final_image_path.name}' uploaded successfully.")
 
         if cleanup:
-            if os.path.exists(image_path):
-                os.remove(image_path)
+            if os.path.exists(image):
+                os.remove(image)
             if os.path.exists(self.final_image_path):
                 os.remove(self.final_image_path)
             log("Pictures deleted successfully.")
@@ -0,0 +1,58 @@
+from typing import Optional
+
+import math
+from datetime import datetime, timezone
+
+from zanzocam.constants import *
+
+
+def solar_elevation(latitude: float, longitude: float, when: Optional[datetime] = None) -> float:
+    """
+    Returns the elevation of the sun above the horizon, in degrees,
+    as seen from the given coordinates at the given time (now by default).
+    Naive datetimes are taken as local time.
+
+    Uses the low precision formulas of the Astronomical Almanac, which are
+    accurate to about 0.01 degrees: plenty to tell day from night,
+    and no network access nor external libraries are needed.
+    """
+    when = (when or datetime.now()).astimezone(timezone.utc)
+
+    # Days since J2000.0
+    j2000 = datetime(2000, 1, 1, 12, tzinfo=timezone.utc)
+    days = (when - j2000).total_seconds() / (24 * 60 * 60)
+
+    # Ecliptic coordinates of the sun
+    mean_longitude = (280.460 + 0.9856474 * days) % 360
+    mean_anomaly = math.radians((357.528 + 0.9856003 * days) % 360)
+    ecliptic_longitude = math.radians(mean_longitude
+                                      + 1.915 * math.sin(mean_anomaly)
+                                      + 0.020 * math.sin(2 * mean_anomaly))
+    obliquity = math.radians(23.439 - 0.0000004 * days)
+
+    # Equatorial coordinates
+    right_ascension = math.atan2(math.cos(obliquity) * math.sin(ecliptic_longitude),
+                                 math.cos(ecliptic_longitude))
+    declination = math.asin(math.sin(obliquity) * math.sin(ecliptic_longitude))
+
+    # Local hour angle, from the Greenwich mean sidereal time
+    sidereal_time = (18.697374558 + 24.06570982441908 * days) % 24
+    hour_angle = math.radians(sidereal_time * 15 + longitude) - right_ascension
+
+    latitude = math.radians(latitude)
+    elevation = math.asin(math.sin(latitude) * math.sin(declination) +
+                          math.cos(latitude) * math.cos(declination) * math.cos(hour_angle))
+    return math.degrees(elevation)
+
+
+def predict_exposure_regime(elevation: float) -> str:
+    """
+    Given the elevation of the sun, returns the exposure regime expected:
+    'day' (automatic exposure is enough), 'night' (a long exposure is
+    surely needed) or 'twilight' (the luminance must be measured).
+    """
+    if elevation >= DAYLIGHT_SUN_ELEVATION:
+        return "day"
+    if elevation <= NIGHT_SUN_ELEVATION:
+        return "night"
+    return "twilight"
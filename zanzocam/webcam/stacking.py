@@ -0,0 +1,112 @@
+from typing import Any
+
+import numpy as np
+from PIL import Image
+
+from zanzocam.constants import *
+from zanzocam.webcam.metering import linear_light, gamma_encode, luminance_from_means
+
+
+#: Max value of a frame in the accumulator: the frames are converted to
+#:  12 bits linear light, so up to 16 of them fit in 16 bits without overflowing
+STACKING_LINEAR_MAX = 4095
+
+#: Lookup table from the levels of a frame (gamma encoded) to linear light
+_TO_LINEAR = np.round(np.array([linear_light(level) for level in range(256)])
+                      * STACKING_LINEAR_MAX).astype(np.uint16)
+
+
+class FrameStack:
+    """
+    Sums pictures of the same scene in linear light, one at a time,
+    so that only the accumulator (16 bits per channel) and the frame
+    being added are in memory at any time.
+
+    The frames are processed in bands of STACKING_BAND_HEIGHT rows,
+    so that the temporary arrays stay small too. Black frames are
+    skipped (see add()): `frames` counts only the ones in the stack.
+    """
+    def __init__(self):
+        self.accumulator = None
+        self.frames = 0
+        self.skipped = 0
+        self.exif = None
+
+
+    def add(self, picture: Any) -> bool:
+        """
+        Adds a picture (a path or a file-like object) to the stack.
+        Returns False if the picture was skipped because it's black
+        (luminance up to NIGHT_STACKING_BLACK_FRAME_LUMINANCE).
+        """
+        if self.frames >= NIGHT_STACKING_MAX_FRAMES:
+            raise ValueError(f"Can't stack more than {NIGHT_STACKING_MAX_FRAMES} frames.")
+
+        frame = Image.open(picture)
+        if frame.mode != "RGB":
+            frame = frame.convert("RGB")
+        pixels = np.asarray(frame)
+        exif = frame.info.get("exif")
+        del frame
+
+        if hasattr(picture, "seek"):
+            picture.seek(0)
+
+        if luminance_from_means(*pixels.mean(axis=(0, 1))) <= NIGHT_STACKING_BLACK_FRAME_LUMINANCE:
+            self.skipped += 1
+            return False
+        self.exif = exif or self.exif
+
+        if self.accumulator is None:
+            self.accumulator = np.zeros(pixels.shape, dtype=np.uint16)
+        elif self.accumulator.shape != pixels.shape:
+            raise ValueError(f"The frame size {pixels.shape} doesn't match "
+                             f"the stack size {self.accumulator.shape}.")
+
+        for top in range(0, pixels.shape[0], STACKING_BAND_HEIGHT):
+            band = slice(top, top + STACKING_BAND_HEIGHT)
+            self.accumulator[band] += _TO_LINEAR[pixels[band]]
+        self.frames += 1
+        return True
+
+
+    def image(self, gain: float = 1.0) -> Image.Image:
+        """
+        Returns the sum of the frames, multiplied by `gain`,
+        gamma encoded back into an 8 bit RGB image.
+        """
+        if not self.frames:
+            raise ValueError("No frames in the stack.")
+
+        result = np.empty(self.accumulator.shape, dtype=np.uint8)
+        scale = gain / STACKING_LINEAR_MAX
+        for top in range(0, result.shape[0], STACKING_BAND_HEIGHT):
+            band = slice(top, top + STACKING_BAND_HEIGHT)
+            result[band] = np.round(gamma_encode(self.accumulator[band] * scale))
+        return Image.fromarray(result, "RGB")
+
+
+def estimate_noise(image: Image.Image, crop_size: int = 512) -> float:
+    """
+    Estimates the noise of a picture (in 0-255 levels) on a crop of its
+    center, as the robust standard deviation (from the median absolute
+    deviation) of the difference between each pixel and the mean of its
+    8 neighbours. Edges in the scene add to it, so use it only to compare
+    pictures of the same scene.
+
+    Everything is computed in floating point: rounding the gray levels or
+    the mean of the neighbours to 8 bits would hide any noise smaller than
+    one level, which is what stacking achieves.
+    """
+    left = max((image.width - crop_size) // 2, 0)
+    top = max((image.height - crop_size) // 2, 0)
+    crop = image.convert("RGB").crop((left, top, min(left + crop_size, image.width),
+                                      min(top + crop_size, image.height)))
+    gray = np.asarray(crop, dtype=np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    height, width = gray.shape
+    neighbours = sum(gray[1 + y:height - 1 + y, 1 + x:width - 1 + x]
+                     for y in (-1, 0, 1) for x in (-1, 0, 1) if x or y) / 8
+    residual = gray[1:-1, 1:-1] - neighbours
+    # With independent noise, the residual has 1 + 1/8 times its variance
+    return float(1.4826 * np.median(np.abs(residual - np.median(residual))) / np.sqrt(9 / 8))
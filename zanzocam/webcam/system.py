@@ -13,6 +13,7 @@ from pathlib import Path
 from textwrap import dedent
 
 from zanzocam.constants import *
+from zanzocam.webcam import telemetry
 from zanzocam.webcam.utils import log, log_error
 
 
@@ -76,12 +77,14 @@ def report_general_status() -> Dict:
             else: 
                 status["hotspot status"] = "ON (no known WiFi in range)"
 
-    status['wifi data'] = get_wifi_data()
+    # Kept for the overlays, that can show some of these values (see zanzocam.webcam.templates)
+    status['wifi data'] = telemetry.record("wifi data", get_wifi_data())
     status['internet access'] = check_internet_connectivity()
 
     status['disk size'] = get_filesystem_size()
-    status['free disk space'] = get_free_space_on_disk()
+    status['free disk space'] = telemetry.record("free disk space", get_free_space_on_disk())
     status['RAM'] = get_ram_stats()
+    status['CPU temperature'] = telemetry.record("CPU temperature", get_cpu_temperature())
     
     return status
 
@@ -319,6 +322,41 @@ def get_ram_stats() -> Optional[Dict[str, str]]:
 
 
 
+def get_cpu_temperature() -> Optional[float]:
+    """
+    Returns the temperature of the CPU in °C, as reported by the kernel.
+    Returns None if an error occurs.
+    """
+    try:
+        with open(CPU_TEMPERATURE_PATH, 'r') as temperature:
+            return int(temperature.read().strip()) / 1000
+
+    except Exception as e:
+        log_error("Could not read the CPU temperature", e)
+    return None
+
+
+
+def get_bytes_written() -> Optional[int]:
+    """
+    Returns the number of bytes this process caused to be written 
+    to the storage so far, as reported by the kernel.
+    Returns None if an error occurs.
+    """
+    try:
+        with open("/proc/self/io", 'r') as io_stats:
+            for line in io_stats.readlines():
+                if line.startswith("write_bytes:"):
+                    return int(line.replace("write_bytes:", "").strip())
+
+        raise ValueError("No 'write_bytes' entry found in /proc/self/io")
+
+    except Exception as e:
+        log_error("Could not get the amount of bytes written on disk", e)
+    return None
+
+
+
 def convert_bytes_into_string(bytes: int) -> str:
     """
     Convert an integer of bytes into a human readable string.
@@ -408,11 +446,11 @@ def apply_system_settings(settings: Dict) -> bool:
     Modifies the system according to the new configuration.
     """
     if 'time' in settings.keys():
-        return apply_time_settings(settings.get("time", {}))
+        return apply_time_settings(settings.get("time", {}), settings.get("timelapse"))
 
 
 
-def apply_time_settings(time_settings: Dict) -> bool:
+def apply_time_settings(time_settings: Dict, timelapse_settings: Optional[Dict] = None) -> bool:
     """
     Updates the time settings (i.e. the crontab)
     Returns True in case of errors.
@@ -420,9 +458,9 @@ def apply_time_settings(time_settings: Dict) -> bool:
     try:
         if not os.path.isfile(CRONJOB_FILE):
             log("The crontab file did not exist. Creating it.")
-            return update_crontab(time_settings, backup=False)
+            return update_crontab(time_settings, backup=False, timelapse=timelapse_settings)
 
-        return update_crontab(time_settings)
+        return update_crontab(time_settings, timelapse=timelapse_settings)
 
     except Exception as e:
         log_error("Could not update the crontab. The wake-up frequency "
@@ -438,11 +476,12 @@ def apply_time_settings(time_settings: Dict) -> bool:
 
 
     
-def update_crontab(time: Dict, backup: bool = True) -> bool:
+def update_crontab(time: Dict, backup: bool = True, timelapse: Optional[Dict] = None) -> bool:
     """ 
     Updates the crontab and tries to recover for potential issues.
     Might refuse to update it in case of misconfigurations, in which case it
     will restore the old one and log the exceptions.
+    If the timelapse is enabled, z-timelapse is scheduled as well.
     """
     no_errors = True
 
@@ -473,6 +512,11 @@ def update_crontab(time: Dict, backup: bool = True) -> bool:
             d.writelines("# ZANZOCAM - shoot picture\n")
             for line in cron_strings:
                 d.writelines(f"{line} {SYSTEM_USER} {sys.argv[0]}\n")
+            if timelapse and timelapse.get("enabled"):
+                # z-timelapse is installed next to z-webcam
+                d.writelines("# ZANZOCAM - assemble the timelapse\n")
+                d.writelines(f"{TIMELAPSE_CRON} {SYSTEM_USER} "
+                             f"{Path(sys.argv[0]).parent / 'z-timelapse'}\n")
 
     except Exception as e:
         log_error("Failed to generate the new crontab. "
@@ -0,0 +1,46 @@
+from typing import Any, Callable
+
+import threading
+
+
+#: Values measured in the current run, by name
+_values = {}
+_values_lock = threading.RLock()
+
+
+def start_run() -> None:
+    """
+    Forgets the values measured so far, for a new run.
+    """
+    with _values_lock:
+        _values.clear()
+
+
+def record(name: str, value: Any) -> Any:
+    """
+    Keeps a value measured in the current run, and returns it.
+    None is kept too: it means that the value could not be measured.
+    """
+    with _values_lock:
+        _values[name] = value
+    return value
+
+
+def get(name: str) -> Any:
+    """
+    The value measured in the current run, or None if it was not.
+    """
+    with _values_lock:
+        return _values.get(name)
+
+
+def collect(name: str, measure: Callable[[], Any]) -> Any:
+    """
+    The value measured in the current run, or, if it was not measured
+    yet, the result of `measure()`, which is then kept for the rest of
+    the run: the measure is done at most once per run.
+    """
+    with _values_lock:
+        if name not in _values:
+            _values[name] = measure()
+        return _values[name]
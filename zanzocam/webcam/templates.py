@@ -0,0 +1,137 @@
+from typing import Callable, Dict, List, Optional
+
+import re
+import datetime
+
+from zanzocam.constants import *
+from zanzocam.webcam import system, telemetry, timings
+
+
+def _luminance() -> Optional[str]:
+    luminance = telemetry.get("luminance")
+    return None if luminance is None else f"{luminance:.0f}"
+
+
+def _shutter_speed() -> Optional[str]:
+    exposure = telemetry.get("exposure")
+    if not exposure:
+        return None
+    seconds = exposure[0] / 10**6
+    if seconds >= 1:
+        return f"{seconds:.1f}s"
+    return f"1/{round(1 / seconds)}s"
+
+
+def _iso() -> Optional[str]:
+    exposure = telemetry.get("exposure")
+    return str(exposure[1]) if exposure else None
+
+
+def _cpu_temperature() -> Optional[str]:
+    temperature = telemetry.collect("CPU temperature", system.get_cpu_temperature)
+    return None if temperature is None else f"{temperature:.0f}°C"
+
+
+def _free_disk_space() -> Optional[str]:
+    return telemetry.collect("free disk space", system.get_free_space_on_disk)
+
+
+def _wifi_signal() -> Optional[str]:
+    wifi_data = telemetry.collect("wifi data", system.get_wifi_data)
+    if not wifi_data or wifi_data.get("signal level", "n/a") == "n/a":
+        return None
+    return wifi_data["signal level"]
+
+
+def _previous_upload_seconds() -> Optional[float]:
+    record = timings.load_run_record(RUN_RECORD)
+    try:
+        transfer = record["totals"]["transfer"]
+        return transfer["seconds"] / transfer["count"]
+    except (KeyError, TypeError, ZeroDivisionError):
+        return None
+
+
+def _upload_time() -> Optional[str]:
+    # The time the servers took to transfer the picture, in this run if it
+    # was uploaded already, otherwise in the previous one
+    seconds = telemetry.get("upload time")
+    if seconds is None:
+        seconds = telemetry.collect("previous upload time", _previous_upload_seconds)
+    return None if seconds is None else f"{seconds:.1f}s"
+
+
+#: The placeholders that can be used in the text overlays, besides
+#:  %%TIME and %%DATE, with the function returning their value (None
+#:  if it's not available). The values are measured during the run
+#:  (see zanzocam.webcam.telemetry) and are reused if they were already.
+PLACEHOLDERS: Dict[str, Callable[[], Optional[str]]] = {
+    "LUMINANCE": _luminance,
+    "SHUTTER": _shutter_speed,
+    "ISO": _iso,
+    "CPU_TEMPERATURE": _cpu_temperature,
+    "FREE_DISK": _free_disk_space,
+    "WIFI_SIGNAL": _wifi_signal,
+    "UPLOAD_TIME": _upload_time,
+}
+
+# The longest names first, so that none is taken for the beginning of another
+_PLACEHOLDER_PATTERN = re.compile("%%(" + "|".join(
+    sorted(["TIME", "DATE", *PLACEHOLDERS], key=len, reverse=True)) + ")")
+
+#: The templates compiled by this process, by text
+_templates = {}
+
+
+class Template:
+    """
+    A text with placeholders, like "Last picture: %%TIME", split once
+    into its literal parts and its placeholders: rendering it only
+    measures the values of the placeholders it contains and joins them
+    with the literal parts.
+
+    Unknown placeholders are left in the text as they are. The values
+    that can't be measured are rendered as TEMPLATE_MISSING_VALUE.
+    """
+    def __init__(self, text: str):
+        self.text = text
+        # The literal parts are at the even indexes, the placeholder names at the odd ones
+        self.parts = _PLACEHOLDER_PATTERN.split(text)
+        self.placeholders = set(self.parts[1::2])
+
+
+    def render(self, date_format: str = "%d %B %Y", time_format: str = "%H:%M") -> str:
+        """
+        The text with the current value of each placeholder.
+        """
+        if not self.placeholders:
+            return self.text
+
+        now = datetime.datetime.now()
+        values = {"TIME": lambda: now.strftime(time_format),
+                  "DATE": lambda: now.strftime(date_format)}
+        rendered = {}
+        for name in self.placeholders:
+            value = (values.get(name) or PLACEHOLDERS[name])()
+            rendered[name] = TEMPLATE_MISSING_VALUE if value is None else value
+
+        parts = list(self.parts)
+        parts[1::2] = [rendered[name] for name in parts[1::2]]
+        return "".join(parts)
+
+
+
+def compile_template(text: str) -> Template:
+    """
+    The template of this text, compiled only once per process.
+    """
+    if text not in _templates:
+        _templates[text] = Template(text)
+    return _templates[text]
+
+
+def uses_placeholder(texts: List[str], name: str) -> bool:
+    """
+    Whether any of these texts contains the given placeholder.
+    """
+    return any(name in compile_template(text).placeholders for text in texts)
@@ -0,0 +1,413 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import os
+import sys
+import math
+import shutil
+import struct
+import logging
+import argparse
+import datetime
+from io import BytesIO
+from array import array
+from pathlib import Path
+
+from PIL import Image
+
+from zanzocam.constants import *
+from zanzocam.webcam.utils import log, log_error, log_row
+from zanzocam.webcam.configuration import load_configuration_from_disk
+from zanzocam.webcam.server import Server
+
+
+#: AVI flags: the file has an index, and each frame is a keyframe
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+
+
+def add_frame_rendition(camera: Any, settings: Dict[str, Any]) -> bool:
+    """
+    Makes the camera create the frame of the timelapse along with the
+    picture, as a JPEG rendition (TIMELAPSE_RENDITION) scaled down to the
+    `width` of the timelapse settings: archiving the full picture every
+    run would write a lot on the SD card.
+
+    Nothing is added if the rendition is configured already, or if the
+    width is 0 (the full picture is archived then). Returns whether the
+    rendition was added, so that it's not uploaded.
+    """
+    if any(rendition.get("name") == TIMELAPSE_RENDITION for rendition in camera.renditions or []):
+        return False
+    try:
+        width = int(settings.get("width") or 0)
+    except (TypeError, ValueError):
+        log(f"WARNING! The width of the timelapse must be a number, not '{settings.get('width')}'. "
+            f"Using {TIMELAPSE_DEFAULTS['width']}.")
+        width = TIMELAPSE_DEFAULTS["width"]
+    if width <= 0:
+        return False
+
+    camera.renditions = list(camera.renditions or []) + [{
+        "name": TIMELAPSE_RENDITION,
+        "width": width,
+        "quality": settings.get("quality", TIMELAPSE_DEFAULTS["quality"]),
+        "format": "jpg",
+    }]
+    return True
+
+
+def archive_frame(camera: Any, archive: Path = TIMELAPSE_ARCHIVE,
+                  when: Optional[datetime.datetime] = None) -> Optional[Path]:
+    """
+    Stores the processed picture of the camera in the timelapse archive,
+    in the folder of the day. If the camera has a rendition called
+    TIMELAPSE_RENDITION (see add_frame_rendition), that is stored
+    instead of the full picture.
+
+    Returns the path of the frame, or None if it could not be stored.
+    """
+    try:
+        picture, extension = camera.processed_image, camera.extension
+        for name, rendition_extension, rendition in camera.processed_renditions:
+            if name == TIMELAPSE_RENDITION:
+                picture, extension = rendition, rendition_extension
+        if not picture:
+            return None
+
+        when = when or datetime.datetime.now()
+        folder = Path(archive) / when.strftime(TIMELAPSE_DAY_FORMAT)
+        os.makedirs(folder, exist_ok=True)
+        path = folder / f"{when.strftime(TIMELAPSE_FRAME_FORMAT)}.{extension}"
+        with open(path, "wb") as frame:
+            frame.write(picture.getvalue())
+        return path
+
+    except Exception as e:
+        log_error("Could not store the picture for the timelapse. "
+                  "It will be missing from it.", e)
+        return None
+
+
+def day_frames(day: datetime.date, archive: Path = TIMELAPSE_ARCHIVE) -> List[Path]:
+    """
+    The frames stored for the given day, in chronological order.
+    """
+    folder = Path(archive) / day.strftime(TIMELAPSE_DAY_FORMAT)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(folder.iterdir())
+
+
+def prune_archive(keep_days: int, archive: Path = TIMELAPSE_ARCHIVE,
+                  today: Optional[datetime.date] = None) -> None:
+    """
+    Deletes the folders of the days older than `keep_days`.
+    """
+    if not os.path.isdir(archive):
+        return
+    oldest = (today or datetime.date.today()) - datetime.timedelta(days=keep_days)
+    for folder in Path(archive).iterdir():
+        try:
+            day = datetime.datetime.strptime(folder.name, TIMELAPSE_DAY_FORMAT).date()
+        except ValueError:
+            continue
+        if day < oldest:
+            log(f"Deleting the timelapse frames of {folder.name}: they are too old.")
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+def _load_frame(path: Path, size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    """
+    Decodes a frame as RGB, at the given size. JPEG frames are decoded
+    in draft mode if they are much larger than that.
+    """
+    frame = Image.open(path)
+    if size:
+        frame.draft("RGB", size)
+    frame = frame.convert("RGB")
+    if size and frame.size != size:
+        frame = frame.resize(size, Image.BILINEAR)
+    return frame
+
+
+def _jpeg_frame(path: Path, size: Tuple[int, int], quality: int) -> bytes:
+    """
+    The frame as JPEG data of the given size. JPEG frames of the right size
+    are read as they are, without decoding them.
+    """
+    with Image.open(path) as frame:
+        if frame.format == "JPEG" and frame.size == size:
+            with open(path, "rb") as frame_file:
+                return frame_file.read()
+    picture = BytesIO()
+    _load_frame(path, size).save(picture, format="JPEG", quality=quality)
+    return picture.getvalue()
+
+
+
+class MjpegAviWriter:
+    """
+    Writes an MJPEG video in an AVI container, one JPEG frame at a time:
+    the frames are written to disk as they come, and only their offsets
+    and sizes are kept in memory for the index, written at the end.
+
+        with MjpegAviWriter(path, width, height, fps) as video:
+            for frame in frames:
+                video.add_frame(jpeg_bytes)
+
+    The file never grows past `max_size` (at most 4 GB, the largest
+    size the headers can hold): frames that would not fit are refused.
+    """
+    def __init__(self, path: Path, width: int, height: int, fps: int,
+                 max_size: int = TIMELAPSE_AVI_MAX_SIZE):
+        if max_size > 0xFFFFFFFF:
+            raise ValueError("AVI files can't be larger than 4 GB.")
+        self.path = Path(path)
+        self.max_size = max_size
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames = 0
+        self.max_frame_size = 0
+        self._index = array("I")  # offset and size of each frame
+        self._file = open(self.path, "wb")
+        self._file.write(self._headers())
+        self._movi_start = self._file.tell() - 4  # offsets are relative to the 'movi' tag
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+    @staticmethod
+    def _chunk(fourcc: bytes, data: bytes) -> bytes:
+        padding = b"\0" if len(data) % 2 else b""
+        return fourcc + struct.pack("<I", len(data)) + data + padding
+
+
+    def _headers(self, movi_size: int = 4, riff_size: int = 0) -> bytes:
+        """
+        The RIFF header and the 'hdrl' list, up to the 'movi' tag.
+        Their size does not depend on the number of frames, so they can
+        be written first and overwritten on close, with the final values.
+        """
+        avih = struct.pack("<14I",
+            10**6 // self.fps,                   # microseconds per frame
+            self.max_frame_size * self.fps,      # max bytes per second
+            0, AVIF_HASINDEX, self.frames, 0, 1,
+            self.max_frame_size,                 # suggested buffer size
+            self.width, self.height, 0, 0, 0, 0)
+        strh = struct.pack("<4s4sIHHIIIIIIIIhhhh",
+            b"vids", b"MJPG", 0, 0, 0, 0,
+            1, self.fps,                         # scale and rate: fps = rate / scale
+            0, self.frames, self.max_frame_size,
+            0xFFFFFFFF,                          # default quality
+            0, 0, 0, self.width, self.height)
+        strf = struct.pack("<IiiHH4sIiiII",
+            40, self.width, self.height, 1, 24, b"MJPG",
+            self.width * self.height * 3, 0, 0, 0, 0)
+        strl = self._chunk(b"LIST", b"strl" + self._chunk(b"strh", strh) + self._chunk(b"strf", strf))
+        hdrl = self._chunk(b"LIST", b"hdrl" + self._chunk(b"avih", avih) + strl)
+        return (b"RIFF" + struct.pack("<I", riff_size) + b"AVI " + hdrl +
+                b"LIST" + struct.pack("<I", movi_size) + b"movi")
+
+
+    def add_frame(self, jpeg: bytes) -> bool:
+        """
+        Appends a JPEG frame to the video. Returns False, without adding
+        it, if with this frame and its index entry the file would be
+        larger than `max_size`.
+        """
+        chunk = self._chunk(b"00dc", jpeg)
+        final_size = self._file.tell() + len(chunk) + 8 + 16 * (self.frames + 1)
+        if final_size > self.max_size:
+            return False
+        self._index.extend([self._file.tell() - self._movi_start, len(jpeg)])
+        self._file.write(chunk)
+        self.frames += 1
+        self.max_frame_size = max(self.max_frame_size, len(jpeg))
+        return True
+
+
+    def close(self) -> None:
+        """
+        Writes the index, completes the headers and closes the file.
+        """
+        if self._file.closed:
+            return
+        movi_size = self._file.tell() - self._movi_start
+        self._file.write(b"idx1" + struct.pack("<I", 16 * self.frames))
+        for frame in range(self.frames):
+            offset, size = self._index[2 * frame], self._index[2 * frame + 1]
+            self._file.write(struct.pack("<4sIII", b"00dc", AVIIF_KEYFRAME, offset, size))
+        riff_size = self._file.tell() - 8
+        self._file.seek(0)
+        self._file.write(self._headers(movi_size, riff_size))
+        self._file.close()
+
+
+
+def assemble_timelapse(frames: List[Path], output: Path, format: str = "avi",
+                       fps: int = TIMELAPSE_DEFAULTS["fps"],
+                       quality: int = TIMELAPSE_DEFAULTS["quality"]) -> Path:
+    """
+    Assembles the frames into a video: MJPEG in an AVI container ('avi')
+    or an animated WebP ('webp'). The size of the video is the one of
+    the first frame: the other frames are scaled to it if needed.
+    Returns the path of the video.
+
+    For the AVI the frames are read one at a time, so the memory used
+    doesn't grow with their number. The WebP instead needs them all
+    decoded in memory: with more than TIMELAPSE_WEBP_MAX_FRAMES frames
+    an AVI is assembled instead, next to `output`.
+
+    An AVI can't be larger than TIMELAPSE_AVI_MAX_SIZE: if the frames
+    are larger than that on disk, one every few is used, so that the
+    video still covers the whole day.
+    """
+    if not frames:
+        raise ValueError("No frames to assemble.")
+    output = Path(output)
+    with Image.open(frames[0]) as first:
+        size = first.size
+
+    if format == "webp" and len(frames) > TIMELAPSE_WEBP_MAX_FRAMES:
+        log(f"WARNING! An animated WebP can't have more than {TIMELAPSE_WEBP_MAX_FRAMES} "
+            f"frames ({len(frames)} to assemble): assembling an AVI instead.")
+        format = "avi"
+        output = output.with_suffix(".avi")
+
+    if format == "avi":
+        frames_size = sum(os.path.getsize(frame) for frame in frames)
+        step = math.ceil(frames_size / TIMELAPSE_AVI_MAX_SIZE)
+        if step > 1:
+            log(f"WARNING! The frames ({frames_size // 2**20} MB) are more than the AVI "
+                f"can hold ({TIMELAPSE_AVI_MAX_SIZE // 2**20} MB): using one frame every {step}.")
+            frames = frames[::step]
+
+        with MjpegAviWriter(output, size[0], size[1], fps, max_size=TIMELAPSE_AVI_MAX_SIZE) as video:
+            for position, frame in enumerate(frames):
+                try:
+                    if not video.add_frame(_jpeg_frame(frame, size, quality)):
+                        log(f"WARNING! The timelapse reached the largest size of an AVI "
+                            f"({TIMELAPSE_AVI_MAX_SIZE // 2**20} MB): the last "
+                            f"{len(frames) - position} frames are left out.")
+                        break
+                except Exception as e:
+                    log_error(f"Could not add the frame {frame.name} to the timelapse. Skipping it.", e)
+
+    elif format == "webp":
+        _load_frame(frames[0]).save(output, format="WEBP", save_all=True,
+                                    append_images=[_load_frame(frame, size) for frame in frames[1:]],
+                                    duration=1000 // fps, quality=quality)
+    else:
+        raise ValueError(f"Timelapse format not supported: {format}. Use 'avi' or 'webp'.")
+
+    return output
+
+
+
+def _day_to_assemble(config) -> Optional[datetime.date]:
+    """
+    Which day to assemble, depending on the active hours: today, if they
+    are over, yesterday, if they did not start yet. If the camera is
+    always active, the timelapse of yesterday is assembled.
+    Returns None during the active hours.
+    """
+    now = datetime.datetime.now()
+    start = config.get_start_time()
+    stop = config.get_stop_time()
+    today = now.date()
+    yesterday = today - datetime.timedelta(days=1)
+
+    if start == "00:00" and stop == "23:59":
+        return yesterday
+
+    if config.within_active_hours() is not False:
+        return None
+    if now.time() < datetime.datetime.strptime(start, "%H:%M").time():
+        return yesterday
+    return today
+
+
+def main(arguments: Optional[List[str]] = None):
+    """
+    Assembles the timelapse of a day from the frames in the archive,
+    uploads it and deletes the frames. Runs with a low priority.
+    """
+    parser = argparse.ArgumentParser(description="Assembles and uploads the daily timelapse.")
+    parser.add_argument("day", nargs="?", help="Day to assemble (YYYY-MM-DD). "
+                        "By default, the last day whose active hours are over.")
+    arguments = parser.parse_args(arguments)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(message)s',
+        handlers=[
+            logging.FileHandler(TIMELAPSE_LOG),
+            logging.StreamHandler(sys.stdout),
+        ]
+    )
+    log_row()
+    log("Starting the timelapse assembly...")
+
+    try:
+        os.nice(TIMELAPSE_NICENESS)
+    except Exception as e:
+        log_error("Could not lower the priority of the process. Continuing.", e)
+
+    config = load_configuration_from_disk()
+    if not config:
+        log_error("", fatal="cannot proceed without any data. Exiting.")
+        return
+
+    settings = config.get_timelapse_settings()
+    prune_archive(settings["keep_days"])
+
+    if arguments.day:
+        day = datetime.datetime.strptime(arguments.day, TIMELAPSE_DAY_FORMAT).date()
+    else:
+        day = _day_to_assemble(config)
+        if not day:
+            log("Within the active hours: the timelapse will be assembled later.")
+            return
+
+    frames = day_frames(day)
+    if not frames:
+        log(f"No frames to assemble for {day.strftime(TIMELAPSE_DAY_FORMAT)}.")
+        return
+
+    try:
+        # Remove what's left of failed uploads
+        shutil.rmtree(TIMELAPSE_PATH, ignore_errors=True)
+        os.makedirs(TIMELAPSE_PATH, exist_ok=True)
+
+        name = config.get_camera_settings()["image"].get("name", CAMERA_DEFAULTS["name"])
+        video_name = f"{name}_timelapse_{day.strftime(TIMELAPSE_DAY_FORMAT)}"
+        extension = settings["format"]
+
+        log(f"Assembling {len(frames)} frames into {video_name}.{extension}...")
+        start = datetime.datetime.now()
+        video = assemble_timelapse(frames, TIMELAPSE_PATH / f"{video_name}.{extension}",
+                                   extension, settings["fps"], settings["quality"])
+        log(f"Timelapse assembled in {datetime.datetime.now() - start}: "
+            f"{os.path.getsize(video) // 1024} KB.")
+
+        server = Server(config.get_server_settings())
+        server.upload_picture(video, video_name, video.suffix[1:])
+
+        shutil.rmtree(frames[0].parent, ignore_errors=True)
+        log("Timelapse uploaded, its frames have been deleted.")
+
+    except Exception as e:
+        log_error("Something went wrong assembling or uploading the timelapse. "
+                  "The frames are kept: it will be tried again on the next run.", e)
+    finally:
+        log_row()
+
+
+if "__main__" == __name__:
+    main()
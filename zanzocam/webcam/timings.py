@@ -0,0 +1,126 @@
+from typing import Any, Dict, Optional
+
+import json
+import datetime
+from time import monotonic
+from pathlib import Path
+from contextlib import ContextDecorator
+
+from zanzocam.constants import *
+from zanzocam.webcam.utils import log, log_error
+
+
+#: Phases timed in the current run, as (phase, start, duration) tuples,
+#:  with the start in seconds since the beginning of the run
+_phases = []
+
+#: Beginning of the current run: (wall clock time, monotonic time)
+_run_start = (datetime.datetime.now(), monotonic())
+
+
+def start_run() -> None:
+    """
+    Forgets the phases timed so far, and starts timing a new run.
+    """
+    global _run_start
+    _phases.clear()
+    _run_start = (datetime.datetime.now(), monotonic())
+
+
+def record_phase(phase: str, start: float, duration: float) -> None:
+    """
+    Adds a phase to the current run. `start` is a monotonic() reading.
+    """
+    _phases.append((phase, start - _run_start[1], duration))
+
+
+class timed(ContextDecorator):
+    """
+    Times a phase of the run with a monotonic clock. Use it either as
+    a context manager or as a decorator:
+
+        with timed("upload"):
+            ...
+
+        @timed("capture")
+        def capture(...):
+            ...
+
+    Phases that raise are recorded too.
+    """
+    def __init__(self, phase: str):
+        self.phase = phase
+        self._starts = []
+
+    def __enter__(self):
+        self._starts.append(monotonic())
+        return self
+
+    def __exit__(self, *exc):
+        start = self._starts.pop()
+        record_phase(self.phase, start, monotonic() - start)
+        return False
+
+
+def run_record(successful: Optional[bool] = None) -> Dict[str, Any]:
+    """
+    The record of the current run: when it started, how long it lasted,
+    each phase in order and the total time spent in each kind of phase.
+    """
+    totals = {}
+    for phase, _, duration in _phases:
+        count, seconds = totals.get(phase, (0, 0))
+        totals[phase] = (count + 1, seconds + duration)
+
+    return {
+        "version": VERSION,
+        "started": _run_start[0].strftime("%Y-%m-%d %H:%M:%S"),
+        "seconds": round(monotonic() - _run_start[1], 3),
+        "successful": successful,
+        "phases": [
+            {"phase": phase, "start": round(start, 3), "seconds": round(duration, 3)}
+                for phase, start, duration in _phases
+        ],
+        "totals": {
+            phase: {"count": count, "seconds": round(seconds, 3)}
+                for phase, (count, seconds) in totals.items()
+        },
+    }
+
+
+def save_run_record(path: Path = RUN_RECORD, successful: Optional[bool] = None) -> Optional[Dict[str, Any]]:
+    """
+    Writes the record of the current run to `path` as JSON and logs it on
+    a single line, so that it's uploaded along with the logs.
+    Returns the record, or None if it could not be saved.
+    """
+    try:
+        record = run_record(successful)
+        slowest = sorted(record["totals"].items(), key=lambda item: -item[1]["seconds"])[:3]
+        if slowest:
+            log("Slowest phases: " + ", ".join(
+                f"{phase} {totals['seconds']:.2f}s" for phase, totals in slowest))
+        log(f"Run record: {json.dumps(record)}")
+
+        with open(path, "w") as record_file:
+            json.dump(record, record_file, indent=4)
+        return record
+
+    except Exception as e:
+        log_error("Could not save the run record.", e)
+        return None
+
+
+def load_run_record(path: Path = RUN_RECORD) -> Optional[Dict[str, Any]]:
+    """
+    Reads the record saved by save_run_record (during a run, the one of
+    the previous run). Returns None if there is none or it can't be read.
+    """
+    try:
+        with open(path, "r") as record_file:
+            return json.load(record_file)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log_error("Could not read the run record.", e)
+        return None